@@ -1,6 +1,7 @@
 import os
 import base64
 import warnings
+import threading
 import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
@@ -9,6 +10,8 @@ from typing import Tuple, Optional
 from datetime import datetime, timedelta, timezone
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.serialization import pkcs12
+from utils.metricas import medir, TOKEN_RENOVACOES
+from utils.rastreamento import span, definir_atributo
 
 load_dotenv()
 
@@ -79,21 +82,35 @@ class TokenAutenticacao:
 
         original = os.path.join(self.caminho_certificado, self.nome_certificado)
         self.certificado_pfx = ensure_der_pfx(original, self.senha_certificado)
+        # uma renovação por vez: as demais threads esperam e usam o token novo
+        self._lock = threading.Lock()
+
+    def _em_cache(self) -> bool:
+        return bool(self.token_cache["access_token"] and self.token_cache["jwt_token"] and not self._expirou())
 
     def _expirou(self) -> bool:
         """True se não existe token ou já passou do horário de expiração."""
         exp = self.token_cache["expires_at"]
         return exp is None or datetime.now(timezone.utc) >= exp
 
+    @span("serpro.obter_token")
     def obter_token(self) -> Tuple[str, str]:
         """
         Retorna (access_token, jwt_token). Se o cache estiver válido,
         devolve direto; senão, renova com o endpoint /token.
         """
 
-        if self.token_cache["access_token"] and self.token_cache["jwt_token"] and not self._expirou():
+        if self._em_cache():
+            definir_atributo("cache", True)
             return self.token_cache["access_token"], self.token_cache["jwt_token"]
 
+        with self._lock:
+            if self._em_cache():            # outra thread renovou enquanto esperávamos
+                definir_atributo("cache", True)
+                return self.token_cache["access_token"], self.token_cache["jwt_token"]
+            return self._renovar()
+
+    def _renovar(self) -> Tuple[str, str]:
         headers = {
             "Authorization": "Basic "
                              + base64.b64encode(f"{self.consumer_key}:{self.consumer_secret}".encode()).decode(),
@@ -103,14 +120,16 @@ class TokenAutenticacao:
         body = {"grant_type": "client_credentials"}
 
         try:
-            response = post(
-                self.url_autenticacao,
-                data=body,
-                headers=headers,
-                verify=True,
-                pkcs12_filename=self.certificado_pfx,
-                pkcs12_password=self.senha_certificado,
-            )
+            TOKEN_RENOVACOES.inc()
+            with medir("token_renovacao"):
+                response = post(
+                    self.url_autenticacao,
+                    data=body,
+                    headers=headers,
+                    verify=True,
+                    pkcs12_filename=self.certificado_pfx,
+                    pkcs12_password=self.senha_certificado,
+                )
             response.raise_for_status()
 
             data = response.json()
@@ -125,3 +144,24 @@ class TokenAutenticacao:
 
         except Exception as e:
             raise Exception(f"Erro ao autenticar SERPRO: {e}") from e
+
+
+# ---------------------------------------------------------------------
+# instância compartilhada
+# ---------------------------------------------------------------------
+_autenticador: Optional[TokenAutenticacao] = None
+_autenticador_lock = threading.Lock()
+
+
+def obter_autenticador() -> TokenAutenticacao:
+    """
+    TokenAutenticacao única do processo: o PFX é lido/convertido uma vez
+    e todos os clientes SERPRO dividem o mesmo cache de token. Com o
+    gunicorn em `preload_app`, a leitura acontece no mestre, antes do fork.
+    """
+    global _autenticador
+    if _autenticador is None:
+        with _autenticador_lock:
+            if _autenticador is None:
+                _autenticador = TokenAutenticacao()
+    return _autenticador
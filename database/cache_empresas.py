@@ -0,0 +1,172 @@
+from __future__ import annotations
+import os
+import re
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from database.dominio_db import nova_conexao
+
+load_dotenv()
+
+
+# ---------------------------------------------------------------------
+# configuração
+# ---------------------------------------------------------------------
+CACHE_TTL = int(os.getenv("GEEMPRE_CACHE_TTL", "21600"))      # 6 h
+CACHE_FILE = Path(os.getenv(
+    "GEEMPRE_CACHE_FILE",
+    str(Path(__file__).resolve().parent.parent / "cache" / "geempre.json"),
+))
+
+_SQL_GEEMPRE = """
+    SELECT ge.codi_emp,
+           ge.cgce_emp
+      FROM bethadba.geempre ge
+     WHERE ge.cgce_emp IS NOT NULL
+"""
+
+
+def _so_digitos(cnpj: str) -> str:
+    return re.sub(r"\D", "", cnpj or "")
+
+
+def e_matriz(cnpj: str) -> bool:
+    """True se o CNPJ (14 dígitos) tem ordem 0001, ou seja, é a matriz."""
+    cnpj = _so_digitos(cnpj)
+    return len(cnpj) == 14 and cnpj[8:12] == "0001"
+
+
+class CacheEmpresas:
+    """
+    Snapshot em memória da bethadba.geempre:
+        • cnpj → codi_emp
+        • raiz (8 dígitos) → lista de filiais [{codi_emp, cnpj}]
+    Carregado em uma única consulta, persistido em `CACHE_FILE` e
+    renovado quando passa de `CACHE_TTL` segundos.
+    """
+
+    def __init__(self, ttl: int = CACHE_TTL, arquivo: Path | str = CACHE_FILE) -> None:
+        self.ttl = ttl
+        self.arquivo = Path(arquivo)
+        self._lock = threading.Lock()
+        self._por_cnpj: Dict[str, int] = {}
+        self._por_raiz: Dict[str, List[Dict[str, Any]]] = {}
+        self._carregado_em: Optional[float] = None
+
+    # ------------------------------------------------------------------ #
+    def _expirou(self) -> bool:
+        return self._carregado_em is None or time.time() - self._carregado_em >= self.ttl
+
+    def _indexar(self, linhas: List[Dict[str, Any]], carregado_em: float) -> None:
+        por_cnpj: Dict[str, int] = {}
+        por_raiz: Dict[str, List[Dict[str, Any]]] = {}
+        for linha in linhas:
+            cnpj = _so_digitos(linha["cnpj"])
+            if not cnpj:
+                continue
+            por_cnpj[cnpj] = linha["codi_emp"]
+            por_raiz.setdefault(cnpj[:8], []).append({"codi_emp": linha["codi_emp"], "cnpj": cnpj})
+        for filiais in por_raiz.values():
+            filiais.sort(key=lambda f: f["cnpj"])
+
+        self._por_cnpj = por_cnpj
+        self._por_raiz = por_raiz
+        self._carregado_em = carregado_em
+
+    def _ler_arquivo(self) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self.arquivo.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _gravar_arquivo(self, linhas: List[Dict[str, Any]], carregado_em: float) -> None:
+        """Grava o snapshot com rename atômico (tmp → definitivo)."""
+        try:
+            self.arquivo.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.arquivo.with_suffix(".tmp")
+            tmp.write_text(
+                json.dumps({"carregado_em": carregado_em, "empresas": linhas}, separators=(",", ":")),
+                encoding="utf-8",
+            )
+            os.replace(tmp, self.arquivo)
+        except OSError as e:
+            logging.warning("Não foi possível persistir cache geempre: %s", e)
+
+    def _consultar_dominio(self) -> List[Dict[str, Any]]:
+        db = nova_conexao()
+        db.connect()
+        rows = db.execute_query(_SQL_GEEMPRE)
+        db.close()
+        return [{"codi_emp": r[0], "cnpj": _so_digitos(r[1])} for r in rows]
+
+    # ------------------------------------------------------------------ #
+    def recarregar(self, forcar: bool = False) -> None:
+        """
+        Garante um snapshot válido:
+          1) memória dentro do TTL → nada a fazer;
+          2) arquivo local dentro do TTL → carrega dele;
+          3) senão consulta o Domínio. Se a consulta falhar, mantém o
+             snapshot antigo (memória ou arquivo) em vez de esvaziar o cache.
+        """
+        with self._lock:
+            if not forcar and not self._expirou():
+                return
+
+            salvo = None if forcar else self._ler_arquivo()
+            if salvo and time.time() - salvo.get("carregado_em", 0) < self.ttl:
+                self._indexar(salvo["empresas"], salvo["carregado_em"])
+                return
+
+            linhas = self._consultar_dominio()
+            if linhas:
+                agora = time.time()
+                self._indexar(linhas, agora)
+                self._gravar_arquivo(linhas, agora)
+                logging.info("Cache geempre recarregado: %s empresas", len(linhas))
+                return
+
+            if self._carregado_em is None:
+                salvo = salvo or self._ler_arquivo()
+                if salvo:
+                    logging.warning("Domínio indisponível; usando cache geempre vencido")
+                    self._indexar(salvo["empresas"], salvo["carregado_em"])
+
+    def codi_emp(self, cnpj: str) -> Optional[int]:
+        self.recarregar()
+        return self._por_cnpj.get(_so_digitos(cnpj))
+
+    def filiais(self, cnpj_raiz: str) -> List[Dict[str, Any]]:
+        self.recarregar()
+        return list(self._por_raiz.get(_so_digitos(cnpj_raiz)[:8], []))
+
+    def cnpj_matriz(self, cnpj_raiz: str) -> Optional[str]:
+        return next((f["cnpj"] for f in self.filiais(cnpj_raiz) if e_matriz(f["cnpj"])), None)
+
+
+# ---------------------------------------------------------------------
+# instância compartilhada
+# ---------------------------------------------------------------------
+_cache = CacheEmpresas()
+
+
+def codi_emp_por_cnpj(cnpj: str) -> Optional[int]:
+    """codi_emp da empresa pelo CNPJ completo; None se não estiver no cadastro."""
+    return _cache.codi_emp(cnpj)
+
+
+def filiais_por_raiz(cnpj_raiz: str) -> List[Dict[str, Any]]:
+    """Todos os estabelecimentos (matriz + filiais) da raiz, ordenados por CNPJ."""
+    return _cache.filiais(cnpj_raiz)
+
+
+def cnpj_matriz(cnpj_raiz: str) -> Optional[str]:
+    """CNPJ da matriz (ordem 0001) da raiz; None se não estiver no cadastro."""
+    return _cache.cnpj_matriz(cnpj_raiz)
+
+
+def recarregar_cache(forcar: bool = True) -> None:
+    _cache.recarregar(forcar=forcar)
@@ -0,0 +1,146 @@
+"""
+Checkpoint de lotes no Mongo: um documento por lote com a situação de
+cada CNPJ, para que uma nova execução pule o que já terminou.
+
+Documento:
+    {_id: lote, fluxo, pa, tipoDeclaracao, origem, modo, total,
+     criado_em, atualizado_em,
+     cnpjs: {<cnpj>: {status, etapa, responseId, atualizado_em, erro, revisao_manual}}}
+
+`status` do CNPJ é PENDENTE até ser processado e depois o status do
+resultado do pipeline (SUCESSO | JA_TRANSMITIDA | FALHA). `etapa` diz
+até onde o pipeline chegou — BUSCADO, MONTADO, ENVIADO, MONITORANDO
+(com o `responseId` do 202) e CONCLUIDO —, gravada pelo próprio pipeline
+quando roda dentro de `acompanhar(lote, cnpj)`. Assim, se o processo
+morrer no meio, a retomada sabe quem já foi enviado e quem só precisa
+voltar ao /Monitorar. CNPJ com `revisao_manual` (retificadora enviada
+cuja resposta se perdeu) fica FALHA e fora de `restantes` até alguém
+conferir no PGDAS-D.
+"""
+from __future__ import annotations
+import os
+import re
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from database.db_schema import colecao
+
+load_dotenv()
+
+CHECKPOINT_COLLECTION = os.getenv("CHECKPOINT_COLLECTION", "checkpoint_lotes")
+
+# CNPJ nesses status não é reprocessado
+CONCLUIDOS = ("SUCESSO", "JA_TRANSMITIDA")
+ETAPAS = ("BUSCADO", "MONTADO", "ENVIADO", "MONITORANDO", "CONCLUIDO")
+
+# (lote, cnpj) em acompanhamento no contexto atual
+_acompanhado: contextvars.ContextVar[Optional[Tuple[str, str]]] = contextvars.ContextVar(
+    "checkpoint_acompanhado", default=None)
+
+
+def _lotes():
+    return colecao(CHECKPOINT_COLLECTION)
+
+
+def _agora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _chave(cnpj: str) -> str:
+    """Só dígitos: o CNPJ vira nome de campo e não pode ter '.' nem '$'."""
+    return re.sub(r"\D", "", cnpj)
+
+
+def abrir_lote(lote: str, cnpjs: Iterable[str], **dados: Any) -> Dict[str, Any]:
+    """
+    Cria o lote ou, se já existir, acrescenta só os CNPJs que ainda não
+    estão nele; a situação dos antigos é preservada. `dados` (fluxo, pa,
+    tipoDeclaracao, origem...) só é gravado na criação.
+    """
+    agora = _agora()
+    existente = _lotes().find_one({"_id": lote}, {"cnpjs": 1}) or {}
+    ja_no_lote = existente.get("cnpjs", {})
+    novos = {f"cnpjs.{c}": {"status": "PENDENTE", "atualizado_em": agora}
+             for c in dict.fromkeys(map(_chave, cnpjs)) if c and c not in ja_no_lote}
+
+    _lotes().update_one(
+        {"_id": lote},
+        {"$setOnInsert": {**dados, "criado_em": agora},
+         "$set": {**novos, "atualizado_em": agora},
+         "$inc": {"total": len(novos)}},
+        upsert=True,
+    )
+    return {"lote": lote, "novos": len(novos), "total": len(ja_no_lote) + len(novos)}
+
+
+def marcar(lote: str, cnpj: str, status: str, erro: Optional[str] = None, **dados: Any) -> None:
+    """
+    Grava o resultado de um CNPJ no lote (etapa CONCLUIDO; o responseId
+    fica) e `dados` extras, como `revisao_manual`.
+    """
+    agora = _agora()
+    c = f"cnpjs.{_chave(cnpj)}"
+    _lotes().update_one(
+        {"_id": lote},
+        {"$set": {f"{c}.status": status, f"{c}.etapa": "CONCLUIDO", f"{c}.erro": erro,
+                  f"{c}.atualizado_em": agora, "atualizado_em": agora,
+                  **{f"{c}.{k}": v for k, v in dados.items()}}},
+    )
+
+
+@contextmanager
+def acompanhar(lote: str, cnpj: str) -> Iterator[None]:
+    """Faz as chamadas a `etapa` do bloco gravarem no CNPJ do lote."""
+    token = _acompanhado.set((lote, cnpj))
+    try:
+        yield
+    finally:
+        _acompanhado.reset(token)
+
+
+def etapa(nome: str, **dados: Any) -> None:
+    """
+    Registra a etapa do CNPJ acompanhado (e dados como `responseId`).
+    Fora de `acompanhar` não faz nada, então o pipeline pode chamar sempre.
+    """
+    atual = _acompanhado.get()
+    if atual is None:
+        return
+    lote, cnpj = atual
+    agora = _agora()
+    c = f"cnpjs.{_chave(cnpj)}"
+    _lotes().update_one(
+        {"_id": lote},
+        {"$set": {f"{c}.etapa": nome, f"{c}.atualizado_em": agora,
+                  **{f"{c}.{k}": v for k, v in dados.items()}}},
+    )
+
+
+def obter_lote(lote: str) -> Optional[Dict[str, Any]]:
+    return _lotes().find_one({"_id": lote})
+
+
+def restantes(lote: str) -> List[str]:
+    """CNPJs do lote ainda não concluídos nem à espera de revisão manual, na ordem em que entraram."""
+    doc = _lotes().find_one({"_id": lote}, {"cnpjs": 1}) or {}
+    return [c for c, s in doc.get("cnpjs", {}).items()
+            if s.get("status") not in CONCLUIDOS and not s.get("revisao_manual")]
+
+
+def resumo(lote: str) -> Optional[Dict[str, Any]]:
+    """Contagem por status do lote; None se o lote não existir."""
+    doc = _lotes().find_one({"_id": lote})
+    if doc is None:
+        return None
+    contagem: Dict[str, int] = {}
+    etapas: Dict[str, int] = {}
+    for s in doc.get("cnpjs", {}).values():
+        contagem[s.get("status")] = contagem.get(s.get("status"), 0) + 1
+        if s.get("etapa"):
+            etapas[s["etapa"]] = etapas.get(s["etapa"], 0) + 1
+    concluidos = sum(contagem.get(s, 0) for s in CONCLUIDOS)
+    return {"lote": lote, "total": len(doc.get("cnpjs", {})), "status": contagem, "etapas": etapas,
+            "finalizado": concluidos == len(doc.get("cnpjs", {})),
+            "atualizado_em": doc.get("atualizado_em")}
@@ -1,9 +1,14 @@
 from pymongo import MongoClient, ASCENDING
 from dotenv import load_dotenv
-from typing import Any, Dict
-from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError
+from utils.resposta_serpro import RespostaPgdas
+from utils.assinatura_payload import assinatura_payload
+from utils.modo_execucao import MODOS, em_modo, nome_colecao, transmitindo
+from utils.metricas import medir
 import os
-import json
+import threading
 
 
 load_dotenv()
@@ -12,35 +17,69 @@ load_dotenv()
 # ---------------------------------------------------------------------
 # conexão / inicialização
 # ---------------------------------------------------------------------
-MONGODB_URI = os.environ["MONGODB_URI"]
+MONGODB_URI = os.getenv("MONGODB_URI")
 MONGO_DB = os.environ.get("MONGO_DB", "pgdas")
 COLLECTION = os.environ.get("COLLECTION", "transmissao_pgd")
 COLLECTION_DAS = os.environ.get("COLLECTION_DAS", "transmissao_das")
 
 
-_client = MongoClient(MONGODB_URI)
-_db = _client[MONGO_DB]
+# O MongoClient é criado no primeiro uso e nunca atravessa um fork:
+# o gunicorn (preload_app) chama `reiniciar_cliente()` em cada worker.
+_client: Optional[MongoClient] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
 
-# coleção PGDAS
-_collection = _db[COLLECTION]
-# coleção DAS
-_das_collection = _db[COLLECTION_DAS]
+
+def _banco():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                if not MONGODB_URI:
+                    raise RuntimeError("MONGODB_URI não definido")
+                _client = MongoClient(MONGODB_URI)
+                _client_pid = os.getpid()
+    return _client[MONGO_DB]
+
+
+def reiniciar_cliente() -> None:
+    """Descarta o cliente herdado do processo pai; o próximo uso cria outro."""
+    global _client, _client_pid
+    _client = _client_pid = None
+
+
+def colecao(nome: str):
+    """Outra coleção do mesmo banco (MONGO_DB), para módulos com coleção própria."""
+    return _banco()[nome]
+
+
+def _collection():
+    """Coleção PGDAS do modo atual (transmissao_pgd ou transmissao_pgd_simulacao)."""
+    return _banco()[nome_colecao(COLLECTION)]
+
+
+def _das_collection():
+    """Coleção DAS."""
+    return _banco()[COLLECTION_DAS]
 
 
 def init_db() -> None:
     """
     Garante a existência da coleção e índices básicos.
     """
-    # índices PGDAS
-    _collection.create_index([("cnpj", ASCENDING), ("pa", ASCENDING), ("tipoDeclaracao", ASCENDING)], unique=True)
-    _collection.create_index("status")
+    # índices PGDAS (coleção de transmissão e de simulação)
+    for modo in MODOS:
+        with em_modo(modo):
+            _collection().create_index([("cnpj", ASCENDING), ("pa", ASCENDING), ("tipoDeclaracao", ASCENDING)],
+                                       unique=True)
+            _collection().create_index("status")
 
     # índices DAS
-    _das_collection.create_index(
+    _das_collection().create_index(
         [("cnpj", ASCENDING), ("pa", ASCENDING), ("dataConsolidacao", ASCENDING)],
         unique=True
     )
-    _das_collection.create_index("status")
+    _das_collection().create_index("status")
 
 
 # ---------------------------------------------------------------------
@@ -57,6 +96,7 @@ def _now_iso() -> str:
 # ---------------------------------------------------------------------
 # PGDAS
 # ---------------------------------------------------------------------
+@medir("mongo_insert_transmission")
 def insert_transmission(cnpj: str, pa: int, tipo: int, payload: Dict[str, Any]) -> str:
     """
     Insere documento PENDENTE e devolve o _id como string.
@@ -70,70 +110,196 @@ def insert_transmission(cnpj: str, pa: int, tipo: int, payload: Dict[str, Any])
         "status": "PENDENTE",
         "criado_em": _now_iso(),
         "payload_json": payload,
+        "payload_assinatura": assinatura_payload(payload),
     }
 
-    if tipo == 1:
-        # ---------- SOMENTE INSERE ----------
-        # Se o _id já existir o DuplicateKeyError sobe para o chamador
-        _collection.insert_one(doc)
+    if tipo not in (1, 2):
+        raise ValueError(f"Tipo de declaração inesperado: {tipo}")
 
-    elif tipo == 2:
-        # ---------- SUBSTITUI ----------
-        _collection.replace_one({"_id": _id}, doc, upsert=True)
+    if tipo == 1 and transmitindo():
+        # ---------- SOMENTE INSERE ----------
+        # PENDENTE/FALHA de uma tentativa interrompida é substituído; se a
+        # ORIGINAL já está em SUCESSO o DuplicateKeyError sobe para o chamador
+        r = _collection().replace_one({"_id": _id, "status": {"$ne": "SUCESSO"}}, doc)
+        if r.matched_count == 0:
+            _collection().insert_one(doc)
 
     else:
-        raise ValueError(f"Tipo de declaração inesperado: {tipo}")
+        # ---------- SUBSTITUI ----------
+        # retificadora, ou simulação (refazer a conta é o objetivo)
+        _collection().replace_one({"_id": _id}, doc, upsert=True)
 
     return _id
 
 
-def update_success(cnpj: str, pa: int, tipo: int, resp: Dict[str, Any]) -> None:
+@medir("mongo_buscar_declaracoes")
+def buscar_declaracoes(cnpjs: Iterable[str], pa: int) -> Dict[str, Dict[str, Any]]:
     """
-    Marca SUCESSO, grava resposta, guia (PDF base64) e valoresDevidos.
+    Última declaração em SUCESSO de cada CNPJ no PA, numa consulta:
+    {cnpj: {tipoDeclaracao, payload_json, payload_assinatura}}. Havendo
+    original e retificadora, vale a retificadora.
+    """
+    ultimas: Dict[str, Dict[str, Any]] = {}
+    for d in _collection().find(
+            {"cnpj": {"$in": list(dict.fromkeys(cnpjs))}, "pa": pa, "status": "SUCESSO"},
+            {"cnpj": 1, "tipoDeclaracao": 1, "payload_json": 1, "payload_assinatura": 1}):
+        atual = ultimas.get(d["cnpj"])
+        if atual is None or d.get("tipoDeclaracao", 1) > atual.get("tipoDeclaracao", 1):
+            ultimas[d["cnpj"]] = d
+    return ultimas
+
+
+def _corte_local(desde: datetime) -> str:
+    """`desde` (sem fuso = UTC, como o pymongo devolve) no formato de criado_em (_now_iso, hora local)."""
+    if desde.tzinfo is None:
+        desde = desde.replace(tzinfo=timezone.utc)
+    return desde.astimezone().replace(tzinfo=None).isoformat(timespec="seconds")
+
+
+def declarada_desde(cnpj: str, pa: int, tipo: int, desde: datetime) -> bool:
+    """
+    True se a declaração (cnpj, pa, tipo) está em SUCESSO e foi gravada a
+    partir de `desde` (datetime sem fuso = UTC, como o pymongo devolve).
+    """
+    return _collection().count_documents(
+        {"_id": _make_cnpj_pa_id(cnpj, pa, tipo), "status": "SUCESSO",
+         "criado_em": {"$gte": _corte_local(desde)}}, limit=1) > 0
+
+
+@medir("mongo_situacao_declaracoes")
+def situacao_declaracoes(cnpjs: Iterable[str], pa: int, tipo: int,
+                         desde: Optional[datetime] = None) -> Dict[str, str]:
+    """
+    {cnpj: status} das declarações (cnpj, pa, tipo) que existem, numa
+    consulta. Com `desde`, SUCESSO gravado antes dele (outra retificadora,
+    uma simulação antiga) vem como ANTERIOR, como em `declarada_desde`.
+    """
+    ids = [_make_cnpj_pa_id(c, pa, tipo) for c in dict.fromkeys(cnpjs)]
+    corte = _corte_local(desde) if desde is not None else ""
+    situacao = {}
+    for d in _collection().find({"_id": {"$in": ids}}, {"cnpj": 1, "status": 1, "criado_em": 1}):
+        status = d.get("status")
+        if status == "SUCESSO" and (d.get("criado_em") or "") < corte:
+            status = "ANTERIOR"
+        situacao[d["cnpj"]] = status
+    return situacao
+
+
+# ---------------------------------------------------------------------
+# pedidos 202 em andamento no SERPRO
+# ---------------------------------------------------------------------
+# O `responseId` do 202 é gravado assim que chega (status PENDENTE,
+# `aguardando_desde`). Se o /Monitorar estoura o prazo, o documento vira
+# FALHA com `monitorar_excedido: true` e mantém o id. Nos dois casos o
+# pedido continua no SERPRO: quem processar o CNPJ de novo (lote ou
+# utils/reconciliador_pedidos.py) volta ao /Monitorar em vez de reenviar.
+_PEDIDO_EM_ABERTO = {"responseId": {"$ne": None},
+                     "$or": [{"status": "PENDENTE"}, {"status": "FALHA", "monitorar_excedido": True}]}
+
+
+@medir("mongo_registrar_pedido")
+def registrar_pedido(cnpj: str, pa: int, tipo: int, payload: Optional[Dict[str, Any]], response_id: str) -> None:
+    """
+    Grava (ou atualiza) a declaração como PENDENTE com o responseId do 202.
+    `payload` None mantém o já gravado (retomada de pedido sem payload).
     """
     _id = _make_cnpj_pa_id(cnpj, pa, tipo)
-    # ------------ extrai partes internas iguais ao código SQLite ----------
-    interno: Dict[str, Any] = {}
-    raw = None
+    campos = {"cnpj": cnpj, "pa": pa, "tipoDeclaracao": tipo, "status": "PENDENTE",
+              "responseId": response_id, "aguardando_desde": _now_iso(), "monitorar_excedido": False}
+    if payload is not None:
+        campos.update(payload_json=payload, payload_assinatura=assinatura_payload(payload))
+    try:
+        _collection().update_one(
+            {"_id": _id, "status": {"$ne": "SUCESSO"}},
+            {"$set": campos, "$setOnInsert": {"criado_em": _now_iso()}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # já em SUCESSO: o resultado do /Monitorar decide o que fazer
+        pass
+
+
+@medir("mongo_marcar_monitorar_excedido")
+def marcar_monitorar_excedido(cnpj: str, pa: int, tipo: int, response_id: str, error: str) -> None:
+    """FALHA por prazo do /Monitorar: o pedido fica marcado para ser retomado."""
+    _collection().update_one(
+        {"_id": _make_cnpj_pa_id(cnpj, pa, tipo)},
+        {"$set": {"status": "FALHA", "error_msg": error, "responseId": response_id,
+                  "monitorar_excedido": True, "atualizado_em": _now_iso()}},
+    )
+
 
-    if isinstance(resp.get("body"), dict):
-        raw = resp["body"].get("dados")
+def payload_do_pedido(cnpj: str, pa: int, tipo: int, response_id: str) -> Optional[Dict[str, Any]]:
+    """Payload enviado no pedido `response_id` (gravado no 202); None se não houver."""
+    doc = _collection().find_one({"_id": _make_cnpj_pa_id(cnpj, pa, tipo), "responseId": response_id},
+                                 {"payload_json": 1})
+    return (doc or {}).get("payload_json")
 
-    if raw is None and isinstance(resp.get("dados"), str):
-        raw = resp["dados"]
 
-    if isinstance(raw, str):
-        try:
-            interno = json.loads(raw)
-        except json.JSONDecodeError:
-            interno = {}
+def pedidos_pendentes(cnpjs: Iterable[str], pa: int, tipo: int) -> Dict[str, str]:
+    """{cnpj: responseId} dos pedidos 202 ainda em aberto, numa consulta."""
+    ids = [_make_cnpj_pa_id(c, pa, tipo) for c in dict.fromkeys(cnpjs)]
+    return {d["cnpj"]: d["responseId"]
+            for d in _collection().find({"_id": {"$in": ids}, **_PEDIDO_EM_ABERTO}, {"cnpj": 1, "responseId": 1})}
 
-    valores = interno.get("valoresDevidos", [])
-    guia_b64 = interno.get("declaracao") if isinstance(interno.get("declaracao"), str) else None
-    # ----------------------------------------------------------------------
 
-    _collection.update_one(
+def pedidos_parados(idade_seg: int, limite: int) -> List[Dict[str, Any]]:
+    """
+    Pedidos em aberto que ninguém está acompanhando: PENDENTE com
+    `aguardando_desde` mais antigo que `idade_seg` ou FALHA por prazo.
+    """
+    corte = (datetime.now() - timedelta(seconds=idade_seg)).isoformat(timespec="seconds")
+    filtro = {"responseId": {"$ne": None},
+              "$or": [{"status": "PENDENTE", "aguardando_desde": {"$lt": corte}},
+                      {"status": "FALHA", "monitorar_excedido": True}]}
+    campos = {"cnpj": 1, "pa": 1, "tipoDeclaracao": 1, "status": 1, "responseId": 1, "aguardando_desde": 1}
+    return list(_collection().find(filtro, campos).limit(limite))
+
+
+def assumir_pedido(doc: Dict[str, Any]) -> bool:
+    """
+    Reivindica um pedido de `pedidos_parados` (volta a PENDENTE com
+    `aguardando_desde` agora). False se outro processo já mexeu nele.
+    """
+    r = _collection().update_one(
+        {"_id": doc["_id"], "status": doc["status"], "responseId": doc["responseId"],
+         "aguardando_desde": doc.get("aguardando_desde")},
+        {"$set": {"status": "PENDENTE", "aguardando_desde": _now_iso(), "monitorar_excedido": False}},
+    )
+    return r.modified_count == 1
+
+
+@medir("mongo_update_success")
+def update_success(cnpj: str, pa: int, tipo: int, resposta: RespostaPgdas) -> None:
+    """
+    Marca SUCESSO, grava resposta, guia (PDF base64) e valoresDevidos
+    a partir da resposta já interpretada pelo SerproClient.
+    """
+    _id = _make_cnpj_pa_id(cnpj, pa, tipo)
+    _collection().update_one(
         {"_id": _id},
         {"$set": {
             "status": "SUCESSO",
-            "response_json": resp,
-            "guia_pdf_base64": guia_b64,
-            "valores_devidos_json": valores
+            "response_json": resposta.bruto,
+            "guia_pdf_base64": resposta.pdf_b64,
+            "valores_devidos_json": resposta.valores_devidos
         }}
     )
 
 
+@medir("mongo_update_failure")
 def update_failure(cnpj: str, pa: int, tipo: int, resp: Dict[str, Any] | None = None, error: str | None = None) -> None:
     """
     Marca FALHA, salva resposta bruta (se houver) e msg de erro.
     """
     _id = _make_cnpj_pa_id(cnpj, pa, tipo)
-    _collection.update_one(
+    _collection().update_one(
         {"_id": _id},
         {"$set": {
             "status": "FALHA",
             "response_json": resp,
             "error_msg": error,
+            "monitorar_excedido": False,
             "atualizado_em": _now_iso()
         }}
     )
@@ -142,7 +308,12 @@ def update_failure(cnpj: str, pa: int, tipo: int, resp: Dict[str, Any] | None =
 # ---------------------------------------------------------------------
 #  DAS
 # ---------------------------------------------------------------------
+@medir("mongo_insert_das_transmission")
 def insert_das_transmission(cnpj: str, pa: int, data_consolidacao: str, payload: Dict[str, Any]) -> str:
+    """
+    Registra o DAS como PENDENTE. Reemissão (FALHA anterior, DAS
+    desatualizado ou `forcar`) sobrescreve o documento da mesma chave.
+    """
     _id = f"{cnpj}_{pa}_{data_consolidacao}"
     doc = {
         "_id": _id,
@@ -153,10 +324,11 @@ def insert_das_transmission(cnpj: str, pa: int, data_consolidacao: str, payload:
         "criado_em": _now_iso(),
         "payload_json": payload,
     }
-    _das_collection.insert_one(doc)
+    _das_collection().replace_one({"_id": _id}, doc, upsert=True)
     return _id
 
 
+@medir("mongo_update_das_success")
 def update_das_success(
     cnpj: str,
     pa: int,
@@ -166,7 +338,7 @@ def update_das_success(
     das_pdf_b64: str | None
 ) -> None:
     _id = f"{cnpj}_{pa}_{data_consolidacao}"
-    _das_collection.update_one(
+    _das_collection().update_one(
         {"_id": _id},
         {"$set": {
             "status": "SUCESSO",
@@ -178,6 +350,7 @@ def update_das_success(
     )
 
 
+@medir("mongo_update_das_failure")
 def update_das_failure(
     cnpj: str,
     pa: int,
@@ -186,7 +359,7 @@ def update_das_failure(
     error: str | None = None
 ) -> None:
     _id = f"{cnpj}_{pa}_{data_consolidacao}"
-    _das_collection.update_one(
+    _das_collection().update_one(
         {"_id": _id},
         {"$set": {
             "status": "FALHA",
@@ -195,3 +368,75 @@ def update_das_failure(
             "atualizado_em": _now_iso()
         }}
     )
+
+
+@medir("mongo_buscar_das_emitidos")
+def buscar_das_emitidos(cnpjs: Iterable[str], pa: int, data_consolidacao: str) -> Dict[str, Dict[str, Any]]:
+    """
+    DAS já emitidos com SUCESSO para (cnpj, pa, dataConsolidacao) do
+    lote, numa consulta: {cnpj: doc}. Sem PDF nem resposta bruta (que
+    repete o PDF); carregue com buscar_das_pdf só se for devolver.
+
+    Um DAS emitido antes da última declaração do mesmo cnpj/PA não
+    conta: os valores podem ter mudado (retificadora). DAS só existe
+    para declaração transmitida, então a comparação é sempre com a
+    coleção de transmissão, em qualquer modo.
+    """
+    cnpjs = list(dict.fromkeys(cnpjs))
+    declarado_em: Dict[str, str] = {}
+    for d in _banco()[COLLECTION].find({"cnpj": {"$in": cnpjs}, "pa": pa}, {"cnpj": 1, "criado_em": 1}):
+        declarado_em[d["cnpj"]] = max(declarado_em.get(d["cnpj"], ""), d.get("criado_em") or "")
+
+    emitidos = _das_collection().find(
+        {"_id": {"$in": [f"{c}_{pa}_{data_consolidacao}" for c in cnpjs]}, "status": "SUCESSO"},
+        {"das_pdf_base64": 0, "response_json": 0},
+    )
+    return {d["cnpj"]: d for d in emitidos
+            if (d.get("atualizado_em") or "") >= declarado_em.get(d["cnpj"], "")}
+
+
+@medir("mongo_gravar_das")
+def gravar_das(cnpj: str, pa: int, data_consolidacao: str, payload: Dict[str, Any],
+               resultado: Dict[str, Any]) -> str:
+    """
+    Grava o DAS já com o status final (SUCESSO | FALHA) numa única
+    escrita — sem o PENDENTE intermediário de insert_das_transmission.
+    Usado pelo fluxo encadeado PGDAS → DAS; reemissão sobrescreve.
+    """
+    _id = f"{cnpj}_{pa}_{data_consolidacao}"
+    agora = _now_iso()
+    sucesso = resultado.get("status") == "SUCESSO"
+    _das_collection().replace_one(
+        {"_id": _id},
+        {
+            "_id": _id,
+            "cnpj": cnpj,
+            "pa": pa,
+            "dataConsolidacao": data_consolidacao,
+            "status": "SUCESSO" if sucesso else "FALHA",
+            "criado_em": agora,
+            "atualizado_em": agora,
+            "payload_json": payload,
+            "response_json": resultado.get("serpro_response"),
+            "das_pdf_base64": resultado.get("das_pdf_b64") if sucesso else None,
+            "detalhamento_json": resultado.get("detalhamento") if sucesso else None,
+            "error_msg": None if sucesso else resultado.get("erro"),
+        },
+        upsert=True,
+    )
+    return _id
+
+
+# ---------------------------------------------------------------------
+#  consulta de PDFs
+# ---------------------------------------------------------------------
+def buscar_guia_pgdas(cnpj: str, pa: int, tipo: int) -> str | None:
+    """Guia PGDAS-D (base64) gravada por update_success, se houver."""
+    doc = _collection().find_one({"_id": _make_cnpj_pa_id(cnpj, pa, tipo)}, {"guia_pdf_base64": 1})
+    return doc.get("guia_pdf_base64") if doc else None
+
+
+def buscar_das_pdf(cnpj: str, pa: int, data_consolidacao: str) -> str | None:
+    """PDF do DAS (base64) gravado por update_das_success, se houver."""
+    doc = _das_collection().find_one({"_id": f"{cnpj}_{pa}_{data_consolidacao}"}, {"das_pdf_base64": 1})
+    return doc.get("das_pdf_base64") if doc else None
@@ -2,9 +2,12 @@ import os
 import re
 import logging
 import sqlanydb
-from datetime import date
+from datetime import date, datetime
+from functools import lru_cache
 from dotenv import load_dotenv
 from typing import Iterable, Optional, Tuple, List, Dict
+from utils.metricas import medir
+from utils.rastreamento import span, definir_atributo
 
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
@@ -55,26 +58,48 @@ class DatabaseConnection:
             logging.error("Conexão não estabelecida.")
             return []
         cur = self.conn.cursor()
-        try:
-            cur.execute(query, params or ())
-            return cur.fetchall()
-        except sqlanydb.Error as e:
-            logging.error(f"Erro na consulta: {e}\nSQL: {query}\nparams: {params}")
-            return []
-        finally:
-            cur.close()
+        with span("dominio.execute_query", **{"db.system": "sqlanywhere",
+                                                "db.statement": " ".join(query.split())[:500]}):
+            try:
+                cur.execute(query, params or ())
+                rows = cur.fetchall()
+                definir_atributo("db.linhas", len(rows))
+                return rows
+            except sqlanydb.Error as e:
+                logging.error(f"Erro na consulta: {e}\nSQL: {query}\nparams: {params}")
+                definir_atributo("erro", str(e))
+                return []
+            finally:
+                cur.close()
 
 
 # ---------------------------------------------------------------------------
-DB_PARAMS = {
-    "host": os.getenv("DB_HOST"),
-    "port": int(os.getenv("DB_PORT")),
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASS"),
-}
+@lru_cache(maxsize=None)
+def parametros_db() -> Dict[str, object]:
+    """Parâmetros de conexão do SQL Anywhere, lidos do ambiente no primeiro uso."""
+    return {
+        "host": os.getenv("DB_HOST"),
+        "port": int(os.getenv("DB_PORT") or "2638"),
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASS"),
+    }
+
+# sqlanywhere = produção | sqlite / duckdb = base sintética (database/dominio_fixture.py)
+DOMINIO_BACKEND = os.getenv("DOMINIO_BACKEND", "sqlanywhere")
+DOMINIO_FIXTURE = os.getenv("DOMINIO_FIXTURE", "fixture/dominio.sqlite")
 
 
+def nova_conexao() -> DatabaseConnection:
+    """Conexão (ainda não aberta) do backend escolhido em DOMINIO_BACKEND."""
+    if DOMINIO_BACKEND in ("sqlite", "duckdb"):
+        # import tardio: o módulo da fixture herda de DatabaseConnection
+        from database.dominio_fixture import conexao_fixture
+        return conexao_fixture(DOMINIO_BACKEND, DOMINIO_FIXTURE)
+    return DatabaseConnection(**parametros_db())
+
+
+@medir("buscar_simples")
 def buscar_simples(cnpj_raiz: str, anexo: Optional[int] = None, secao: Optional[int] = None, pa: Optional[str] = None, data_ini: Optional[date] = None, data_fim: Optional[date] = None) -> Iterable[Dict]:
     """
     Lê bethadba.efsdoimp_simples_nacional (alias sn) unida à geempre (ge).
@@ -121,7 +146,7 @@ def buscar_simples(cnpj_raiz: str, anexo: Optional[int] = None, secao: Optional[
         WHERE {" AND ".join(filtros)}
     """
 
-    db = DatabaseConnection(**DB_PARAMS)
+    db = nova_conexao()
     db.connect()
     rows = db.execute_query(sql, tuple(params))
     db.close()
@@ -139,6 +164,7 @@ def buscar_simples(cnpj_raiz: str, anexo: Optional[int] = None, secao: Optional[
     ]
 
 
+@medir("buscar_folha")
 def buscar_folha(cnpj_raiz: str, pa: int) -> Optional[float]:
     """
     Lê bethadba.efsimples_nacional_folha_anterior (alias fa).
@@ -163,7 +189,7 @@ def buscar_folha(cnpj_raiz: str, pa: int) -> Optional[float]:
     """
     params = (f"{raiz}%", ano, mes)
 
-    db = DatabaseConnection(**DB_PARAMS)
+    db = nova_conexao()
     db.connect()
     rows = db.execute_query(sql, params)
     db.close()
@@ -179,3 +205,111 @@ def buscar_folha(cnpj_raiz: str, pa: int) -> Optional[float]:
 
     total = v + i
     return total if total != 0 else 0.0
+
+
+@medir("listar_cnpjs_com_movimento")
+def listar_cnpjs_com_movimento(pa: int) -> List[str]:
+    """
+    Um CNPJ por raiz (a matriz 0001 quando existir) das empresas com
+    movimento do Simples no PA (AAAAMM) — a carteira do fechamento.
+    Filtra por intervalo de data_sim para poder usar o índice.
+    """
+    ini, fim = _intervalo_pa(pa)
+    sql = """
+        SELECT DISTINCT ge.cgce_emp
+          FROM bethadba.efsdoimp_simples_nacional sn
+          JOIN bethadba.geempre ge ON ge.codi_emp = sn.filial
+         WHERE sn.data_sim >= ? AND sn.data_sim < ?
+    """
+    db = nova_conexao()
+    db.connect()
+    rows = db.execute_query(sql, (ini, fim))
+    db.close()
+
+    cnpjs = {re.sub(r"\D", "", r[0] or "") for r in rows}
+    por_raiz: Dict[str, str] = {}
+    # matriz (ordem 0001) primeiro; sem matriz com movimento, o menor CNPJ da raiz
+    for cnpj in sorted((c for c in cnpjs if len(c) == 14), key=lambda c: (c[8:12] != "0001", c)):
+        por_raiz.setdefault(cnpj[:8], cnpj)
+    return sorted(por_raiz.values())
+
+
+# ---------------------------------------------------------------------------
+# cargas do PA inteiro (sincronizador de payloads)
+# ---------------------------------------------------------------------------
+def _intervalo_pa(pa: int) -> Tuple[date, date]:
+    """[1º dia do PA, 1º dia do mês seguinte)."""
+    ano, mes = divmod(int(pa), 100)
+    return date(ano, mes, 1), date(ano + mes // 12, mes % 12 + 1, 1)
+
+
+def _como_data(valor) -> date:
+    if isinstance(valor, str):
+        return date.fromisoformat(valor[:10])
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+@medir("buscar_simples_pa")
+def buscar_simples_pa(pa: int) -> List[Dict]:
+    """
+    Todas as linhas de bethadba.efsdoimp_simples_nacional do PA, numa
+    consulta, no mesmo formato de `buscar_simples` (agrupe por raiz).
+    """
+    ini, fim = _intervalo_pa(pa)
+    sql = """
+        SELECT ge.codi_emp,
+           ge.cgce_emp AS cgce_emp,
+           sn.filial,
+           sn.anexo,
+           sn.secao,
+           sn.tabela,
+           sn.basen,
+           sn.data_sim
+         FROM bethadba.efsdoimp_simples_nacional sn
+         JOIN bethadba.geempre ge ON ge.codi_emp = sn.filial
+        WHERE sn.data_sim >= ? AND sn.data_sim < ?
+    """
+    db = nova_conexao()
+    db.connect()
+    rows = db.execute_query(sql, (ini, fim))
+    db.close()
+
+    return [
+        {"codi_emp": r[0], "cgce_emp": r[1], "filial": r[2], "anexo": r[3],
+         "secao": r[4], "tabela": r[5], "basen": r[6], "data_sim": r[7]}
+        for r in rows
+    ]
+
+
+@medir("buscar_folhas_pa")
+def buscar_folhas_pa(pa: int, meses: int = 12) -> Dict[str, Dict[int, float]]:
+    """
+    Folha (valor + INSS CPP, como `buscar_folha`) dos `meses` anteriores
+    ao PA para todas as empresas, numa consulta: {raiz: {AAAAMM: total}}.
+    """
+    ano, mes = divmod(int(pa), 100)
+    mes_ini = (ano * 12 + mes - 1) - meses
+    ini = date(mes_ini // 12, mes_ini % 12 + 1, 1)
+    sql = """
+        SELECT ge.cgce_emp,
+               fa.periodo,
+               SUM(fa.valor)          AS soma_valor,
+               SUM(fa.VALOR_INSS_CPP) AS soma_inss
+          FROM bethadba.efsimples_nacional_folha_anterior fa
+          JOIN bethadba.geempre ge ON ge.codi_emp = fa.codi_emp
+         WHERE fa.periodo >= ? AND fa.periodo < ?
+         GROUP BY ge.cgce_emp, fa.periodo
+    """
+    db = nova_conexao()
+    db.connect()
+    rows = db.execute_query(sql, (ini, date(ano, mes, 1)))
+    db.close()
+
+    folhas: Dict[str, Dict[int, float]] = {}
+    for cnpj, periodo, valor, inss in rows:
+        raiz = re.sub(r"\D", "", cnpj or "")[:8]
+        d = _como_data(periodo)
+        pa_folha = d.year * 100 + d.month
+        por_mes = folhas.setdefault(raiz, {})
+        por_mes[pa_folha] = por_mes.get(pa_folha, 0.0) + float(valor or 0) + float(inss or 0)
+    return folhas
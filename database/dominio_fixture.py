@@ -0,0 +1,241 @@
+"""
+Base sintética do Domínio para teste e benchmark offline.
+
+    python -m database.dominio_fixture gerar fixture/dominio.sqlite \\
+        --empresas 2000 --filiais 2 --meses 24 --pa-final 202505 [--duckdb]
+
+Gera as três tabelas lidas pelo `dominio_db`:
+    • bethadba.geempre                             (codi_emp, cgce_emp)
+    • bethadba.efsdoimp_simples_nacional           (filial, anexo, secao, tabela, basen, data_sim)
+    • bethadba.efsimples_nacional_folha_anterior   (codi_emp, periodo, valor, VALOR_INSS_CPP)
+
+e as conexões que imitam `DatabaseConnection` sobre esse arquivo. O
+arquivo é anexado com o nome `bethadba` e YEAR/MONTH são registradas no
+SQLite, então `buscar_simples` / `buscar_folha` rodam o mesmo SQL da
+produção. Para usar na aplicação:
+
+    DOMINIO_BACKEND=sqlite   (ou duckdb, se o pacote estiver instalado)
+    DOMINIO_FIXTURE=fixture/dominio.sqlite
+"""
+from __future__ import annotations
+import sys
+import random
+import logging
+import sqlite3
+import argparse
+from datetime import date
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+from dicionario_id.segment_rules import SEGMENT_RULES
+from database.dominio_db import DatabaseConnection
+from utils.rastreamento import span, definir_atributo
+
+try:
+    import duckdb
+except ImportError:          # opcional: só para DOMINIO_BACKEND=duckdb
+    duckdb = None
+
+_DDL = (
+    "CREATE TABLE geempre (codi_emp INTEGER PRIMARY KEY, cgce_emp VARCHAR(14))",
+    "CREATE TABLE efsdoimp_simples_nacional (filial INTEGER, anexo INTEGER, secao INTEGER,"
+    " tabela INTEGER, basen DECIMAL(15,2), data_sim DATE)",
+    "CREATE TABLE efsimples_nacional_folha_anterior (codi_emp INTEGER, periodo DATE,"
+    " valor DECIMAL(15,2), VALOR_INSS_CPP DECIMAL(15,2))",
+    # índices equivalentes aos da produção para as formas de consulta
+    "CREATE INDEX ix_geempre_cgce ON geempre (cgce_emp)",
+    "CREATE INDEX ix_sn_filial_data ON efsdoimp_simples_nacional (filial, data_sim)",
+    "CREATE INDEX ix_fa_emp_periodo ON efsimples_nacional_folha_anterior (codi_emp, periodo)",
+)
+
+
+# ---------------------------------------------------------------------
+# conexões (mesma interface do DatabaseConnection)
+# ---------------------------------------------------------------------
+def _year(valor: Optional[str]) -> Optional[int]:
+    return int(valor[:4]) if valor else None
+
+
+def _month(valor: Optional[str]) -> Optional[int]:
+    return int(valor[5:7]) if valor else None
+
+
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()[:10]))
+
+
+class ConexaoSQLite(DatabaseConnection):
+    """Fixture em SQLite anexada como `bethadba`."""
+
+    def __init__(self, caminho: Path | str) -> None:
+        self.caminho = str(caminho)
+        self.conn: Optional[sqlite3.Connection] = None
+
+    def connect(self) -> None:
+        try:
+            self.conn = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES,
+                                        check_same_thread=False)
+            self.conn.execute("ATTACH DATABASE ? AS bethadba", (self.caminho,))
+            self.conn.create_function("YEAR", 1, _year, deterministic=True)
+            self.conn.create_function("MONTH", 1, _month, deterministic=True)
+        except sqlite3.Error as e:
+            logging.error(f"Erro ao abrir fixture {self.caminho}: {e}")
+            self.conn = None
+
+    def execute_query(self, query: str, params: Tuple | None = None) -> List[Tuple]:
+        if self.conn is None:
+            logging.error("Conexão não estabelecida.")
+            return []
+        with span("dominio.execute_query", **{"db.system": "sqlite",
+                                                "db.statement": " ".join(query.split())[:500]}):
+            try:
+                rows = self.conn.execute(query, params or ()).fetchall()
+                definir_atributo("db.linhas", len(rows))
+                return rows
+            except sqlite3.Error as e:
+                logging.error(f"Erro na consulta: {e}\nSQL: {query}\nparams: {params}")
+                return []
+
+
+class ConexaoDuckDB(DatabaseConnection):
+    """Fixture em DuckDB (YEAR/MONTH nativos); requer o pacote `duckdb`."""
+
+    def __init__(self, caminho: Path | str) -> None:
+        if duckdb is None:
+            raise RuntimeError("DOMINIO_BACKEND=duckdb requer o pacote 'duckdb'")
+        self.caminho = str(caminho)
+        self.conn = None
+
+    def connect(self) -> None:
+        try:
+            self.conn = duckdb.connect()
+            self.conn.execute(f"ATTACH '{self.caminho}' AS bethadba (READ_ONLY)")
+        except duckdb.Error as e:
+            logging.error(f"Erro ao abrir fixture {self.caminho}: {e}")
+            self.conn = None
+
+    def execute_query(self, query: str, params: Tuple | None = None) -> List[Tuple]:
+        if self.conn is None:
+            logging.error("Conexão não estabelecida.")
+            return []
+        with span("dominio.execute_query", **{"db.system": "duckdb",
+                                                "db.statement": " ".join(query.split())[:500]}):
+            try:
+                rows = self.conn.execute(query, list(params or ())).fetchall()
+                definir_atributo("db.linhas", len(rows))
+                return rows
+            except duckdb.Error as e:
+                logging.error(f"Erro na consulta: {e}\nSQL: {query}\nparams: {params}")
+                return []
+
+
+# ---------------------------------------------------------------------
+# gerador
+# ---------------------------------------------------------------------
+def _meses(pa_final: int, n: int) -> List[date]:
+    ano, mes = divmod(pa_final, 100)
+    saida = []
+    for _ in range(n):
+        saida.append(date(ano, mes, 1))
+        mes -= 1
+        if mes == 0:
+            mes, ano = 12, ano - 1
+    return sorted(saida)
+
+
+def _linhas(tamanhos: List[int], meses: int, pa_final: int,
+            semente: int) -> Tuple[List[tuple], Iterator[tuple], Iterator[tuple]]:
+    rng = random.Random(semente)
+    segmentos = sorted(SEGMENT_RULES)
+    periodos = _meses(pa_final, meses)
+    raizes = rng.sample(range(10_000_000, 99_999_999), len(tamanhos))
+
+    geempre: List[tuple] = []
+    for raiz, tamanho in zip(raizes, tamanhos):
+        for ordem in range(1, tamanho + 1):               # matriz (0001) + filiais
+            geempre.append((len(geempre) + 1, f"{raiz:08d}{ordem:04d}{rng.randint(0, 99):02d}"))
+
+    def simples() -> Iterator[tuple]:
+        for codi_emp, _ in geempre:
+            atividades = rng.sample(segmentos, rng.randint(1, 3))
+            for periodo in periodos:
+                if rng.random() < 0.05:                    # mês sem faturamento
+                    yield codi_emp, 0, 0, 0, 0.0, periodo
+                    continue
+                for anexo, secao, tabela in atividades:
+                    yield codi_emp, anexo, secao, tabela, round(rng.uniform(1_000, 250_000), 2), periodo
+
+    def folha() -> Iterator[tuple]:
+        for codi_emp, _ in geempre:
+            base = rng.uniform(3_000, 80_000)
+            for periodo in periodos:
+                valor = round(base * rng.uniform(0.9, 1.1), 2)
+                yield codi_emp, periodo, valor, round(valor * 0.2, 2)
+
+    return geempre, simples(), folha()
+
+
+def gerar_fixture(destino: Path | str, *, empresas: int = 200, filiais: int = 1, meses: int = 24,
+                  pa_final: int = 202505, semente: int = 1, usar_duckdb: bool = False,
+                  grupos: Optional[Sequence[int]] = None) -> Path:
+    """
+    Cria (sobrescrevendo) a base sintética em `destino`: `empresas` raízes,
+    cada uma com matriz + `filiais` estabelecimentos, e `meses` PAs até
+    `pa_final` de movimento e folha. `grupos` substitui empresas/filiais
+    por uma raiz por item, com aquele total de estabelecimentos.
+    """
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    destino.unlink(missing_ok=True)
+    tamanhos = list(grupos) if grupos else [filiais + 1] * empresas
+    geempre, simples, folha = _linhas(tamanhos, meses, pa_final, semente)
+
+    if usar_duckdb:
+        if duckdb is None:
+            raise RuntimeError("--duckdb requer o pacote 'duckdb'")
+        conn = duckdb.connect(str(destino))
+        simples, folha = list(simples), list(folha)
+    else:
+        conn = sqlite3.connect(destino)
+
+    for ddl in _DDL:
+        conn.execute(ddl)
+    conn.executemany("INSERT INTO geempre VALUES (?, ?)", geempre)
+    conn.executemany("INSERT INTO efsdoimp_simples_nacional VALUES (?, ?, ?, ?, ?, ?)", simples)
+    conn.executemany("INSERT INTO efsimples_nacional_folha_anterior VALUES (?, ?, ?, ?)", folha)
+    conn.commit()
+    conn.close()
+    return destino
+
+
+def conexao_fixture(backend: str, caminho: Path | str) -> DatabaseConnection:
+    """Conexão de fixture para DOMINIO_BACKEND=sqlite|duckdb."""
+    if backend == "duckdb":
+        return ConexaoDuckDB(caminho)
+    return ConexaoSQLite(caminho)
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def _cli(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Base sintética do Domínio")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("gerar", help="gera a base sintética")
+    p.add_argument("destino")
+    p.add_argument("--empresas", type=int, default=200)
+    p.add_argument("--filiais", type=int, default=1, help="filiais por empresa, além da matriz")
+    p.add_argument("--meses", type=int, default=24)
+    p.add_argument("--pa-final", type=int, default=202505)
+    p.add_argument("--semente", type=int, default=1)
+    p.add_argument("--duckdb", action="store_true", help="grava em DuckDB em vez de SQLite")
+
+    args = ap.parse_args(argv)
+    destino = gerar_fixture(args.destino, empresas=args.empresas, filiais=args.filiais, meses=args.meses,
+                            pa_final=args.pa_final, semente=args.semente, usar_duckdb=args.duckdb)
+    print(f"Fixture gerada em {destino}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_cli())
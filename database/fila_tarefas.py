@@ -0,0 +1,169 @@
+"""
+Fila de tarefas no Mongo para distribuir o fechamento entre processos/máquinas.
+
+A API só enfileira (`enfileirar_*`) e consulta (`status_lote`); os workers
+(utils/trabalhador_fila.py) reivindicam tarefas com `find_one_and_update`
+atômico e ficam com elas por um *lease*. Worker que morre deixa o lease
+vencer e a tarefa volta a ser reivindicável, até FILA_MAX_TENTATIVAS.
+
+Documento:
+    {_id, lote, fluxo: pgdas|das, cnpj, pa, tipoDeclaracao + modo | dataConsolidacao + forcar, escritorio,
+     status: PENDENTE|EXECUTANDO|CONCLUIDA|ERRO, tentativas, worker,
+     lease_ate, criado_em, atualizado_em, resultado, erro}
+"""
+from __future__ import annotations
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional
+from dotenv import load_dotenv
+from pymongo import ASCENDING, ReturnDocument
+from database.db_schema import colecao
+from utils.metricas import medir
+from utils.modo_execucao import validar_modo
+
+load_dotenv()
+
+FILA_COLLECTION = os.getenv("FILA_COLLECTION", "fila_tarefas")
+FILA_LEASE_SEG = int(os.getenv("FILA_LEASE_SEG", "300"))
+FILA_MAX_TENTATIVAS = int(os.getenv("FILA_MAX_TENTATIVAS", "3"))
+
+
+def _fila():
+    return colecao(FILA_COLLECTION)
+
+
+def _agora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def init_fila() -> None:
+    _fila().create_index([("status", ASCENDING), ("criado_em", ASCENDING)])
+    _fila().create_index([("status", ASCENDING), ("lease_ate", ASCENDING)])
+    _fila().create_index("lote")
+
+
+# ---------------------------------------------------------------------
+# API: enfileirar / consultar
+# ---------------------------------------------------------------------
+def _enfileirar(fluxo: str, cnpjs: Iterable[str], pa: int, extra: Dict[str, Any]) -> Dict[str, Any]:
+    lote = uuid.uuid4().hex
+    agora = _agora()
+    docs = [{
+        "lote": lote,
+        "fluxo": fluxo,
+        "cnpj": cnpj,
+        "pa": pa,
+        **extra,
+        "status": "PENDENTE",
+        "tentativas": 0,
+        "worker": None,
+        "lease_ate": None,
+        "criado_em": agora,
+        "atualizado_em": agora,
+    } for cnpj in cnpjs]
+    if docs:
+        _fila().insert_many(docs, ordered=False)
+    return {"lote": lote, "total": len(docs)}
+
+
+@medir("mongo_fila_enfileirar")
+def enfileirar_pgdas(cnpjs: Iterable[str], pa: int, tipo: int, modo: Optional[str] = None,
+                     escritorio: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Uma tarefa (cnpj, pa, tipo, modo) por CNPJ; devolve {'lote', 'total'}.
+    O modo é fixado aqui, não no padrão de cada worker. `escritorio` é o
+    submissor das tarefas no escalonador SERPRO (padrão: o lote).
+    """
+    return _enfileirar("pgdas", cnpjs, pa, {"tipoDeclaracao": tipo, "modo": validar_modo(modo),
+                                            "escritorio": escritorio})
+
+
+@medir("mongo_fila_enfileirar")
+def enfileirar_das(cnpjs: Iterable[str], pa: int, data_consolidacao: str | None,
+                   forcar: bool = False, escritorio: Optional[str] = None) -> Dict[str, Any]:
+    """Uma tarefa (cnpj, pa, dataConsolidacao) por CNPJ; devolve {'lote', 'total'}."""
+    return _enfileirar("das", cnpjs, pa, {"dataConsolidacao": data_consolidacao, "forcar": forcar,
+                                          "escritorio": escritorio})
+
+
+def status_lote(lote: str, *, incluir_resultados: bool = False) -> Optional[Dict[str, Any]]:
+    """Contagem por status do lote e, se pedido, os resultados já concluídos."""
+    contagem: Dict[str, int] = {}
+    for grupo in _fila().aggregate([{"$match": {"lote": lote}},
+                                  {"$group": {"_id": "$status", "n": {"$sum": 1}}}]):
+        contagem[grupo["_id"]] = grupo["n"]
+    if not contagem:
+        return None
+
+    total = sum(contagem.values())
+    feitas = contagem.get("CONCLUIDA", 0) + contagem.get("ERRO", 0)
+    saida: Dict[str, Any] = {"lote": lote, "total": total, "status": contagem, "finalizado": feitas == total}
+    if incluir_resultados:
+        saida["resultados"] = [
+            d.get("resultado") or {"cnpj": d["cnpj"], "status": "FALHA", "erro": d.get("erro")}
+            for d in _fila().find({"lote": lote, "status": {"$in": ["CONCLUIDA", "ERRO"]}},
+                                {"resultado": 1, "cnpj": 1, "erro": 1}).sort("criado_em", ASCENDING)
+        ]
+    return saida
+
+
+# ---------------------------------------------------------------------
+# worker: reivindicar / lease / concluir
+# ---------------------------------------------------------------------
+def reivindicar(worker: str, lease_seg: int = FILA_LEASE_SEG) -> Optional[Dict[str, Any]]:
+    """
+    Pega atomicamente a tarefa PENDENTE mais antiga, ou uma EXECUTANDO
+    com lease vencido (worker caído), e a marca como deste worker.
+    """
+    agora = _agora()
+    return _fila().find_one_and_update(
+        {"tentativas": {"$lt": FILA_MAX_TENTATIVAS},
+         "$or": [{"status": "PENDENTE"},
+                 {"status": "EXECUTANDO", "lease_ate": {"$lt": agora}}]},
+        {"$set": {"status": "EXECUTANDO", "worker": worker,
+                  "lease_ate": agora + timedelta(seconds=lease_seg), "atualizado_em": agora},
+         "$inc": {"tentativas": 1}},
+        sort=[("criado_em", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def renovar_lease(tarefa_id: Any, worker: str, lease_seg: int = FILA_LEASE_SEG) -> bool:
+    """Heartbeat; False se a tarefa já não pertence a este worker."""
+    agora = _agora()
+    r = _fila().update_one({"_id": tarefa_id, "worker": worker, "status": "EXECUTANDO"},
+                         {"$set": {"lease_ate": agora + timedelta(seconds=lease_seg), "atualizado_em": agora}})
+    return r.matched_count == 1
+
+
+@medir("mongo_fila_concluir")
+def concluir(tarefa_id: Any, worker: str, resultado: Dict[str, Any]) -> bool:
+    r = _fila().update_one({"_id": tarefa_id, "worker": worker},
+                         {"$set": {"status": "CONCLUIDA", "resultado": resultado, "lease_ate": None,
+                                   "atualizado_em": _agora()}})
+    return r.matched_count == 1
+
+
+def falhar(tarefa_id: Any, worker: str, erro: str, tentativas: int) -> None:
+    """Erro inesperado do worker: volta para PENDENTE ou vira ERRO se esgotou."""
+    status = "ERRO" if tentativas >= FILA_MAX_TENTATIVAS else "PENDENTE"
+    _fila().update_one({"_id": tarefa_id, "worker": worker},
+                     {"$set": {"status": status, "erro": erro, "worker": None, "lease_ate": None,
+                               "atualizado_em": _agora()}})
+
+
+def encerrar_esgotadas() -> int:
+    """Lease vencido sem tentativas restantes → ERRO (não seriam mais reivindicadas)."""
+    agora = _agora()
+    r = _fila().update_many(
+        {"status": "EXECUTANDO", "lease_ate": {"$lt": agora}, "tentativas": {"$gte": FILA_MAX_TENTATIVAS}},
+        {"$set": {"status": "ERRO", "erro": "lease expirado sem tentativas restantes", "atualizado_em": agora}},
+    )
+    return r.modified_count
+
+
+def profundidade() -> Dict[str, int]:
+    """Tarefas por status, somando todos os lotes."""
+    return {g["_id"]: g["n"] for g in _fila().aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}])}
+
@@ -0,0 +1,86 @@
+"""
+Payloads PGDAS-D pré-montados pelo sincronizador (utils/sincronizador_dominio.py).
+
+Um documento por raiz de CNPJ e PA, com as linhas do Domínio que o
+geraram, o hash delas e o payload pronto:
+    {_id: "<raiz>_<pa>", raiz, pa, cnpj (matriz), codi_emp,
+     hash_linhas, linhas, folhas, payload, status: PRONTO|INVALIDO, erro, validacao,
+     atualizado_em (payload remontado), conferido_em (última sincronização)}
+
+Na transmissão, `obter_preparado` devolve o payload se ele estiver
+PRONTO e tiver sido conferido (`conferido_em`) há menos de PREPARADOS_MAX_IDADE_SEG;
+senão o pipeline monta na hora, como sempre.
+"""
+from __future__ import annotations
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional
+from dotenv import load_dotenv
+from pymongo import ASCENDING, UpdateOne
+from database.db_schema import colecao
+from utils.metricas import medir
+
+load_dotenv()
+
+PREPARADOS_COLLECTION = os.getenv("PREPARADOS_COLLECTION", "pgdas_preparados")
+# 0 desliga o uso dos pré-montados na transmissão
+PREPARADOS_MAX_IDADE_SEG = int(os.getenv("PREPARADOS_MAX_IDADE_SEG", "3600"))
+
+
+def _preparados():
+    return colecao(PREPARADOS_COLLECTION)
+
+
+def _agora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _id(raiz: str, pa: int) -> str:
+    return f"{raiz}_{pa}"
+
+
+def init_preparados() -> None:
+    _preparados().create_index([("pa", ASCENDING), ("status", ASCENDING)])
+
+
+def hashes_do_pa(pa: int) -> Dict[str, str]:
+    """{raiz: hash_linhas} de tudo o que já está materializado no PA."""
+    return {d["raiz"]: d.get("hash_linhas") for d in _preparados().find({"pa": pa}, {"raiz": 1, "hash_linhas": 1})}
+
+
+@medir("mongo_gravar_preparados")
+def gravar_preparados(docs: Iterable[Dict[str, Any]]) -> int:
+    """Upsert em lote dos documentos (cada um com `raiz` e `pa`)."""
+    agora = _agora()
+    ops = [UpdateOne({"_id": _id(d["raiz"], d["pa"])}, {"$set": {**d, "atualizado_em": agora, "conferido_em": agora}},
+                     upsert=True) for d in docs]
+    if ops:
+        _preparados().bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def marcar_conferidos(pa: int, raizes: Iterable[str]) -> None:
+    """Raízes do PA sem mudança na sincronização: os payloads delas continuam válidos."""
+    raizes = list(raizes)
+    if raizes:
+        _preparados().update_many({"pa": pa, "raiz": {"$in": raizes}}, {"$set": {"conferido_em": _agora()}})
+
+
+def remover_ausentes(pa: int, raizes: Iterable[str]) -> int:
+    """Apaga raízes que não têm mais movimento no PA."""
+    r = _preparados().delete_many({"pa": pa, "raiz": {"$nin": list(raizes)}})
+    return r.deleted_count
+
+
+@medir("mongo_obter_preparado")
+def obter_preparado(cnpj: str, pa: int, max_idade_seg: int = PREPARADOS_MAX_IDADE_SEG) -> Optional[Dict[str, Any]]:
+    """Payload pré-montado da raiz do CNPJ, se PRONTO e conferido recentemente."""
+    if max_idade_seg <= 0:
+        return None
+    raiz = re.sub(r"\D", "", cnpj)[:8]
+    return _preparados().find_one(
+        {"_id": _id(raiz, int(pa)), "status": "PRONTO",
+         "conferido_em": {"$gte": _agora() - timedelta(seconds=max_idade_seg)}},
+        {"payload": 1, "codi_emp": 1, "cnpj": 1},
+    )
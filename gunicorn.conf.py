@@ -0,0 +1,45 @@
+"""
+Configuração do gunicorn para servir a API (ver wsgi.py).
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+As rotas passam quase todo o tempo esperando o SERPRO/Domínio/Mongo,
+então a concorrência vem de threads (worker `gthread`); processos só
+para usar mais de um núcleo na montagem/serialização dos JSONs.
+"""
+import os
+import multiprocessing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("WEB_BIND", f"0.0.0.0:{os.getenv('PORT', '6200')}")
+workers = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "16"))
+# lotes síncronos podem levar minutos; no gthread o timeout só derruba worker travado
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "60"))
+keepalive = 5
+
+# importa o app no mestre: PFX, regras e cadastro carregados uma única vez
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("WEB_LOGLEVEL", "info")
+
+
+def post_fork(server, worker):
+    """
+    Cada worker abre o próprio MongoClient (pymongo não é fork-safe) e
+    recomeça as threads de fundo que o mestre possa ter iniciado no
+    preload (ex.: exportador de spans ao pré-carregar o cadastro com
+    TRACE_EXPORTADOR ligado, arquivador): threads não atravessam o fork.
+    """
+    from database.db_schema import reiniciar_cliente
+    from utils.rastreamento import reiniciar_exportador
+    from utils.arquivador import reiniciar_apos_fork
+    reiniciar_cliente()
+    reiniciar_exportador()
+    reiniciar_apos_fork()
@@ -1,24 +1,34 @@
 import os
-import json
+import base64
 import logging
-from datetime import date, timedelta
-from typing import Any, Dict, List
-from flask import Flask, request, jsonify
+from typing import Any, Dict, Iterable
+from flask import Flask, Response, request, jsonify, stream_with_context
 from dotenv import load_dotenv
-from database.db_schema import init_db, insert_transmission, update_success, update_failure, insert_das_transmission, update_das_success, update_das_failure
-from pymongo.errors import DuplicateKeyError
-from database.dominio_db import buscar_simples
-from utils.json_builder import montar_json
-from utils.save_json import salvar_payload
-from utils.uploader_serpro import SerproClient
-from utils.monitorar_serpro import monitorar_pedido
-from utils.gerar_das import gerar_das_unico
-from utils.resp_controle import montar_payload_parceiro
-from auth.token_auth import TokenAutenticacao
+from database.db_schema import init_db, buscar_guia_pgdas, buscar_das_pdf
+from database.dominio_db import listar_cnpjs_com_movimento
+from database.preparados import init_preparados
+from database import checkpoint_lote
+from database.fila_tarefas import init_fila, enfileirar_pgdas, enfileirar_das, status_lote
+from utils.arquivador import metricas_arquivador
+from utils.pipeline import (
+    processar_das_lote, processar_pgdas_e_das, normalizar_data_consolidacao, referenciar_pdf,
+)
+from utils import lote_pgdas, spool_pdf
+from utils.modo_execucao import em_modo, validar_modo, SIMULACAO_THREADS
+from utils.escalonador_serpro import submissor
+from utils.diferencas import comparar as comparar_declaracoes
+from utils.validacao import validar_pa
+from utils.serializacao import ProvedorJSONFlask, dumps
+from utils.metricas import exportar as exportar_metricas
+from utils.rastreamento import span, trace_id_de
+from auth.token_auth import obter_autenticador
 
 # ----------------------------------------------------------------------
 load_dotenv()
 init_db()
+init_fila()
+init_preparados()
+spool_pdf.limpar_orfaos()
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,10 +36,87 @@ logging.basicConfig(
 )
 
 app = Flask(__name__)
-app.json.ensure_ascii = False
-# inicializa auth e client SERPRO
-tok = TokenAutenticacao()
-client = SerproClient()
+app.json = ProvedorJSONFlask(app)
+# inicializa auth SERPRO (PFX lido uma vez; com preload do gunicorn, no mestre)
+tok = obter_autenticador()
+
+_NDJSON = "application/x-ndjson"
+
+
+# ---------------------------------------------------------------------- helpers
+def _quer_ndjson() -> bool:
+    """Cliente pediu streaming (`Accept: application/x-ndjson`)."""
+    return _NDJSON in request.headers.get("Accept", "")
+
+
+def _responder(nome: str, resultados: Iterable[Dict[str, Any]], cabecalho: Dict[str, Any]) -> Any:
+    """
+    NDJSON: uma linha por CNPJ assim que ele termina (nada é acumulado).
+    JSON:   `cabecalho` + lista completa em `resultados`, como antes, mas
+            escrita item a item: o PDF de cada resultado (GuiaPdf no spool)
+            só volta à memória enquanto o seu item é serializado.
+    O lote inteiro roda sob um span raiz `nome` (continua o `traceparent`
+    do cliente, se vier) e o trace id volta em `X-Trace-Id` (e o lote de
+    checkpoint, se houver, em `X-Lote`, já que o NDJSON não tem cabeçalho).
+    As chamadas ao SERPRO do lote passam pelo escalonador como um submissor
+    (utils/escalonador_serpro.py).
+    """
+    traceparent = request.headers.get("traceparent")
+    trace_id = trace_id_de(traceparent)
+    headers = {"X-Trace-Id": trace_id}
+    if cabecalho.get("lote"):
+        headers["X-Lote"] = str(cabecalho["lote"])
+
+    # escalonador SERPRO: um CNPJ só vai na faixa urgente; o submissor é o
+    # escritório (X-Escritorio ou "escritorio" no corpo) ou, sem ele, o lote
+    data = request.get_json(silent=True) or {}
+    cnpjs = data.get("cnpjs")
+    faixa = "urgente" if isinstance(cnpjs, list) and len(cnpjs) == 1 else "normal"
+    escritorio = _escritorio(data)
+
+    def rastreados() -> Iterable[Dict[str, Any]]:
+        with span(nome, traceparent=traceparent, trace_id=trace_id,
+                  **{"http.route": request.path, "escalonador.faixa": faixa}, **cabecalho), \
+                submissor(str(cabecalho.get("lote") or trace_id), faixa=faixa, escritorio=escritorio):
+            yield from resultados
+
+    if _quer_ndjson():
+        def gerar():
+            for resultado in rastreados():
+                yield dumps(resultado) + b"\n"
+        return Response(stream_with_context(gerar()), mimetype=_NDJSON, headers=headers)
+
+    def gerar_json():
+        abertura = dumps(cabecalho)[:-1]
+        yield abertura + (b',"resultados":[' if len(abertura) > 1 else b'"resultados":[')
+        for i, resultado in enumerate(rastreados()):
+            yield (b"," if i else b"") + dumps(resultado)
+        yield b"]}"
+    return Response(stream_with_context(gerar_json()), mimetype="application/json", headers=headers)
+
+
+def _escritorio(data: Dict[str, Any]) -> str | None:
+    """Submissor para o escalonador SERPRO: cabeçalho X-Escritorio ou `escritorio` no corpo."""
+    return request.headers.get("X-Escritorio") or data.get("escritorio")
+
+
+def _modo(data: Dict[str, Any]) -> str:
+    """`modo` do corpo (simular | transmitir); ausente = PGDAS_MODO_PADRAO. ValueError se inválido."""
+    return validar_modo(data.get("modo"))
+
+
+def _url_pdf_pgdas(cnpj: str, pa: Any, tipo: int, modo: str) -> str:
+    return f"/pdf/pgdas/{cnpj}/{pa}/{tipo}?modo={modo}"
+
+
+def _pdf_response(b64: str | None, nome: str) -> Any:
+    if not b64:
+        return jsonify(error="PDF não encontrado"), 404
+    return Response(
+        base64.b64decode(b64),
+        mimetype="application/pdf",
+        headers={"Content-Disposition": f'inline; filename="{nome}"'},
+    )
 
 
 # ---------------------------------------------------------------------- rota
@@ -41,7 +128,8 @@ def transmitir_pgdas():
         {
           "pa": 202505,
           "tipoDeclaracao": 1,      # 1 = Original | 2 = Retificadora
-          "cnpjs": ["14993727000121", "..." ]
+          "cnpjs": ["14993727000121", "..." ],
+          "modo": "transmitir"      # simular (padrão: PGDAS_MODO_PADRAO) | transmitir
         }
 
     • Para cada CNPJ, tenta transmitir a declaração do PA
@@ -50,6 +138,16 @@ def transmitir_pgdas():
         - status: SUCESSO | JA_TRANSMITIDA | FALHA
         - recibo / pdf_b64 (quando vier da SERPRO)
         - serpro_body (cópia literal da resposta em caso de FALHA)
+    • `Accept: application/x-ndjson` devolve um resultado por linha,
+      à medida que cada CNPJ termina.
+    • `"incluirPdf": false` troca o PDF dos SUCESSOS por `pdfUrl`.
+    • `"detalharTempos": true` inclui `tempos` (s por etapa) em cada item.
+    • `"modo": "simular"` só calcula no SERPRO (indicadorTransmissao
+      false), grava nas coleções/pastas de simulação e processa
+      SIMULACAO_THREADS CNPJs em paralelo.
+    • Cada chamada abre um lote com checkpoint por CNPJ (`lote` na
+      resposta, ou o informado no corpo); se o processo cair, retome
+      com POST /lotes/<lote>/retomar.
 
     Qualquer erro controlado é capturado e transformado em FALHA,
     preservando o corpo original devolvido pelo SERPRO.
@@ -65,133 +163,66 @@ def transmitir_pgdas():
     if tipo not in (1, 2):
         return jsonify(error="'tipoDeclaracao' deve ser 1 ou 2"), 400
 
-    resultados: List[Dict[str, Any]] = []
-
-    # ================================================================== loop
-    for cnpj in cnpjs:
-        resp: Dict[str, Any] | None = None
-        try:
-            # 1) monta payload local (mantém igual)
-            rows = buscar_simples(cnpj, pa=pa)
-            if not rows:
-                resultados.append({
-                    "cnpj": cnpj,
-                    "status": "FALHA",
-                    "erro": f"Nenhum dado do PGDAS-D encontrado no Domínio para PA  {pa}",
-                })
-                update_failure(cnpj, pa, tipo, None, "rows vazio")
-                continue
-            payload = montar_json(rows, tipo)
-            salvar_payload(payload, pretty=True)
-
-            # 2) Envia ao SERPRO
-            resp = client.enviar("pgdas", payload)
-            if resp.get("status") == 202:
-                resp = monitorar_pedido(resp["body"]["responseId"])
-
-            # ─── novo bloco: se não for 2xx, trate como erro ──────────────────────
-            if not (200 <= resp.get("status", 0) < 300):
-                resultados.append({
-                    "cnpj": cnpj,
-                    "status": "FALHA",
-                    "erro": "SERPRO devolveu HTTP %s" % resp["status"],
-                    "serpro_body": resp["body"],
-                })
-                update_failure(cnpj, pa, tipo, resp, "HTTP %s" % resp["status"])
-                continue
-
-            # 2.5) Verifica se a ORIGINAL já estava concluída
-            if (tipo == 1 and
-                    resp.get("status") == 200 and
-                    isinstance(resp.get("body"), dict) and
-                    resp["body"].get("codigoStatus") == "CONCLUIDO" and
-                    isinstance(resp["body"].get("dados"), dict) and
-                    resp["body"]["dados"].get("reciboDeclaracao")):
-                resultados.append({
-                    "cnpj": cnpj,
-                    "status": "JA_TRANSMITIDA",
-                    "mensagem": "Declaração ORIGINAL já estava transmitida no PGDAS-D",
-                    "recibo": resp["body"]["dados"]["reciboDeclaracao"],
-                    "pdf_b64": resp["body"]["dados"].get("declaracao")
-                })
-                continue
-            # 3) Grava no Mongo
-            try:
-                insert_transmission(cnpj, pa, tipo, payload)
-            except DuplicateKeyError:
-                resultado = {
-                    "cnpj": cnpj,
-                    "status": "JA_TRANSMITIDA",
-                    "mensagem": (
-                        "Declaração ORIGINAL já transmitida..."
-                        if tipo == 1
-                        else "Declaração RETIFICADORA já existe..."
-                    ),
-                }
-                body = resp.get("body") if isinstance(resp, dict) else None
-                if isinstance(body, dict):
-                    dados = body.get("dados")
-                    if isinstance(dados, dict):
-                        resultado["recibo"] = dados.get("reciboDeclaracao")
-                        resultado["pdf_b64"] = dados.get("declaracao")
-                resultados.append(resultado)
-                continue
-
-            # 4) marca SUCESSO no banco
-            update_success(cnpj, pa, tipo, resp)
-
-            # 5) extrai dados para retorno e parceiro
-            interno: Dict[str, Any] = {}
-
-            raw = (resp.get("body", {}).get("dados")
-                   if isinstance(resp.get("body"), dict)
-                   else resp.get("dados"))
-
-            if isinstance(raw, str) and raw.strip():
-                try:
-                    interno = json.loads(raw)
-                except json.JSONDecodeError:
-                    logging.warning("Campo 'dados' não é JSON válido; ignorando parse")
-
-            guia_b64 = interno.get("declaracao") if isinstance(interno.get("declaracao"), str) else None
-
-            # 6) envia para parceiro
-            payload_parceiro = montar_payload_parceiro(
-                cnpj, pa, interno,
-                tipo_declaracao=tipo,
-                pdf_b64=guia_b64
-            )
-
-            # 7) adiciona no resultado final
-            resultados.append({
-                "status": "SUCESSO",
-                **payload_parceiro
-            })
-
-        # ------------- time-out / 5xx persistente --------------------- #
-        except RuntimeError as e:
-            msg, extra = e.args if len(e.args) == 2 else (str(e), None)
-            resultados.append({
-                "cnpj": cnpj,
-                "status": "FALHA",
-                "erro": msg,
-                "serpro_body": extra,
-            })
-            update_failure(cnpj, pa, tipo, extra, msg)
-            continue
-
-        # ------------- falhas inesperadas ----------------------------- #
-        except Exception as e:
-            logging.exception("Erro no PGDAS %s", cnpj)
-            update_failure(cnpj, pa, tipo, resp, str(e))
-            resultados.append({
-                "cnpj": cnpj,
-                "status": "FALHA",
-                "erro": str(e),
-            })
-
-    # ---------- resposta final --------------------------------------- #
-    return jsonify(pa=pa, tipoDeclaracao=tipo, resultados=resultados), 200
+    try:
+        modo = _modo(data)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    incluir_pdf = data.get("incluirPdf", True)
+    detalhar = bool(data.get("detalharTempos", False))
+
+    with em_modo(modo):
+        lote = lote_pgdas.abrir(cnpjs, pa, tipo, lote=data.get("lote"))
+
+    def resultados() -> Iterable[Dict[str, Any]]:
+        with em_modo(modo):
+            threads = SIMULACAO_THREADS if modo == "simular" else 1
+            for resultado in lote_pgdas.executar(lote, cnpjs, pa, tipo, threads=threads, detalhar_tempos=detalhar):
+                if not incluir_pdf:
+                    resultado = referenciar_pdf(resultado, "pdfBase64",
+                                                _url_pdf_pgdas(resultado.get("cnpj"), pa, tipo, modo))
+                yield resultado
+
+    return _responder("transmitir_pgdas", resultados(),
+                      {"pa": pa, "tipoDeclaracao": tipo, "modo": modo, "lote": lote})
+
+
+# ---------------------------------------------------------------------- rotas lote
+@app.route("/lotes/<lote>", methods=["GET"])
+def lote_status_route(lote: str):
+    """Situação do lote: contagem por status e por etapa."""
+    resumo = checkpoint_lote.resumo(lote)
+    if resumo is None:
+        return jsonify(error="Lote não encontrado"), 404
+    return jsonify(resumo), 200
+
+
+@app.route("/lotes/<lote>/retomar", methods=["POST"])
+def lote_retomar_route(lote: str):
+    """
+    Continua um lote de /transmitir-pgdas interrompido: concilia as
+    declarações PENDENTE no Mongo, volta ao /Monitorar de quem já tem
+    `responseId` (sem reenviar) e processa só o que falta. Corpo opcional
+    com `incluirPdf` e `detalharTempos`; aceita NDJSON.
+    """
+    doc = checkpoint_lote.obter_lote(lote)
+    if doc is None or doc.get("fluxo") != "pgdas":
+        return jsonify(error="Lote não encontrado"), 404
+
+    data = request.get_json(silent=True) or {}
+    pa, tipo, modo = doc["pa"], doc["tipoDeclaracao"], doc.get("modo") or validar_modo(None)
+    incluir_pdf = data.get("incluirPdf", True)
+
+    def resultados() -> Iterable[Dict[str, Any]]:
+        threads = SIMULACAO_THREADS if modo == "simular" else 1
+        for resultado in lote_pgdas.retomar(lote, threads=threads,
+                                            detalhar_tempos=bool(data.get("detalharTempos", False))):
+            if not incluir_pdf:
+                resultado = referenciar_pdf(resultado, "pdfBase64",
+                                            _url_pdf_pgdas(resultado.get("cnpj"), pa, tipo, modo))
+            yield resultado
+
+    return _responder("retomar_lote", resultados(), {"lote": lote, "pa": pa, "tipoDeclaracao": tipo, "modo": modo})
 
 
 # ---------------------------------------------------------------------- rota DAS
@@ -202,7 +233,14 @@ def gerar_das_route():
     {
       "pa": 202506,
       "cnpjs": ["00000000000100", ...],
+      "dataConsolidacao": "2025-07-20",   # opcional
+      "incluirPdf": false,                # opcional: devolve pdfUrl
+      "detalharTempos": true,             # opcional: tempos por etapa
+      "forcar": true                      # opcional: ignora DAS já emitidos
     }
+    DAS já emitido com SUCESSO para o mesmo (cnpj, pa, dataConsolidacao)
+    volta do Mongo com `"cache": true`, sem nova chamada ao SERPRO.
+    Aceita `Accept: application/x-ndjson` como /transmitir-pgdas.
     """
     data = request.get_json(force=True)
     pa = data.get("pa")
@@ -212,46 +250,212 @@ def gerar_das_route():
     if not pa or not isinstance(cnpjs, list) or not cnpjs:
         return jsonify(error="JSON deve conter 'pa' e lista não vazia 'cnpjs'"), 400
 
-    resultados: List[Dict[str, Any]] = []
-
-    for cnpj in cnpjs:
-        # normaliza dataConsolidacao para YYYYMMDD
-        if data_consolidacao:
-            dc = data_consolidacao.replace("-", "")
-        else:
-            dc = (date.today() + timedelta(days=1)).strftime("%Y%m%d")
-
-        # 1) insere registro PENDENTE
-        insert_das_transmission(cnpj, pa, dc, {"cnpj": cnpj, "pa": pa, "dataConsolidacao": dc})
-
-        try:
-            # 2) chama SERPRO
-            resultado = gerar_das_unico(cnpj, pa, data_consolidacao)
-            resultados.append(resultado)
-
-            # 3) persiste sucesso ou falha
-            resp = resultado.get("serpro_response")
-            if resultado["status"] == "SUCESSO":
-                update_das_success(
-                    cnpj, pa, dc,
-                    resp,
-                    resultado.get("detalhamento"),
-                    resultado.get("das_pdf_b64")
-                )
-            else:
-                update_das_failure(cnpj, pa, dc, resp, resultado.get("erro"))
-
-        except Exception as e:
-            # falha inesperada
-            msg = str(e)
-            resultados.append({"cnpj": cnpj, "status": "FALHA", "erro": msg})
-            update_das_failure(cnpj, pa, dc, None, msg)
-
-    retorno: Dict[str, Any] = {"pa": pa, "resultados": resultados}
+    resultados = processar_das_lote(cnpjs, pa, data_consolidacao,
+                                    forcar=bool(data.get("forcar", False)),
+                                    incluir_pdf=data.get("incluirPdf", True),
+                                    detalhar_tempos=bool(data.get("detalharTempos", False)))
+
+    cabecalho: Dict[str, Any] = {"pa": pa}
     if data_consolidacao:
-        retorno["dataConsolidacao"] = data_consolidacao
+        cabecalho["dataConsolidacao"] = data_consolidacao
+
+    return _responder("gerar_das", resultados, cabecalho)
+
+
+# ---------------------------------------------------------------------- rota PGDAS + DAS
+@app.route("/transmitir-pgdas-e-das", methods=["POST"])
+def transmitir_pgdas_e_das():
+    """
+    Corpo de /transmitir-pgdas mais o `dataConsolidacao` opcional do DAS.
+    Cada declaração em SUCESSO já dispara a emissão do DAS em paralelo
+    com as próximas declarações; cada item traz `pgdas` e `das` (None se
+    a declaração não deu SUCESSO), na ordem em que ficam prontos.
+    Aceita NDJSON, `incluirPdf`, `detalharTempos` e `modo` como as demais
+    rotas; simulando, nenhum DAS é emitido (`das` sempre None).
+    """
+    data = request.get_json(force=True)
+    pa = data.get("pa")
+    cnpjs = data.get("cnpjs")
+    tipo = data.get("tipoDeclaracao", 1)
+    data_consolidacao = data.get("dataConsolidacao")
+
+    if not pa or not isinstance(cnpjs, list) or not cnpjs:
+        return jsonify(error="JSON deve conter 'pa' e lista não vazia 'cnpjs'"), 400
+    if tipo not in (1, 2):
+        return jsonify(error="'tipoDeclaracao' deve ser 1 ou 2"), 400
+
+    try:
+        modo = _modo(data)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    incluir_pdf = data.get("incluirPdf", True)
+    detalhar = bool(data.get("detalharTempos", False))
+    dc = normalizar_data_consolidacao(data_consolidacao)
+
+    def resultados() -> Iterable[Dict[str, Any]]:
+        with em_modo(modo):
+            for item in processar_pgdas_e_das(cnpjs, pa, tipo, data_consolidacao, detalhar_tempos=detalhar):
+                if not incluir_pdf:
+                    cnpj = item["cnpj"]
+                    item["pgdas"] = referenciar_pdf(item["pgdas"], "pdfBase64", _url_pdf_pgdas(cnpj, pa, tipo, modo))
+                    if item["das"]:
+                        item["das"] = referenciar_pdf(item["das"], "das_pdf_b64", f"/pdf/das/{cnpj}/{pa}/{dc}")
+                yield item
+
+    cabecalho: Dict[str, Any] = {"pa": pa, "tipoDeclaracao": tipo, "modo": modo}
+    if data_consolidacao:
+        cabecalho["dataConsolidacao"] = data_consolidacao
+
+    return _responder("transmitir_pgdas_e_das", resultados(), cabecalho)
+
+
+# ---------------------------------------------------------------------- rota diferenças
+@app.route("/diferencas-pgdas", methods=["POST"])
+def diferencas_pgdas():
+    """
+    {
+      "pa": 202505,
+      "cnpjs": ["..."],          # opcional: sem lista, a carteira do PA no Domínio
+      "transmitir": true,        # opcional: RETIFICADORA só para os ALTERADO
+      "todos": true,             # opcional: inclui os INALTERADO
+      "incluirPdf": false,       # opcional: pdfUrl na retificadora
+      "modo": "transmitir"       # opcional: compara/retifica nas coleções deste modo
+    }
+    Compara o payload atual de cada CNPJ com a última declaração em
+    SUCESSO (assinatura canônica) e devolve ALTERADO (com `alteracoes`:
+    receitas/folhas), NOVO, SEM_DADOS ou ERRO. Aceita NDJSON.
+    """
+    data = request.get_json(force=True)
+    pa = data.get("pa")
+    cnpjs = data.get("cnpjs")
+
+    if not pa or (cnpjs is not None and (not isinstance(cnpjs, list) or not cnpjs)):
+        return jsonify(error="JSON deve conter 'pa' e, se vier, lista não vazia 'cnpjs'"), 400
+
+    try:
+        modo = _modo(data)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    transmitir = bool(data.get("transmitir", False))
+    incluir_pdf = data.get("incluirPdf", True)
+
+    def resultados() -> Iterable[Dict[str, Any]]:
+        with em_modo(modo):
+            lista = cnpjs if cnpjs is not None else listar_cnpjs_com_movimento(pa)
+            for item in comparar_declaracoes(lista, pa, transmitir=transmitir, todos=bool(data.get("todos", False))):
+                if "retificadora" in item and not incluir_pdf:
+                    item["retificadora"] = referenciar_pdf(item["retificadora"], "pdfBase64",
+                                                           _url_pdf_pgdas(item["cnpj"], pa, 2, modo))
+                yield item
+
+    return _responder("diferencas_pgdas", resultados(), {"pa": pa, "transmitir": transmitir, "modo": modo})
+
+
+@app.route("/validar-pgdas", methods=["POST"])
+def validar_pgdas():
+    """
+    {
+      "pa": 202505,
+      "cnpjs": ["..."],          # opcional: sem lista, todas as raízes com movimento no PA
+      "todos": true              # opcional: inclui os VALIDO
+    }
+    Monta e valida os payloads do PA sem chamar o SERPRO (segmento sem
+    regra, base negativa, matriz, totais, folhas, esquema). Devolve por
+    CNPJ VALIDO, INVALIDO (com `erros`) ou SEM_DADOS. Aceita NDJSON.
+    """
+    data = request.get_json(force=True)
+    pa = data.get("pa")
+    cnpjs = data.get("cnpjs")
+
+    if not pa or (cnpjs is not None and (not isinstance(cnpjs, list) or not cnpjs)):
+        return jsonify(error="JSON deve conter 'pa' e, se vier, lista não vazia 'cnpjs'"), 400
+
+    resultados = validar_pa(int(pa), cnpjs, todos=bool(data.get("todos", False)))
+    return _responder("validar_pgdas", resultados, {"pa": pa})
+
+
+# ---------------------------------------------------------------------- rotas fila
+@app.route("/fila/transmitir-pgdas", methods=["POST"])
+def fila_transmitir_pgdas():
+    """
+    Mesmo corpo de /transmitir-pgdas (inclusive `modo`), mas só enfileira:
+    cada CNPJ vira uma tarefa para os workers (`python -m utils.trabalhador_fila`).
+    Responde 202 com o lote; acompanhe em GET /fila/<lote>.
+    """
+    data = request.get_json(force=True)
+    pa = data.get("pa")
+    cnpjs = data.get("cnpjs")
+    tipo = data.get("tipoDeclaracao", 1)
+
+    if not pa or not isinstance(cnpjs, list) or not cnpjs:
+        return jsonify(error="JSON deve conter 'pa' e lista não vazia 'cnpjs'"), 400
+    if tipo not in (1, 2):
+        return jsonify(error="'tipoDeclaracao' deve ser 1 ou 2"), 400
+
+    try:
+        modo = _modo(data)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    lote = enfileirar_pgdas(cnpjs, pa, tipo, modo, escritorio=_escritorio(data))
+    return jsonify(**lote, statusUrl=f"/fila/{lote['lote']}"), 202
+
+
+@app.route("/fila/gerar-das", methods=["POST"])
+def fila_gerar_das():
+    """Mesmo corpo de /gerar-das; enfileira e responde 202 com o lote."""
+    data = request.get_json(force=True)
+    pa = data.get("pa")
+    cnpjs = data.get("cnpjs")
+
+    if not pa or not isinstance(cnpjs, list) or not cnpjs:
+        return jsonify(error="JSON deve conter 'pa' e lista não vazia 'cnpjs'"), 400
+
+    lote = enfileirar_das(cnpjs, pa, data.get("dataConsolidacao"), bool(data.get("forcar", False)),
+                          escritorio=_escritorio(data))
+    return jsonify(**lote, statusUrl=f"/fila/{lote['lote']}"), 202
+
+
+@app.route("/fila/<lote>", methods=["GET"])
+def fila_status_route(lote: str):
+    """Tarefas do lote por status; `?resultados=1` inclui os resultados concluídos."""
+    status = status_lote(lote, incluir_resultados=request.args.get("resultados") in ("1", "true"))
+    if status is None:
+        return jsonify(error="Lote não encontrado"), 404
+    return jsonify(status), 200
+
+
+# ---------------------------------------------------------------------- rotas PDF
+@app.route("/pdf/pgdas/<cnpj>/<int:pa>/<int:tipo>", methods=["GET"])
+def pdf_pgdas_route(cnpj: str, pa: int, tipo: int):
+    """Guia/declaração PGDAS-D persistida, para respostas com `incluirPdf: false` (`?modo=`)."""
+    try:
+        modo = validar_modo(request.args.get("modo"))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    with em_modo(modo):
+        return _pdf_response(buscar_guia_pgdas(cnpj, pa, tipo), f"PGDAS-{cnpj}-{pa}.pdf")
+
+
+@app.route("/pdf/das/<cnpj>/<int:pa>/<dc>", methods=["GET"])
+def pdf_das_route(cnpj: str, pa: int, dc: str):
+    """DAS persistido, para respostas com `incluirPdf: false`."""
+    return _pdf_response(buscar_das_pdf(cnpj, pa, dc), f"DAS-{cnpj}-{pa}.pdf")
+
+
+# ---------------------------------------------------------------------- rota métricas
+@app.route("/metrics", methods=["GET"])
+def metrics_route():
+    """Histogramas por etapa/serviço SERPRO, contadores de status, retries, polls e tokens."""
+    return Response(exportar_metricas(), mimetype="text/plain; version=0.0.4")
+
 
-    return jsonify(retorno), 200
+@app.route("/arquivo/metricas", methods=["GET"])
+def metricas_arquivo_route():
+    """Profundidade da fila e latência de gravação do arquivador de payloads."""
+    return jsonify(metricas_arquivador()), 200
 
 
 # ----------------------------------------------------------------- execução
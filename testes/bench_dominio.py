@@ -0,0 +1,217 @@
+"""
+Benchmark das consultas do Domínio sobre a base sintética.
+
+    python -m testes.bench_dominio [--fixture fixture/dominio.sqlite] [--backend sqlite]
+                                   [--empresas 2000 --filiais 2 --meses 24] [--n 200]
+
+Gera a fixture se o arquivo não existir (database/dominio_fixture.py),
+aponta DOMINIO_BACKEND/DOMINIO_FIXTURE para ela e mede, com CNPJs
+sorteados do cadastro, as mesmas formas de consulta da produção:
+  • buscar_simples por PA e por intervalo de 12 meses;
+  • buscar_folha (um mês) e os 12 meses do fator R (`_folhas_salario`);
+  • carga completa do cadastro geempre (cache_empresas).
+
+    python -m testes.bench_dominio --conferir [--pa 202505]
+
+confere, numa fixture pequena gerada num diretório temporário, que
+buscar_simples, buscar_folha, listar_cnpjs_com_movimento,
+buscar_simples_pa e buscar_folhas_pa devolvem, para o PA, exatamente as
+linhas calculadas em Python a partir do próprio gerador; depois apaga
+uma linha da base e exige que a conferência acuse a diferença. Sai com
+código 1 se alguma consulta divergir.
+"""
+from __future__ import annotations
+import os
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+from datetime import date
+from typing import Callable, Dict, List, Tuple
+
+
+def _medir(nome: str, fn: Callable[[], object], n: int) -> Dict[str, object]:
+    tempos: List[float] = []
+    linhas = 0
+    for _ in range(n):
+        t0 = time.perf_counter()
+        r = fn()
+        tempos.append(time.perf_counter() - t0)
+        linhas += len(r) if isinstance(r, list) else 1
+    q = statistics.quantiles(tempos, n=100, method="inclusive") if n > 1 else [tempos[0]] * 99
+    return {"consulta": nome, "n": n, "p50_ms": round(q[49] * 1000, 3), "p95_ms": round(q[94] * 1000, 3),
+            "p99_ms": round(q[98] * 1000, 3), "linhas_media": round(linhas / n, 1)}
+
+
+# ---------------------------------------------------------------------
+# conferência de resultado
+# ---------------------------------------------------------------------
+_CONFERENCIA = dict(empresas=12, filiais=2, meses=15, semente=7)
+
+
+def _esperado(pa: int) -> Dict[str, object]:
+    """Linhas do PA recalculadas em Python a partir de `_linhas` (sem SQL)."""
+    from database.dominio_fixture import _linhas
+    p = _CONFERENCIA
+    geempre, simples, folha = _linhas([p["filiais"] + 1] * p["empresas"], p["meses"], pa, p["semente"])
+    # mesma ordem de consumo do rng que gerar_fixture: simples antes de folha
+    simples, folha = list(simples), list(folha)
+    cnpj_de = dict(geempre)
+    ano, mes = divmod(pa, 100)
+    mes_ini = ano * 12 + mes - 1 - 12
+    ini_folha = date(mes_ini // 12, mes_ini % 12 + 1, 1)
+
+    linhas_pa = sorted((f, cnpj_de[f], f, a, s, t, b, d) for f, a, s, t, b, d in simples
+                       if d.year * 100 + d.month == pa)
+    por_raiz: Dict[str, str] = {}
+    for cnpj in sorted({l[1] for l in linhas_pa}, key=lambda c: (c[8:12] != "0001", c)):
+        por_raiz.setdefault(cnpj[:8], cnpj)
+    folha_pa: Dict[str, float] = {}
+    folhas: Dict[str, Dict[int, float]] = {}
+    for codi, periodo, valor, inss in folha:
+        raiz = cnpj_de[codi][:8]
+        if periodo.year * 100 + periodo.month == pa:
+            folha_pa[raiz] = folha_pa.get(raiz, 0.0) + valor + inss
+        if ini_folha <= periodo < date(ano, mes, 1):
+            por_mes = folhas.setdefault(raiz, {})
+            chave = periodo.year * 100 + periodo.month
+            por_mes[chave] = por_mes.get(chave, 0.0) + valor + inss
+    return {"linhas_pa": linhas_pa, "cnpjs": sorted(por_raiz.values()),
+            "folha_pa": folha_pa, "folhas": folhas}
+
+
+def _tuplas(linhas) -> List[Tuple]:
+    from database.dominio_db import _como_data
+    return sorted((r["codi_emp"], r["cgce_emp"], r["filial"], r["anexo"], r["secao"], r["tabela"],
+                   float(r["basen"]), _como_data(r["data_sim"])) for r in linhas)
+
+
+def _perto(a: Dict, b: Dict) -> bool:
+    return a.keys() == b.keys() and all(abs(a[k] - b[k]) < 0.005 for k in a)
+
+
+def _conferir_consultas(pa: int, esperado: Dict[str, object]) -> List[str]:
+    """Roda as cinco consultas sobre a fixture e lista as divergências."""
+    from database.dominio_db import (buscar_simples, buscar_folha, listar_cnpjs_com_movimento,
+                                     buscar_simples_pa, buscar_folhas_pa)
+    erros: List[str] = []
+    linhas_pa = esperado["linhas_pa"]
+    if _tuplas(buscar_simples_pa(pa)) != linhas_pa:
+        erros.append("buscar_simples_pa")
+    if listar_cnpjs_com_movimento(pa) != esperado["cnpjs"]:
+        erros.append("listar_cnpjs_com_movimento")
+    folhas = buscar_folhas_pa(pa)
+    if folhas.keys() != esperado["folhas"].keys() or not all(
+            _perto(v, folhas[k]) for k, v in esperado["folhas"].items()):
+        erros.append("buscar_folhas_pa")
+    for raiz in sorted({l[1][:8] for l in linhas_pa} | set(esperado["folha_pa"])):
+        da_raiz = [l for l in linhas_pa if l[1].startswith(raiz)]
+        if _tuplas(buscar_simples(raiz, pa=str(pa))) != da_raiz:
+            erros.append(f"buscar_simples {raiz}")
+        if abs((buscar_folha(raiz, pa) or 0.0) - esperado["folha_pa"].get(raiz, 0.0)) >= 0.005:
+            erros.append(f"buscar_folha {raiz}")
+    return erros
+
+
+def conferir(pa: int) -> int:
+    """Confere as consultas na fixture e que a conferência acusa uma base alterada."""
+    import sqlite3
+    from database.dominio_fixture import gerar_fixture
+
+    fixture = Path(os.environ["DOMINIO_FIXTURE"])
+    p = _CONFERENCIA
+    gerar_fixture(fixture, empresas=p["empresas"], filiais=p["filiais"], meses=p["meses"],
+                  pa_final=pa, semente=p["semente"])
+    esperado = _esperado(pa)
+    if not esperado["linhas_pa"] or not esperado["folhas"]:
+        print(f"FALHA: fixture sem movimento no PA {pa}")
+        return 1
+
+    erros = _conferir_consultas(pa, esperado)
+    for erro in erros:
+        print(f"FALHA: {erro} diverge do esperado no PA {pa}")
+    if not erros:
+        print(f"ok: {len(esperado['linhas_pa'])} linhas do Simples, {len(esperado['cnpjs'])} CNPJs "
+              f"e folhas de {len(esperado['folhas'])} raízes conferidos no PA {pa}")
+
+    # a conferência precisa acusar uma base que não bate com o esperado
+    alvo = esperado["linhas_pa"][0]
+    conn = sqlite3.connect(fixture)
+    conn.execute("DELETE FROM efsdoimp_simples_nacional WHERE filial = ? AND data_sim = ?",
+                 (alvo[2], alvo[7].isoformat()))
+    conn.execute("UPDATE efsimples_nacional_folha_anterior SET valor = valor + 1 WHERE codi_emp = ?",
+                 (alvo[0],))
+    conn.commit()
+    conn.close()
+    acusados = _conferir_consultas(pa, esperado)
+    if not acusados:
+        print("FALHA: base alterada passou pela conferência")
+        return 1
+    print(f"ok: base alterada acusada em {len(acusados)} consultas")
+    return 1 if erros else 0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark das consultas do Domínio em fixture")
+    ap.add_argument("--fixture", default="fixture/dominio.sqlite")
+    ap.add_argument("--backend", choices=("sqlite", "duckdb"), default="sqlite")
+    ap.add_argument("--empresas", type=int, default=2000)
+    ap.add_argument("--filiais", type=int, default=2)
+    ap.add_argument("--meses", type=int, default=24)
+    ap.add_argument("--pa", type=int, default=202505)
+    ap.add_argument("--n", type=int, default=200, help="execuções por consulta")
+    ap.add_argument("--regerar", action="store_true", help="recria a fixture mesmo se já existir")
+    ap.add_argument("--conferir", action="store_true",
+                    help="confere o resultado das consultas numa fixture temporária e sai")
+    args = ap.parse_args()
+
+    if args.conferir:
+        # fixture própria: os parâmetros precisam ser os de _CONFERENCIA
+        args.backend = "sqlite"
+        args.fixture = str(Path(tempfile.mkdtemp(prefix="dominio_")) / "conferencia.sqlite")
+        os.environ.update(DOMINIO_BACKEND=args.backend, DOMINIO_FIXTURE=args.fixture)
+        raise SystemExit(conferir(args.pa))
+
+    os.environ.update(DOMINIO_BACKEND=args.backend, DOMINIO_FIXTURE=args.fixture)
+    from database.dominio_fixture import gerar_fixture
+    from database.dominio_db import buscar_simples, buscar_folha, nova_conexao
+    from database.cache_empresas import CacheEmpresas
+    from utils.json_builder import _folhas_salario
+
+    if args.regerar or not Path(args.fixture).exists():
+        t0 = time.perf_counter()
+        gerar_fixture(args.fixture, empresas=args.empresas, filiais=args.filiais, meses=args.meses,
+                      pa_final=args.pa, usar_duckdb=args.backend == "duckdb")
+        print(f"Fixture gerada em {time.perf_counter() - t0:.1f}s: {args.fixture}")
+
+    db = nova_conexao()
+    db.connect()
+    cnpjs = [r[0] for r in db.execute_query("SELECT cgce_emp FROM bethadba.geempre")]
+    db.close()
+    rng = random.Random(1)
+
+    def sorteio() -> str:
+        return rng.choice(cnpjs)
+
+    ano, mes = divmod(args.pa, 100)
+    ini = date(ano - 1, mes, 1)
+    cache = CacheEmpresas(ttl=0, arquivo=Path(args.fixture).with_suffix(".geempre.json"))
+
+    resultados = [
+        _medir("buscar_simples (PA)", lambda: buscar_simples(sorteio(), pa=args.pa), args.n),
+        _medir("buscar_simples (12 meses)",
+               lambda: buscar_simples(sorteio(), data_ini=ini, data_fim=date(ano, mes, 28)), args.n),
+        _medir("buscar_folha (1 mês)", lambda: buscar_folha(sorteio(), args.pa), args.n),
+        _medir("_folhas_salario (12 meses)", lambda: _folhas_salario(sorteio(), args.pa), max(args.n // 10, 2)),
+        _medir("cadastro geempre completo", cache._consultar_dominio, max(args.n // 50, 2)),
+    ]
+    print(f"{len(cnpjs)} estabelecimentos | backend {args.backend}")
+    for r in resultados:
+        print(f"{r['consulta']:<28} n={r['n']:<5} p50 {r['p50_ms']:>8.3f} ms  p95 {r['p95_ms']:>8.3f} ms  "
+              f"p99 {r['p99_ms']:>8.3f} ms  linhas/consulta {r['linhas_media']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Benchmark de memória de /transmitir-pgdas com PDFs grandes: mostra que o
+pico de RSS não cresce com o tamanho do lote (PDFs no spool, resposta
+JSON escrita item a item).
+
+    python -m testes.bench_memoria_pdf [--tamanhos 25,50,100,200] [--pdf-kb 250]
+                                       [--modo simular] [--mongomock] [--sem-spool]
+                                       [--tracemalloc] [--saida memoria.json]
+
+• Cada tamanho roda num subprocesso novo (o pico de RSS é do processo),
+  com fixture SQLite do Domínio e simulador SERPRO em thread.
+• A resposta é consumida em streaming e descartada, como faria um
+  cliente; nada do corpo fica no processo.
+• RSS é amostrado a cada 5 ms durante a requisição. `transitorio_mb` é
+  o pico menos o RSS depois da requisição: o que o lote ocupou só
+  enquanto rodava. Com `--mongomock` os documentos gravados (com o PDF)
+  ficam no processo e entram no RSS final, por isso a coluna a olhar é
+  `transitorio_mb`; com Mongo de verdade (MONGODB_URI) o pico também fica plano.
+  O subprocesso roda com MALLOC_MMAP_THRESHOLD_ fixo para o glibc devolver
+  blocos grandes ao sistema ao liberar, senão o RSS final esconde o pico.
+• `--sem-spool` mantém os PDFs em memória (PDF_SPOOL_MIN_BYTES enorme),
+  para comparar; `--tracemalloc` soma o pico transitório do heap Python.
+• No Windows o RSS vem do psutil (working set), se instalado; sem ele,
+  as colunas de RSS passam a ser o heap Python (tracemalloc).
+"""
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List
+
+try:
+    import resource             # só Unix
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_PA = 202505
+_MARCADOR = "#bench_memoria_pdf "
+
+
+def _rss_mb() -> float:
+    """
+    RSS atual (Linux: /proc/self/statm; fora dele, psutil). Sem psutil: o
+    pico do processo no Unix (resource) ou o heap Python (tracemalloc).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+    return tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+
+
+class _Amostrador:
+    """Maior RSS visto enquanto o bloco roda."""
+
+    def __init__(self, intervalo: float = 0.005) -> None:
+        self.intervalo = intervalo
+        self.pico = 0.0
+        self._fim = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self) -> None:
+        while not self._fim.is_set():
+            self.pico = max(self.pico, _rss_mb())
+            self._fim.wait(self.intervalo)
+
+    def __enter__(self) -> "_Amostrador":
+        self.pico = _rss_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._fim.set()
+        self._thread.join()
+        self.pico = max(self.pico, _rss_mb())
+
+
+# ---------------------------------------------------------------------
+# subprocesso: um tamanho de lote
+# ---------------------------------------------------------------------
+def _filho(args: argparse.Namespace) -> Dict[str, Any]:
+    n = args.filho
+    tmp = Path(tempfile.mkdtemp(prefix="bench_memoria_pdf_"))
+    fixture = tmp / "dominio.sqlite"
+    os.environ.update(DOMINIO_BACKEND="sqlite", DOMINIO_FIXTURE=str(fixture), PDF_SPOOL_DIR=str(tmp / "spool"))
+    if args.sem_spool:
+        os.environ["PDF_SPOOL_MIN_BYTES"] = str(1 << 40)
+
+    from database.dominio_fixture import ConexaoSQLite, gerar_fixture
+    from testes.simulador_serpro import ConfigSimulador, gerar_certificados, iniciar_em_thread
+
+    gerar_fixture(fixture, grupos=[1] * n, meses=14, pa_final=_PA)
+    certs = gerar_certificados(tmp / "certs")
+    url, _ = iniciar_em_thread(ConfigSimulador(latencia_ms=0, pdf_kb=args.pdf_kb, semente=1))
+    os.environ.update(
+        GEEMPRE_CACHE_FILE=str(tmp / "geempre.json"), ARQUIVO_DIR=str(tmp / "json"),
+        URL_BASE=url, URL_AUTENTICACAO=f"{url}/token", MONITORAR_POLL_SEG="0.05",
+        CAMINHO_CERTIFICADO=str(certs), NOME_CERTIFICADO="cliente.pfx", SENHA_CERTIFICADO="simulador",
+        MONGO_DB="pgdas_bench_memoria", PREPARADOS_MAX_IDADE_SEG="0",
+    )
+    os.environ.setdefault("CONSUMER_KEY", "bench")
+    os.environ.setdefault("CONSUMER_SECRET", "bench")
+    if args.mongomock:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ.setdefault("MONGODB_URI", "mongodb://mongomock/pgdas_bench_memoria")
+
+    db = ConexaoSQLite(fixture)
+    db.connect()
+    cnpjs = [r[0] for r in db.execute_query("SELECT cgce_emp FROM bethadba.geempre ORDER BY codi_emp")]
+    db.close()
+
+    import logging
+    import main as aplicacao
+    from database import db_schema
+    from utils.modo_execucao import em_modo
+    logging.getLogger().setLevel(logging.WARNING)
+    with em_modo(args.modo):
+        db_schema._collection().delete_many({})
+
+    # aquece imports, token e caches com um CNPJ fora da medição
+    cliente = aplicacao.app.test_client()
+    corpo = {"pa": _PA, "tipoDeclaracao": 1, "modo": args.modo}
+    cliente.post("/transmitir-pgdas", json={**corpo, "cnpjs": cnpjs[:1]}).close()
+    cnpjs = cnpjs[1:]
+
+    # sem RSS disponível o amostrador lê o tracemalloc, que já precisa estar ligado
+    so_heap = not Path("/proc/self/statm").exists() and psutil is None and resource is None
+    if args.tracemalloc or so_heap:
+        tracemalloc.start()
+
+    antes = _rss_mb()
+    bytes_resposta = 0
+    t0 = time.perf_counter()
+    with _Amostrador() as amostra:
+        r = cliente.post("/transmitir-pgdas", json={**corpo, "cnpjs": cnpjs}, buffered=False)
+        for parte in r.response:
+            bytes_resposta += len(parte)
+        r.close()
+        del r
+    segundos = time.perf_counter() - t0
+
+    heap_transitorio = None
+    if args.tracemalloc:
+        atual, pico = tracemalloc.get_traced_memory()
+        heap_transitorio = round((pico - atual) / (1024 * 1024), 1)
+    if not so_heap:
+        tracemalloc.stop()
+
+    import gc
+    gc.collect()
+    depois = _rss_mb()
+    return {
+        "cnpjs": len(cnpjs),
+        "segundos": round(segundos, 2),
+        "resposta_mb": round(bytes_resposta / (1024 * 1024), 1),
+        "rss_antes_mb": round(antes, 1),
+        "pico_rss_mb": round(amostra.pico, 1),
+        "rss_depois_mb": round(depois, 1),
+        "transitorio_mb": round(amostra.pico - depois, 1),
+        "heap_transitorio_mb": heap_transitorio,
+    }
+
+
+# ---------------------------------------------------------------------
+# processo principal
+# ---------------------------------------------------------------------
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Pico de memória de /transmitir-pgdas por tamanho de lote")
+    ap.add_argument("--tamanhos", default="25,50,100,200", help="CNPJs por lote, separados por vírgula")
+    ap.add_argument("--pdf-kb", type=int, default=250, help="tamanho do PDF do simulador")
+    ap.add_argument("--modo", choices=("simular", "transmitir"), default="simular")
+    ap.add_argument("--mongomock", action="store_true", help="Mongo em memória (sem MONGODB_URI)")
+    ap.add_argument("--sem-spool", action="store_true", help="PDFs em memória, para comparar")
+    ap.add_argument("--tracemalloc", action="store_true", help="mede também o heap Python (mais lento)")
+    ap.add_argument("--saida", help="grava o relatório JSON neste arquivo")
+    ap.add_argument("--filho", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.filho:
+        # o pipeline também escreve no stdout: a linha do resultado leva um marcador
+        print(_MARCADOR + json.dumps(_filho(args)), flush=True)
+        return
+
+    repassar = [f"--pdf-kb={args.pdf_kb}", f"--modo={args.modo}"]
+    repassar += [f for f, ligado in (("--mongomock", args.mongomock), ("--sem-spool", args.sem_spool),
+                                     ("--tracemalloc", args.tracemalloc)) if ligado]
+    ambiente = {**os.environ, "MALLOC_MMAP_THRESHOLD_": str(64 * 1024)}
+
+    linhas: List[Dict[str, Any]] = []
+    for tamanho in (int(t) for t in args.tamanhos.split(",")):
+        saida = subprocess.run([sys.executable, "-m", "testes.bench_memoria_pdf", f"--filho={tamanho + 1}", *repassar],
+                               capture_output=True, text=True, env=ambiente, check=True).stdout
+        linha = json.loads(next(l for l in saida.splitlines() if l.startswith(_MARCADOR))[len(_MARCADOR):])
+        linhas.append(linha)
+        print(f"{linha['cnpjs']:>5} CNPJs em {linha['segundos']:>6.2f}s | resposta {linha['resposta_mb']:>7.1f} MB | "
+              f"RSS pico {linha['pico_rss_mb']:>7.1f} MB (antes {linha['rss_antes_mb']:.1f}, "
+              f"depois {linha['rss_depois_mb']:.1f}) | transitório {linha['transitorio_mb']:>6.1f} MB"
+              + (f" | heap {linha['heap_transitorio_mb']} MB" if linha["heap_transitorio_mb"] is not None else ""),
+              flush=True)
+
+    if len(linhas) > 1:
+        a, b = linhas[0], linhas[-1]
+        inclinacao = (b["transitorio_mb"] - a["transitorio_mb"]) / (b["cnpjs"] - a["cnpjs"]) * 100
+        print(f"transitório: {inclinacao:+.1f} MB a cada 100 CNPJs"
+              + ("" if args.sem_spool else " (compare com --sem-spool)"))
+    if args.saida:
+        Path(args.saida).write_text(json.dumps({"pdf_kb": args.pdf_kb, "modo": args.modo, "mongomock": args.mongomock,
+                                                "sem_spool": args.sem_spool, "linhas": linhas}, indent=2),
+                                    encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Benchmark ponta a ponta de /transmitir-pgdas e /gerar-das contra o
+simulador SERPRO (testes/simulador_serpro.py), sem tocar no gateway real.
+
+    python -m testes.bench_pipeline [--cnpjs 200] [--lote 1] [--concorrencia 8]
+                                    [--fluxo ambos] [--mtls] [--saida bench.json]
+                                    [--latencia-ms 120 --taxa-202 0.3 --taxa-5xx 0.01 ...]
+
+• Sobe o simulador em uma thread (ou usa `--url-simulador`), aponta
+  URL_BASE/URL_AUTENTICACAO para ele e importa a aplicação em processo.
+• Os CNPJs são sintéticos: o cadastro geempre vai para um cache local
+  temporário e `buscar_simples` devolve linhas geradas (anexo I, sem
+  folha), então o Domínio não é consultado. O Mongo é o de MONGODB_URI,
+  só num banco `pgdas_perf*` (MONGO_DB), esvaziado antes e depois da
+  rodada, ou em memória com `--mongomock`: os CNPJs sintéticos nunca
+  entram no banco de produção.
+• Cada requisição leva `--lote` CNPJs; `--concorrencia` requisições
+  rodam em paralelo. Relata vazão (CNPJ/s), p50/p95/p99 da latência por
+  requisição, status por resultado e pico de RSS do processo (que inclui
+  o simulador, quando em thread). No Windows, sem `resource`, o pico vem
+  do psutil, se instalado, ou do heap Python (tracemalloc).
+• Os payloads sintéticos são arquivados numa pasta temporária
+  (ARQUIVO_DIR), nunca no json/ de produção.
+"""
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from datetime import date
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+from testes.simulador_serpro import (
+    adicionar_argumentos, config_de_args, contexto_tls, gerar_certificados, iniciar_em_thread,
+)
+
+try:
+    import resource             # só Unix
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def _cnpjs(n: int, semente: int) -> List[str]:
+    rng = random.Random(semente)
+    raizes = rng.sample(range(10_000_000, 99_999_999), n)
+    return [f"{r:08d}0001{rng.randint(0, 99):02d}" for r in raizes]
+
+
+def _linhas_sinteticas(cnpjs: List[str], pa: int):
+    por_raiz = {c[:8]: (i + 1, c) for i, c in enumerate(cnpjs)}
+    data_sim = date(pa // 100, pa % 100, 1)
+
+    def buscar_simples(cnpj_raiz: str, pa: Any = None, **_: Any) -> List[Dict[str, Any]]:
+        codi_emp, cnpj = por_raiz.get(cnpj_raiz[:8], (None, None))
+        if codi_emp is None:
+            return []
+        return [{"codi_emp": codi_emp, "cgce_emp": cnpj, "filial": codi_emp, "anexo": 1, "secao": 1,
+                 "tabela": 1, "basen": 10_000 + codi_emp, "data_sim": data_sim}]
+    return buscar_simples
+
+
+def _percentis(valores: List[float]) -> Dict[str, float]:
+    if len(valores) < 2:
+        v = valores[0] if valores else 0.0
+        return {"p50": v, "p95": v, "p99": v}
+    q = statistics.quantiles(valores, n=100, method="inclusive")
+    return {"p50": round(q[49], 4), "p95": round(q[94], 4), "p99": round(q[98], 4)}
+
+
+def _pico_rss_mb() -> float:
+    """Pico de RSS (Unix), pico do working set (Windows, psutil) ou, sem eles, pico do heap Python."""
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024, 1)
+    if psutil is not None:
+        mem = psutil.Process().memory_info()
+        return round(getattr(mem, "peak_wset", mem.rss) / (1024 * 1024), 1)
+    return round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+
+
+def _limpar_mongo() -> None:
+    """
+    Esvazia as coleções que o benchmark grava; só num banco pgdas_perf*
+    (nunca o de produção), como a suíte de desempenho.
+    """
+    from database import db_schema
+    from database.checkpoint_lote import CHECKPOINT_COLLECTION
+    from utils.modo_execucao import MODOS, em_modo
+    if not db_schema.MONGO_DB.startswith("pgdas_perf"):
+        raise SystemExit(f"MONGO_DB={db_schema.MONGO_DB!r}: use um banco pgdas_perf* ou --mongomock")
+    for modo in MODOS:
+        with em_modo(modo):
+            db_schema._collection().delete_many({})
+    db_schema._das_collection().delete_many({})
+    db_schema.colecao(CHECKPOINT_COLLECTION).delete_many({})
+
+
+def _rodar(app, rota: str, corpos: List[Dict[str, Any]], concorrencia: int) -> Dict[str, Any]:
+    latencias: List[float] = []
+    status: Dict[str, int] = {}
+
+    def chamar(corpo: Dict[str, Any]) -> None:
+        cliente = app.test_client()
+        t0 = time.perf_counter()
+        r = cliente.post(rota, json=corpo)
+        corpo_resposta = r.get_json() or {}      # a resposta é escrita item a item: mede até o fim
+        latencias.append(time.perf_counter() - t0)
+        for resultado in corpo_resposta.get("resultados", []):
+            chave = resultado.get("status", "?")
+            status[chave] = status.get(chave, 0) + 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        list(pool.map(chamar, corpos))
+    total = time.perf_counter() - inicio
+
+    qtd = sum(len(c["cnpjs"]) for c in corpos)
+    return {
+        "rota": rota,
+        "cnpjs": qtd,
+        "requisicoes": len(corpos),
+        "segundos": round(total, 3),
+        "cnpjs_por_segundo": round(qtd / total, 2) if total else 0.0,
+        "latencia_requisicao_s": _percentis(latencias),
+        "status": status,
+        "pico_rss_mb": _pico_rss_mb(),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark do pipeline contra o simulador SERPRO")
+    ap.add_argument("--cnpjs", type=int, default=200)
+    ap.add_argument("--lote", type=int, default=1, help="CNPJs por requisição")
+    ap.add_argument("--concorrencia", type=int, default=8)
+    ap.add_argument("--pa", type=int, default=202505)
+    ap.add_argument("--fluxo", choices=("pgdas", "das", "ambos"), default="ambos")
+    ap.add_argument("--url-simulador", help="usa um simulador já rodando em vez de subir um em thread")
+    ap.add_argument("--mtls", action="store_true", help="simulador em https exigindo certificado de cliente")
+    ap.add_argument("--poll-seg", type=float, default=0.2, help="intervalo de polling do Monitorar")
+    ap.add_argument("--saida", help="grava o relatório JSON neste arquivo")
+    ap.add_argument("--mongomock", action="store_true", help="Mongo em memória (mongomock) em vez de MONGODB_URI")
+    adicionar_argumentos(ap)
+    args = ap.parse_args()
+    semente = args.semente if args.semente is not None else int(time.time())
+    if resource is None and psutil is None:
+        tracemalloc.start()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    cnpjs = _cnpjs(args.cnpjs, semente)
+
+    # ----- simulador
+    url = args.url_simulador
+    if not url:
+        ctx = None
+        if args.mtls:
+            certs = gerar_certificados(tmp / "certs")
+            ctx = contexto_tls(str(certs / "servidor.pem"), str(certs / "servidor.key"), str(certs / "ca.pem"))
+            os.environ.update(CAMINHO_CERTIFICADO=str(certs), NOME_CERTIFICADO="cliente.pfx",
+                              SENHA_CERTIFICADO="simulador", REQUESTS_CA_BUNDLE=str(certs / "ca.pem"))
+        url, _ = iniciar_em_thread(config_de_args(args), ssl_context=ctx)
+    if "CAMINHO_CERTIFICADO" not in os.environ:
+        certs = gerar_certificados(tmp / "certs")
+        os.environ.update(CAMINHO_CERTIFICADO=str(certs), NOME_CERTIFICADO="cliente.pfx",
+                          SENHA_CERTIFICADO="simulador")
+
+    # ----- ambiente da aplicação (antes de importar main)
+    cache = tmp / "geempre.json"
+    cache.write_text(json.dumps({"carregado_em": time.time(), "empresas": [
+        {"codi_emp": i + 1, "cnpj": c} for i, c in enumerate(cnpjs)]}), encoding="utf-8")
+    os.environ.update(URL_BASE=url, URL_AUTENTICACAO=f"{url}/token", GEEMPRE_CACHE_FILE=str(cache),
+                      MONITORAR_POLL_SEG=str(args.poll_seg), ARQUIVO_DIR=str(tmp / "json"))
+    os.environ.setdefault("CONSUMER_KEY", "bench")
+    os.environ.setdefault("CONSUMER_SECRET", "bench")
+    if args.mongomock:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ["MONGODB_URI"] = "mongodb://mongomock/pgdas_perf_bench"
+        os.environ["MONGO_DB"] = "pgdas_perf_bench"
+    if not os.getenv("MONGO_DB", "pgdas").startswith("pgdas_perf"):
+        # antes de importar a aplicação: nada toca o banco de produção
+        raise SystemExit(f"MONGO_DB={os.getenv('MONGO_DB', 'pgdas')!r}: use um banco pgdas_perf* ou --mongomock")
+
+    import utils.pipeline as pipeline
+    import main as aplicacao
+    from utils.modo_execucao import diretorio_arquivo
+    if tmp.resolve() not in diretorio_arquivo().resolve().parents:
+        # não arquiva payload sintético na pasta de produção
+        raise SystemExit(f"ARQUIVO_DIR não respeitado: arquivaria em {diretorio_arquivo()}")
+    pipeline.buscar_simples = _linhas_sinteticas(cnpjs, args.pa)
+    _limpar_mongo()
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    lotes = [cnpjs[i:i + args.lote] for i in range(0, len(cnpjs), args.lote)]
+    relatorio: Dict[str, Any] = {"simulador": url, "semente": semente, "lote": args.lote,
+                                 "concorrencia": args.concorrencia, "resultados": []}
+    try:
+        if args.fluxo in ("pgdas", "ambos"):
+            relatorio["resultados"].append(_rodar(aplicacao.app, "/transmitir-pgdas", [
+                {"pa": args.pa, "tipoDeclaracao": 1, "cnpjs": lote} for lote in lotes], args.concorrencia))
+        if args.fluxo in ("das", "ambos"):
+            relatorio["resultados"].append(_rodar(aplicacao.app, "/gerar-das", [
+                {"pa": args.pa, "cnpjs": lote} for lote in lotes], args.concorrencia))
+    finally:
+        _limpar_mongo()
+
+    for r in relatorio["resultados"]:
+        lat = r["latencia_requisicao_s"]
+        print(f"{r['rota']:<18} {r['cnpjs']:>6} CNPJs em {r['segundos']:>8.2f}s "
+              f"→ {r['cnpjs_por_segundo']:>8.2f} CNPJ/s | p50 {lat['p50']:.3f}s p95 {lat['p95']:.3f}s "
+              f"p99 {lat['p99']:.3f}s | RSS pico {r['pico_rss_mb']} MB | {r['status']}")
+    if args.saida:
+        Path(args.saida).write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
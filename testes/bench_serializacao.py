@@ -0,0 +1,105 @@
+"""
+Microbenchmark da serialização: envelope PGDAS e ida-e-volta da resposta.
+
+    python -m testes.bench_serializacao [--estab 50] [--pdf-kb 800] [--n 200]
+
+Compara stdlib `json` × `orjson` (se instalado) em:
+  • envelope: payload → dados (str) → envelope → bytes, serializando
+    o payload 2× (envelope + arquivo) ou 1× reaproveitando os bytes;
+  • resposta: corpo HTTP com `dados` contendo PDF base64 → loads do
+    corpo → loads de `dados`.
+"""
+import os
+import base64
+import argparse
+import timeit
+from utils import serializacao
+from utils.uploader_serpro import SerproClient
+
+
+def _payload(n_estab: int) -> dict:
+    estabelecimentos = []
+    for i in range(n_estab):
+        estabelecimentos.append({
+            "cnpjCompleto": f"11371445{i + 1:04d}00",
+            "atividades": [{
+                "idAtividade": ida,
+                "valorAtividade": 1234.56 * (ida + 1),
+                "receitasAtividade": [{"valor": 1234.56 * (ida + 1),
+                                       "qualificacoesTributarias": [{"codigoTributo": "1007", "id": 8}]}],
+            } for ida in (1, 2, 5)],
+        })
+    return {
+        "cnpjCompleto": "11371445000102",
+        "pa": 202505,
+        "indicadorTransmissao": False,
+        "indicadorComparacao": False,
+        "declaracao": {
+            "tipoDeclaracao": 1,
+            "receitaPaCompetenciaInterno": 98765.43,
+            "receitaPaCompetenciaExterno": 0.0,
+            "folhasSalario": [{"pa": 202400 + m, "valor": 15000.0} for m in range(1, 13)],
+            "estabelecimentos": estabelecimentos,
+        },
+    }
+
+
+def _resposta(pdf_kb: int) -> bytes:
+    pdf_b64 = base64.b64encode(os.urandom(pdf_kb * 1024)).decode()
+    interno = {
+        "idDeclaracao": "00000000202505001",
+        "recibo": "123.456.789.000001",
+        "declaracao": pdf_b64,
+        "valoresDevidos": [{"codigoTributo": c, "valor": 123.45} for c in (1001, 1002, 1004, 1005, 1006, 1007)],
+    }
+    corpo = {"status": 200, "mensagens": [], "dados": serializacao.dumps_str(interno)}
+    return serializacao.dumps(corpo)
+
+
+def _cliente() -> SerproClient:
+    # sem TokenAutenticacao: só o envelope interessa aqui
+    cli = SerproClient.__new__(SerproClient)
+    cli.cnpj_cont = "00000000000100"
+    cli.tipo_doc = 2
+    return cli
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--estab", type=int, default=50, help="estabelecimentos no payload")
+    parser.add_argument("--pdf-kb", type=int, default=800, help="tamanho do PDF antes do base64")
+    parser.add_argument("--n", type=int, default=200, help="repetições por medição")
+    args = parser.parse_args()
+
+    cli = _cliente()
+    payload = _payload(args.estab)
+    resposta = _resposta(args.pdf_kb)
+
+    def envelope_2x():
+        serializacao.dumps(cli._build_envelope("pgdas", payload))
+        serializacao.dumps(payload)                      # arquivo
+
+    def envelope_1x():
+        dados = serializacao.dumps(payload)
+        serializacao.dumps(cli._build_envelope("pgdas", payload, dados))
+
+    def resposta_ida_volta():
+        corpo = serializacao.loads(resposta)
+        serializacao.loads(corpo["dados"])
+
+    print(f"payload {len(serializacao.dumps(payload)) / 1024:.1f} KiB · "
+          f"resposta {len(resposta) / 1024:.1f} KiB · n={args.n}")
+    print(f"{'backend':<8} {'envelope 2x':>14} {'envelope 1x':>14} {'resposta':>14}   (µs/op)")
+    for backend in ("json", "orjson"):
+        if serializacao.usar_backend(backend) != backend:
+            print(f"{backend:<8} (não instalado)")
+            continue
+        tempos = [
+            min(timeit.repeat(fn, number=args.n, repeat=3)) / args.n * 1e6
+            for fn in (envelope_2x, envelope_1x, resposta_ida_volta)
+        ]
+        print(f"{backend:<8} " + " ".join(f"{t:>14.1f}" for t in tempos))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Testes de comportamento da fila, do reconciliador e do escalonador.
+
+    python -m testes.comportamento [--casos lease_perdido,retentativa,...]
+
+Roda offline, como a suíte de desempenho (testes/perf/suite.py): Domínio
+sintético, simulador SERPRO em thread e Mongo em memória (mongomock).
+Cada caso confere uma garantia que só aparece em concorrência ou falha:
+  • lease_perdido: tarefa reassumida por outro worker antes do envio não
+    chama o /Declarar e não é concluída por este worker;
+  • retentativa: worker que caiu depois de declarar — a nova tentativa
+    encontra a declaração e não reenvia;
+  • esgotadas: `falhar` e `encerrar_esgotadas` levam a tarefa a ERRO
+    depois de FILA_MAX_TENTATIVAS e ela não é mais reivindicada;
+  • reconciliador: `assumir_pedido` deixa um só processo com cada pedido
+    parado (PENDENTE antigo ou FALHA por prazo);
+  • escalonador: faixa urgente primeiro e, na normal, lotes alternados
+    pela fila justa (WFQ) mesmo com tamanhos diferentes;
+  • retomar_retificadora: lote de retificadora interrompido não toma o
+    SUCESSO de uma declaração anterior ao lote como seu — envia o CNPJ
+    que não chegou a ser enviado e manda para revisão o que foi.
+
+Sai com código 1 se algum caso falhar.
+"""
+from __future__ import annotations
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import contextlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from testes.perf import suite
+
+_PA = suite._PA
+
+
+class Falha(AssertionError):
+    pass
+
+
+def _verificar(condicao: bool, mensagem: str) -> None:
+    if not condicao:
+        raise Falha(mensagem)
+
+
+# ---------------------------------------------------------------------
+# apoio
+# ---------------------------------------------------------------------
+def _chamadas(rota: str) -> int:
+    """Chamadas que o simulador SERPRO recebeu em `rota` até agora."""
+    import requests
+    return requests.get(f"{os.environ['URL_BASE']}/_contagem", timeout=5).json().get(rota, 0)
+
+
+def _limpar() -> None:
+    """Esvazia declarações (nos dois modos), DAS, fila e checkpoints do banco de perf."""
+    from database import db_schema, fila_tarefas
+    from database.checkpoint_lote import _lotes
+    from utils.modo_execucao import MODOS, em_modo
+
+    for modo in MODOS:
+        with em_modo(modo):
+            suite._limpar_mongo()
+    fila_tarefas._fila().delete_many({})
+    _lotes().delete_many({})
+    fila_tarefas.init_fila()
+    db_schema.init_db()
+
+
+def _worker_ate_esvaziar() -> None:
+    from utils.trabalhador_fila import Trabalhador
+    Trabalhador(threads=1, lease_seg=30, ate_esvaziar=True).rodar()
+
+
+# ---------------------------------------------------------------------
+# casos
+# ---------------------------------------------------------------------
+def caso_lease_perdido(ctx: Dict[str, Any]) -> None:
+    from database import fila_tarefas as fila
+    from utils import trabalhador_fila
+
+    cnpj = ctx["matrizes"][-1]
+    lote = fila.enfileirar_pgdas([cnpj], _PA, 1)["lote"]
+    original = trabalhador_fila.executar_tarefa
+
+    def reassumida(tarefa: Dict[str, Any]) -> Dict[str, Any]:
+        # outro worker reassume a tarefa enquanto este monta o payload
+        fila._fila().update_one({"_id": tarefa["_id"]}, {"$set": {"worker": "outro:1:0"}})
+        return original(tarefa)
+
+    antes = _chamadas("Declarar")
+    trabalhador_fila.executar_tarefa = reassumida
+    try:
+        _worker_ate_esvaziar()
+    finally:
+        trabalhador_fila.executar_tarefa = original
+
+    tarefa = fila._fila().find_one({"lote": lote})
+    _verificar(_chamadas("Declarar") == antes, "lease perdido e mesmo assim chamou o /Declarar")
+    _verificar(tarefa["status"] == "EXECUTANDO" and tarefa["worker"] == "outro:1:0",
+               f"tarefa reassumida foi alterada por quem perdeu o lease: {tarefa['status']}")
+
+
+def caso_retentativa(ctx: Dict[str, Any]) -> None:
+    from database import fila_tarefas as fila
+    from utils.modo_execucao import em_modo
+    from utils.pipeline import processar_pgdas
+
+    cnpj = ctx["matrizes"][-2]
+    lote = fila.enfileirar_pgdas([cnpj], _PA, 1)["lote"]
+    # 1ª tentativa: declara e o worker cai antes de concluir (lease vence na hora)
+    tarefa = fila.reivindicar("caido:1:0", lease_seg=0)
+    with em_modo(tarefa["modo"]):
+        primeira = processar_pgdas(cnpj, _PA, 1)
+    _verificar(primeira["status"] == "SUCESSO", f"1ª tentativa terminou em {primeira['status']}")
+    time.sleep(0.01)
+
+    antes = _chamadas("Declarar")
+    _worker_ate_esvaziar()
+    tarefa = fila._fila().find_one({"lote": lote})
+    _verificar(_chamadas("Declarar") == antes, "nova tentativa reenviou declaração já gravada")
+    _verificar(tarefa["status"] == "CONCLUIDA" and tarefa["tentativas"] == 2,
+               f"tarefa ficou {tarefa['status']} com {tarefa['tentativas']} tentativas")
+    _verificar(tarefa["resultado"].get("reconciliado") is True, f"resultado sem reconciliado: {tarefa['resultado']}")
+
+
+def caso_esgotadas(ctx: Dict[str, Any]) -> None:
+    from database import fila_tarefas as fila
+
+    # erro do worker em todas as tentativas → falhar devolve à fila até esgotar
+    lote = fila.enfileirar_pgdas([ctx["matrizes"][-3]], _PA, 1)["lote"]
+    for tentativa in range(1, fila.FILA_MAX_TENTATIVAS + 1):
+        tarefa = fila.reivindicar("w:1:0")
+        _verificar(tarefa is not None and tarefa["tentativas"] == tentativa,
+                   f"tentativa {tentativa} não foi reivindicada")
+        fila.falhar(tarefa["_id"], "w:1:0", "erro simulado", tarefa["tentativas"])
+    tarefa = fila._fila().find_one({"lote": lote})
+    _verificar(tarefa["status"] == "ERRO", f"falhar esgotado deixou a tarefa em {tarefa['status']}")
+    _verificar(fila.reivindicar("w:1:0") is None, "tarefa em ERRO voltou a ser reivindicada")
+
+    # worker morre em todas as tentativas → lease vence; encerrar_esgotadas fecha
+    lote = fila.enfileirar_pgdas([ctx["matrizes"][-4]], _PA, 1)["lote"]
+    for _ in range(fila.FILA_MAX_TENTATIVAS):
+        _verificar(fila.reivindicar("w:1:0", lease_seg=0) is not None, "lease vencido não foi reivindicado")
+        time.sleep(0.01)
+    _verificar(fila.reivindicar("w:1:0") is None, "tarefa sem tentativas restantes foi reivindicada")
+    _verificar(fila.encerrar_esgotadas() == 1, "encerrar_esgotadas não encerrou a tarefa")
+    tarefa = fila._fila().find_one({"lote": lote})
+    _verificar(tarefa["status"] == "ERRO", f"lease esgotado deixou a tarefa em {tarefa['status']}")
+    status = fila.status_lote(lote)
+    _verificar(status["finalizado"], f"lote com tarefa em ERRO não finalizou: {status}")
+
+
+def caso_reconciliador(ctx: Dict[str, Any]) -> None:
+    from database import db_schema
+
+    antigo = (datetime.now() - timedelta(hours=1)).isoformat(timespec="seconds")
+    pendente, excedido = ctx["matrizes"][-5], ctx["matrizes"][-6]
+    db_schema.registrar_pedido(pendente, _PA, 1, {"cnpjCompleto": pendente}, "rid-pendente")
+    db_schema._collection().update_one({"_id": db_schema._make_cnpj_pa_id(pendente, _PA, 1)},
+                                       {"$set": {"aguardando_desde": antigo}})
+    db_schema.registrar_pedido(excedido, _PA, 1, {"cnpjCompleto": excedido}, "rid-excedido")
+    db_schema.marcar_monitorar_excedido(excedido, _PA, 1, "rid-excedido", "prazo do /Monitorar")
+
+    parados = {d["cnpj"]: d for d in db_schema.pedidos_parados(60, 10)}
+    _verificar(set(parados) == {pendente, excedido}, f"pedidos parados inesperados: {sorted(parados)}")
+
+    # quatro instâncias disputam cada pedido com o mesmo documento lido
+    for cnpj, doc in parados.items():
+        ganhos: List[bool] = []
+        threads = [threading.Thread(target=lambda: ganhos.append(db_schema.assumir_pedido(dict(doc))))
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        _verificar(ganhos.count(True) == 1, f"{cnpj}: {ganhos.count(True)} instâncias assumiram o pedido")
+        _verificar(not db_schema.assumir_pedido(doc), f"{cnpj}: documento antigo reassumiu o pedido")
+    _verificar(not db_schema.pedidos_parados(60, 10), "pedido assumido continua parado")
+
+
+def caso_escalonador(ctx: Dict[str, Any]) -> None:
+    from utils.escalonador_serpro import Escalonador, submissor
+
+    esc = Escalonador(1)
+    ordem: List[str] = []
+    soltar = threading.Event()
+    ocupado = threading.Event()
+
+    def ocupar() -> None:
+        with submissor("ocupante"), esc.vaga():
+            ocupado.set()
+            soltar.wait()
+
+    def chamar(nome: str, faixa: str) -> None:
+        with submissor(nome[0], faixa=faixa), esc.vaga():
+            ordem.append(nome)
+
+    threads = [threading.Thread(target=ocupar)]
+    threads[0].start()
+    ocupado.wait()
+    # chegam, nesta ordem: 4 chamadas do lote A, 2 do B e 1 urgente
+    for nome, faixa in [("A1", "normal"), ("A2", "normal"), ("A3", "normal"), ("A4", "normal"),
+                        ("B1", "normal"), ("B2", "normal"), ("U1", "urgente")]:
+        threads.append(threading.Thread(target=chamar, args=(nome, faixa)))
+        threads[-1].start()
+        na_fila = len(threads) - 1
+        while sum(len(f) for f in esc._filas.values()) < na_fila:
+            time.sleep(0.001)
+    soltar.set()
+    for t in threads:
+        t.join()
+    esperado = ["U1", "A1", "B1", "A2", "B2", "A3", "A4"]
+    _verificar(ordem == esperado, f"ordem {ordem}, esperado {esperado}")
+
+
+def caso_retomar_retificadora(ctx: Dict[str, Any]) -> None:
+    from database import checkpoint_lote, db_schema
+    from utils import lote_pgdas
+    from utils.modo_execucao import em_modo
+
+    feito, nao_enviado, enviado = ctx["matrizes"][-9:-6]
+    antigo = (datetime.now() - timedelta(hours=1)).isoformat(timespec="seconds")
+    with em_modo("transmitir"):
+        # retificadoras de um fechamento anterior, já em SUCESSO
+        for cnpj in (nao_enviado, enviado):
+            db_schema._collection().insert_one({
+                "_id": db_schema._make_cnpj_pa_id(cnpj, _PA, 2), "cnpj": cnpj, "pa": _PA,
+                "tipoDeclaracao": 2, "status": "SUCESSO", "criado_em": antigo})
+        lote = lote_pgdas.abrir([feito, nao_enviado, enviado], _PA, 2)
+        # o processo cai: um CNPJ terminou, outro foi enviado sem resposta gravada
+        lote_pgdas.processar_cnpj(lote, feito, _PA, 2)
+        with checkpoint_lote.acompanhar(lote, enviado):
+            checkpoint_lote.etapa("ENVIADO")
+
+        antes = _chamadas("Declarar")
+        resultados = {r["cnpj"]: r for r in lote_pgdas.retomar(lote)}
+
+    _verificar(set(resultados) == {nao_enviado, enviado}, f"retomar devolveu {sorted(resultados)}")
+    r = resultados[nao_enviado]
+    _verificar(r["status"] == "SUCESSO" and not r.get("reconciliado"),
+               f"SUCESSO anterior ao lote foi tomado como deste lote: {r}")
+    r = resultados[enviado]
+    _verificar(r["status"] == "FALHA" and r.get("revisao_manual"),
+               f"retificadora enviada sem resposta não foi para revisão: {r}")
+    _verificar(_chamadas("Declarar") == antes + 1, "retomar não enviou só o CNPJ que faltava")
+
+
+CASOS: Dict[str, Callable[[Dict[str, Any]], None]] = {
+    "lease_perdido": caso_lease_perdido,
+    "retentativa": caso_retentativa,
+    "esgotadas": caso_esgotadas,
+    "reconciliador": caso_reconciliador,
+    "escalonador": caso_escalonador,
+    "retomar_retificadora": caso_retomar_retificadora,
+}
+
+
+# ---------------------------------------------------------------------
+# comandos
+# ---------------------------------------------------------------------
+def rodar(casos: List[str]) -> List[str]:
+    """Roda os casos num Mongo em memória; devolve os que falharam."""
+    tmp = Path(tempfile.mkdtemp(prefix="comportamento_"))
+    ctx = suite._preparar_ambiente(tmp, True)
+    logging.disable(logging.WARNING)
+
+    falhas = []
+    for nome in casos:
+        _limpar()
+        t0 = time.perf_counter()
+        try:
+            with open(os.devnull, "w") as mudo, contextlib.redirect_stdout(mudo):   # prints do json_builder
+                CASOS[nome](ctx)
+        except Falha as e:
+            falhas.append(nome)
+            print(f"FALHA {nome:<20} {e}")
+            continue
+        print(f"ok    {nome:<20} {time.perf_counter() - t0:6.2f}s")
+    return falhas
+
+
+def _cli(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Testes de comportamento da fila, reconciliador e escalonador")
+    ap.add_argument("--casos", default=",".join(CASOS), help="lista separada por vírgula")
+    args = ap.parse_args(argv)
+
+    casos = [c.strip() for c in args.casos.split(",") if c.strip()]
+    desconhecidos = set(casos) - set(CASOS)
+    if desconhecidos:
+        ap.error(f"casos desconhecidos: {', '.join(sorted(desconhecidos))}")
+    return 1 if rodar(casos) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_cli())
@@ -1,7 +1,7 @@
 # scripts/make_segment_rules.py
 from pathlib import Path
 from datetime import datetime, date
-from database.dominio_db import DatabaseConnection, DB_PARAMS
+from database.dominio_db import DatabaseConnection, parametros_db
 
 SQL = """
 SELECT  t.anexo,
@@ -23,7 +23,7 @@ ORDER BY t.anexo, t.secao, t.tabela
 """
 
 # ─── consulta ───────────────────────────────────────────────
-db = DatabaseConnection(**DB_PARAMS)
+db = DatabaseConnection(**parametros_db())
 db.connect()
 rows = db.execute_query(SQL)
 db.close()
@@ -0,0 +1,275 @@
+"""
+Suíte de regressão de desempenho com baselines em JSON.
+
+    python -m testes.perf.suite rodar   [--saida perf-atual.json] [--casos montar_json,envelope,mongo,pipeline]
+                                        [--mongomock] [--repeticoes 20]
+    python -m testes.perf.suite comparar BASELINE.json ATUAL.json [--limite 0.25] [--folga-ms 0.5]
+
+`rodar` executa os casos offline e grava as métricas:
+  • montar_json em grupos pequeno (1), médio (20) e enorme (300
+    estabelecimentos), com linhas e folha vindas da base sintética
+    do Domínio (database/dominio_fixture.py);
+  • envelope: payload → dados → envelope → bytes (serialização);
+  • mongo: insert_transmission + update_success por segundo, no Mongo de
+    MONGODB_URI (banco MONGO_DB, padrão `pgdas_perf`) ou em mongomock;
+  • pipeline: /transmitir-pgdas completo com Domínio sintético e o
+    simulador SERPRO (testes/simulador_serpro.py) sem latência.
+
+`comparar` falha (código 1) quando alguma métrica piora além de
+`--limite` (fração) em relação ao baseline. Baselines são por máquina:
+grave um com `rodar --saida testes/perf/baselines/<maquina>.json`.
+"""
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import contextlib
+import platform
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+Metricas = Dict[str, Dict[str, Any]]
+
+_GRUPOS = {"pequeno": 1, "medio": 20, "enorme": 300}
+_PA = 202505
+_CNPJS_PIPELINE = 40
+
+
+# ---------------------------------------------------------------------
+# cronômetro
+# ---------------------------------------------------------------------
+def _cronometrar(fn: Callable[[], Any], repeticoes: int, aquecimento: int = 1) -> List[float]:
+    for _ in range(aquecimento):
+        fn()
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        fn()
+        tempos.append((time.perf_counter() - t0) * 1000)
+    return tempos
+
+
+def _resumo(prefixo: str, tempos_ms: List[float]) -> Metricas:
+    q = statistics.quantiles(tempos_ms, n=20, method="inclusive") if len(tempos_ms) > 1 else [tempos_ms[0]] * 19
+    return {
+        f"{prefixo}.p50_ms": {"valor": round(statistics.median(tempos_ms), 3), "melhor": "menor"},
+        f"{prefixo}.p95_ms": {"valor": round(q[18], 3), "melhor": "menor"},
+    }
+
+
+# ---------------------------------------------------------------------
+# ambiente (antes de importar a aplicação)
+# ---------------------------------------------------------------------
+def _preparar_ambiente(tmp: Path, mongomock: bool) -> Dict[str, Any]:
+    # DOMINIO_* são lidas no import do dominio_db: definir antes de importar
+    fixture = tmp / "dominio.sqlite"
+    os.environ.update(DOMINIO_BACKEND="sqlite", DOMINIO_FIXTURE=str(fixture))
+    from database.dominio_fixture import ConexaoSQLite, gerar_fixture
+    from testes.simulador_serpro import ConfigSimulador, gerar_certificados, iniciar_em_thread
+
+    grupos = list(_GRUPOS.values()) + [1] * _CNPJS_PIPELINE
+    gerar_fixture(fixture, grupos=grupos, meses=14, pa_final=_PA)
+    certs = gerar_certificados(tmp / "certs")
+    url, _ = iniciar_em_thread(ConfigSimulador(latencia_ms=0, pdf_kb=250, semente=1))
+
+    os.environ.update(
+        GEEMPRE_CACHE_FILE=str(tmp / "geempre.json"), ARQUIVO_DIR=str(tmp / "json"),
+        URL_BASE=url, URL_AUTENTICACAO=f"{url}/token", MONITORAR_POLL_SEG="0.05",
+        CAMINHO_CERTIFICADO=str(certs), NOME_CERTIFICADO="cliente.pfx", SENHA_CERTIFICADO="simulador",
+    )
+    os.environ.setdefault("MONGO_DB", "pgdas_perf")
+    os.environ.setdefault("CONSUMER_KEY", "perf")
+    os.environ.setdefault("CONSUMER_SECRET", "perf")
+    if mongomock:
+        import mongomock as _mongomock
+        import pymongo
+        pymongo.MongoClient = _mongomock.MongoClient
+        os.environ.setdefault("MONGODB_URI", "mongodb://mongomock/pgdas_perf")
+
+    # matriz de cada grupo, na ordem em que a fixture gerou
+    db = ConexaoSQLite(fixture)
+    db.connect()
+    cnpjs = [r[0] for r in db.execute_query("SELECT cgce_emp FROM bethadba.geempre ORDER BY codi_emp")]
+    db.close()
+    matrizes: Dict[str, str] = {}
+    for cnpj in cnpjs:
+        matrizes.setdefault(cnpj[:8], cnpj)
+    return {"matrizes": list(matrizes.values())}
+
+
+def _limpar_mongo() -> None:
+    """Só esvazia as coleções quando o banco é o de perf (nunca o de produção)."""
+    from database import db_schema
+    if not db_schema.MONGO_DB.startswith("pgdas_perf"):
+        raise SystemExit(f"MONGO_DB={db_schema.MONGO_DB!r}: use um banco pgdas_perf* para a suíte")
+    db_schema._collection().delete_many({})
+    db_schema._das_collection().delete_many({})
+    db_schema.init_db()
+
+
+# ---------------------------------------------------------------------
+# casos
+# ---------------------------------------------------------------------
+def caso_montar_json(ctx: Dict[str, Any], repeticoes: int) -> Metricas:
+    from database.dominio_db import buscar_simples
+    from utils.json_builder import montar_json
+
+    metricas: Metricas = {}
+    for nome, matriz in zip(_GRUPOS, ctx["matrizes"]):
+        rows = buscar_simples(matriz, pa=_PA)
+        reps = max(repeticoes // (5 if nome == "enorme" else 1), 3)
+        metricas.update(_resumo(f"montar_json.{nome}", _cronometrar(lambda: montar_json(rows, 1), reps)))
+    return metricas
+
+
+def caso_envelope(ctx: Dict[str, Any], repeticoes: int) -> Metricas:
+    from utils.serializacao import dumps
+    from testes.bench_serializacao import _payload, _cliente
+
+    client = _cliente()
+    metricas: Metricas = {}
+    for nome, n_estab in (("medio", 20), ("enorme", 300)):
+        payload = _payload(n_estab)
+
+        def envelope():
+            dados = dumps(payload)
+            return dumps(client._build_envelope("pgdas", payload, dados_json=dados))
+        metricas.update(_resumo(f"envelope.{nome}", _cronometrar(envelope, repeticoes * 10)))
+    return metricas
+
+
+def caso_mongo(ctx: Dict[str, Any], repeticoes: int) -> Metricas:
+    from database.db_schema import insert_transmission, update_success
+    from utils.resposta_serpro import RespostaPgdas
+    from testes.bench_serializacao import _payload, _resposta
+    from utils.serializacao import loads
+
+    _limpar_mongo()
+    payload = _payload(5)
+    resposta = RespostaPgdas.de_http({"status": 200, "body": loads(_resposta(250))})
+    n = repeticoes * 25
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        cnpj = f"{i:08d}000100"
+        insert_transmission(cnpj, _PA, 1, payload)
+        update_success(cnpj, _PA, 1, resposta)
+    total = time.perf_counter() - t0
+    return {"mongo.gravacoes_por_s": {"valor": round(n / total, 1), "melhor": "maior"}}
+
+
+def caso_pipeline(ctx: Dict[str, Any], repeticoes: int) -> Metricas:
+    import main as aplicacao
+
+    _limpar_mongo()
+    cliente = aplicacao.app.test_client()
+    cnpjs = ctx["matrizes"][len(_GRUPOS):]
+    latencias: List[float] = []
+
+    t0 = time.perf_counter()
+    for cnpj in cnpjs:
+        ti = time.perf_counter()
+        r = cliente.post("/transmitir-pgdas", json={"pa": _PA, "tipoDeclaracao": 1, "cnpjs": [cnpj]})
+        status = r.get_json()["resultados"][0]["status"]   # a resposta é streaming: o corpo entra no tempo
+        latencias.append((time.perf_counter() - ti) * 1000)
+        if status != "SUCESSO":
+            raise SystemExit(f"pipeline: {cnpj} terminou em {status}: {r.get_json()}")
+    total = time.perf_counter() - t0
+
+    metricas = _resumo("pipeline.cnpj", latencias)
+    metricas["pipeline.cnpjs_por_s"] = {"valor": round(len(cnpjs) / total, 2), "melhor": "maior"}
+    return metricas
+
+
+CASOS: Dict[str, Callable[[Dict[str, Any], int], Metricas]] = {
+    "montar_json": caso_montar_json,
+    "envelope": caso_envelope,
+    "mongo": caso_mongo,
+    "pipeline": caso_pipeline,
+}
+
+
+# ---------------------------------------------------------------------
+# comandos
+# ---------------------------------------------------------------------
+def rodar(casos: List[str], repeticoes: int, mongomock: bool) -> Dict[str, Any]:
+    import logging
+    tmp = Path(tempfile.mkdtemp(prefix="perf_"))
+    ctx = _preparar_ambiente(tmp, mongomock)
+    logging.disable(logging.WARNING)
+
+    metricas: Metricas = {}
+    for nome in casos:
+        t0 = time.perf_counter()
+        with open(os.devnull, "w") as mudo, contextlib.redirect_stdout(mudo):   # prints do json_builder
+            metricas.update(CASOS[nome](ctx, repeticoes))
+        print(f"  {nome:<12} {time.perf_counter() - t0:6.1f}s", file=sys.stderr)
+    return {
+        "meta": {"data": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "maquina": platform.node(), "mongo": "mongomock" if mongomock else "MONGODB_URI"},
+        "metricas": metricas,
+    }
+
+
+def comparar(base: Dict[str, Any], atual: Dict[str, Any], limite: float, folga_ms: float) -> List[str]:
+    """Linhas de relatório; as que começam com 'REGRESSÃO' reprovam."""
+    linhas = []
+    for nome, ref in sorted(base["metricas"].items()):
+        nova = atual["metricas"].get(nome)
+        if nova is None:
+            linhas.append(f"AUSENTE    {nome}")
+            continue
+        antes, depois = ref["valor"], nova["valor"]
+        variacao = (depois - antes) / antes if antes else 0.0
+        if ref.get("melhor", "menor") == "menor":
+            piorou = variacao > limite and (not nome.endswith("_ms") or depois - antes > folga_ms)
+        else:
+            piorou = -variacao > limite
+        marca = "REGRESSÃO " if piorou else "ok        "
+        linhas.append(f"{marca} {nome:<32} {antes:>12.3f} → {depois:>12.3f} ({variacao:+.1%})")
+    return linhas
+
+
+def _cli(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Regressão de desempenho com baselines JSON")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("rodar", help="executa os casos e grava as métricas")
+    p.add_argument("--saida", default="perf-atual.json")
+    p.add_argument("--casos", default=",".join(CASOS), help="lista separada por vírgula")
+    p.add_argument("--repeticoes", type=int, default=20)
+    p.add_argument("--mongomock", action="store_true", help="Mongo em memória (mongomock) em vez de MONGODB_URI")
+
+    p = sub.add_parser("comparar", help="compara um resultado com o baseline")
+    p.add_argument("baseline")
+    p.add_argument("atual")
+    p.add_argument("--limite", type=float, default=0.25, help="piora relativa tolerada (0.25 = 25%%)")
+    p.add_argument("--folga-ms", type=float, default=0.5, help="ignora pioras absolutas menores que isso")
+
+    args = ap.parse_args(argv)
+    if args.cmd == "rodar":
+        casos = [c.strip() for c in args.casos.split(",") if c.strip()]
+        desconhecidos = set(casos) - set(CASOS)
+        if desconhecidos:
+            ap.error(f"casos desconhecidos: {', '.join(sorted(desconhecidos))}")
+        resultado = rodar(casos, args.repeticoes, args.mongomock)
+        Path(args.saida).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.saida).write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding="utf-8")
+        for nome, m in resultado["metricas"].items():
+            print(f"{nome:<32} {m['valor']:>12.3f}")
+        return 0
+
+    base = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    atual = json.loads(Path(args.atual).read_text(encoding="utf-8"))
+    linhas = comparar(base, atual, args.limite, args.folga_ms)
+    print("\n".join(linhas))
+    return 1 if any(linha.startswith(("REGRESSÃO", "AUSENTE")) for linha in linhas) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_cli())
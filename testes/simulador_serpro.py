@@ -0,0 +1,290 @@
+"""
+Simulador local do gateway SERPRO (Integra Contador) para carga e benchmark.
+
+    python -m testes.simulador_serpro [--porta 8089] [--latencia-ms 120] [--sigma 0.5]
+                                      [--taxa-202 0.3] [--polls 2] [--taxa-429 0.01]
+                                      [--taxa-5xx 0.01] [--pdf-kb 250] [--semente 1]
+
+Atende /token, /Declarar, /Emitir e /Monitorar com os mesmos formatos de
+corpo do gateway real. Para apontar a aplicação para ele:
+
+    URL_BASE=http://127.0.0.1:8089
+    URL_AUTENTICACAO=http://127.0.0.1:8089/token
+
+mTLS: `--gerar-certificados DIR` cria CA, certificado do servidor e um
+`cliente.pfx` (senha `simulador`); depois rode com
+`--cert DIR/servidor.pem --chave DIR/servidor.key --ca DIR/ca.pem`, use
+https nas URLs e REQUESTS_CA_BUNDLE=DIR/ca.pem na aplicação. Como no
+gateway real, o certificado de cliente só é exigido no /token.
+"""
+from __future__ import annotations
+import os
+import ssl
+import math
+import time
+import uuid
+import base64
+import random
+import argparse
+import datetime
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+from utils.serializacao import dumps_str
+
+
+@dataclass
+class ConfigSimulador:
+    latencia_ms: float = 120.0      # mediana da latência (lognormal)
+    sigma: float = 0.5              # dispersão da lognormal; 0 = latência fixa
+    taxa_202: float = 0.0           # fração do /Declarar que responde 202 + Monitorar
+    polls: int = 2                  # polls PROCESSANDO antes de concluir
+    taxa_429: float = 0.0
+    taxa_5xx: float = 0.0
+    pdf_kb: int = 250               # tamanho do PDF antes do base64
+    semente: Optional[int] = None
+
+
+class _Estado:
+    """Pedidos 202 pendentes (responseId → polls restantes + corpo final)."""
+
+    def __init__(self, cfg: ConfigSimulador) -> None:
+        self.cfg = cfg
+        self.rng = random.Random(cfg.semente)
+        self.lock = threading.Lock()
+        self.pendentes: Dict[str, Dict[str, Any]] = {}
+        self.contagem: Dict[str, int] = {}
+        pdf = b"%PDF-1.4\n" + os.urandom(max(cfg.pdf_kb * 1024 - 9, 0))
+        self.pdf_b64 = base64.b64encode(pdf).decode()
+
+    def sortear(self) -> float:
+        with self.lock:
+            return self.rng.random()
+
+    def dormir(self) -> None:
+        cfg = self.cfg
+        if cfg.latencia_ms <= 0:
+            return
+        with self.lock:
+            ms = (self.rng.lognormvariate(math.log(cfg.latencia_ms), cfg.sigma)
+                  if cfg.sigma > 0 else cfg.latencia_ms)
+        time.sleep(ms / 1000)
+
+    def contar(self, chave: str) -> None:
+        with self.lock:
+            self.contagem[chave] = self.contagem.get(chave, 0) + 1
+
+
+def _falha_injetada(estado: _Estado) -> Optional[Tuple[Any, int, Dict[str, str]]]:
+    sorteio = estado.sortear()
+    if sorteio < estado.cfg.taxa_429:
+        estado.contar("429")
+        return jsonify(status=429, mensagens=[{"codigo": "429", "texto": "Limite de requisições"}]), \
+            429, {"Retry-After": "1"}
+    if sorteio < estado.cfg.taxa_429 + estado.cfg.taxa_5xx:
+        estado.contar("503")
+        return jsonify(status=503, mensagens=[{"codigo": "503", "texto": "Serviço indisponível"}]), 503, {}
+    return None
+
+
+def _corpo_declaracao(estado: _Estado, envelope: Dict[str, Any]) -> Dict[str, Any]:
+    cnpj = envelope.get("contribuinte", {}).get("numero", "")
+    dados = {
+        "idDeclaracao": f"{cnpj[:8]}{uuid.uuid4().int % 10**9:09d}",
+        "recibo": f"{uuid.uuid4().int % 10**12:012d}",
+        "dataHoraTransmissao": datetime.datetime.now().strftime("%Y%m%d%H%M%S"),
+        "declaracao": estado.pdf_b64,
+        "valoresDevidos": [{"codigoTributo": c, "valor": round(100 + int(cnpj[-4:] or 0) / 10, 2)}
+                           for c in (1001, 1002, 1004, 1005, 1006, 1007)],
+    }
+    return {"status": 200, "codigoStatus": "CONCLUIDO", "situacao": "CONCLUIDO",
+            "mensagens": [{"codigo": "Sucesso-PGDASD", "texto": "Requisição efetuada com sucesso."}],
+            "dados": dumps_str(dados)}
+
+
+def _corpo_das(estado: _Estado, envelope: Dict[str, Any]) -> Dict[str, Any]:
+    pedido = envelope.get("pedidoDados", {})
+    cnpj = envelope.get("contribuinte", {}).get("numero", "")
+    das = {
+        "pdf": estado.pdf_b64,
+        "cnpjCompleto": cnpj,
+        "detalhamento": {"periodoApuracao": pedido.get("dados", ""),
+                         "numeroDocumento": f"{uuid.uuid4().int % 10**17:017d}",
+                         "valores": {"total": 1234.56}},
+    }
+    return {"status": 200, "mensagens": [{"codigo": "Sucesso-PGDASD", "texto": "Requisição efetuada com sucesso."}],
+            "dados": dumps_str([das])}
+
+
+def criar_app(cfg: ConfigSimulador, exigir_cert_cliente: bool = False) -> Flask:
+    estado = _Estado(cfg)
+    app = Flask("simulador_serpro")
+    app.config["estado"] = estado
+
+    @app.post("/token")
+    def token():
+        estado.contar("token")
+        estado.dormir()
+        if exigir_cert_cliente and not request.environ.get("SSL_CLIENT_CERT"):
+            return jsonify(error="invalid_client", error_description="certificado de cliente ausente"), 401
+        return jsonify(access_token=f"sim-{uuid.uuid4().hex}", jwt_token=f"sim-jwt-{uuid.uuid4().hex}",
+                       token_type="bearer", expires_in=3600)
+
+    @app.post("/Declarar")
+    def declarar():
+        estado.contar("Declarar")
+        estado.dormir()
+        falha = _falha_injetada(estado)
+        if falha:
+            return falha
+        envelope = request.get_json(force=True)
+        corpo = _corpo_declaracao(estado, envelope)
+        if estado.sortear() < cfg.taxa_202:
+            rid = str(uuid.uuid4())
+            with estado.lock:
+                estado.pendentes[rid] = {"restantes": cfg.polls, "corpo": corpo}
+            return jsonify(status=202, responseId=rid,
+                           mensagens=[{"codigo": "202", "texto": "Pedido em processamento"}]), 202
+        return jsonify(corpo), 200
+
+    @app.post("/Emitir")
+    def emitir():
+        estado.contar("Emitir")
+        estado.dormir()
+        falha = _falha_injetada(estado)
+        if falha:
+            return falha
+        return jsonify(_corpo_das(estado, request.get_json(force=True))), 200
+
+    @app.post("/Monitorar")
+    def monitorar():
+        estado.contar("Monitorar")
+        estado.dormir()
+        rid = (request.get_json(force=True) or {}).get("idPedidoDados")
+        with estado.lock:
+            pedido = estado.pendentes.get(rid)
+            if pedido is None:
+                return jsonify(status=404, mensagens=[{"codigo": "404", "texto": "Pedido não encontrado"}]), 404
+            if pedido["restantes"] > 0:
+                pedido["restantes"] -= 1
+                return jsonify(status=200, situacao="PROCESSANDO"), 200
+            del estado.pendentes[rid]
+        return jsonify(pedido["corpo"]), 200
+
+    @app.get("/_contagem")
+    def contagem():
+        with estado.lock:
+            return jsonify(estado.contagem)
+
+    return app
+
+
+def contexto_tls(cert: str, chave: str, ca: Optional[str] = None) -> ssl.SSLContext:
+    """
+    TLS do servidor; com `ca`, valida certificados de cliente assinados
+    por ela (mTLS). A obrigatoriedade fica no /token (`criar_app`).
+    """
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, chave)
+    if ca:
+        ctx.verify_mode = ssl.CERT_OPTIONAL
+        ctx.load_verify_locations(ca)
+    return ctx
+
+
+def iniciar_em_thread(cfg: ConfigSimulador, host: str = "127.0.0.1", porta: int = 0,
+                      ssl_context: Optional[ssl.SSLContext] = None):
+    """Sobe o simulador em uma thread daemon; devolve (url_base, servidor)."""
+    app = criar_app(cfg, exigir_cert_cliente=ssl_context is not None
+                    and ssl_context.verify_mode != ssl.CERT_NONE)
+    servidor = make_server(host, porta, app, threaded=True, ssl_context=ssl_context)
+    threading.Thread(target=servidor.serve_forever, name="simulador-serpro", daemon=True).start()
+    esquema = "https" if ssl_context else "http"
+    return f"{esquema}://{host}:{servidor.server_port}", servidor
+
+
+def gerar_certificados(destino: Path | str, senha_pfx: str = "simulador") -> Path:
+    """CA + servidor (localhost/127.0.0.1) + cliente.pfx para testar mTLS."""
+    import ipaddress
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.serialization import pkcs12
+
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+    agora = datetime.datetime.now(datetime.timezone.utc)
+
+    def _emitir(nome: str, emissor_nome, emissor_chave, *, ca=False, san=None):
+        chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        sujeito = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, nome)])
+        b = (x509.CertificateBuilder().subject_name(sujeito)
+             .issuer_name(emissor_nome or sujeito).public_key(chave.public_key())
+             .serial_number(x509.random_serial_number())
+             .not_valid_before(agora - datetime.timedelta(days=1))
+             .not_valid_after(agora + datetime.timedelta(days=365))
+             .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True))
+        if san:
+            b = b.add_extension(x509.SubjectAlternativeName(san), critical=False)
+        return chave, b.sign(emissor_chave or chave, hashes.SHA256())
+
+    ca_chave, ca_cert = _emitir("Simulador SERPRO CA", None, None, ca=True)
+    srv_chave, srv_cert = _emitir("localhost", ca_cert.subject, ca_chave,
+                                  san=[x509.DNSName("localhost"), x509.IPAddress(ipaddress.ip_address("127.0.0.1"))])
+    cli_chave, cli_cert = _emitir("cliente-simulador", ca_cert.subject, ca_chave)
+
+    pem = serialization.Encoding.PEM
+    (destino / "ca.pem").write_bytes(ca_cert.public_bytes(pem))
+    (destino / "servidor.pem").write_bytes(srv_cert.public_bytes(pem))
+    (destino / "servidor.key").write_bytes(srv_chave.private_bytes(
+        pem, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption()))
+    (destino / "cliente.pfx").write_bytes(pkcs12.serialize_key_and_certificates(
+        b"cliente-simulador", cli_chave, cli_cert, [ca_cert],
+        serialization.BestAvailableEncryption(senha_pfx.encode())))
+    return destino
+
+
+def adicionar_argumentos(ap: argparse.ArgumentParser) -> None:
+    """Opções do simulador, compartilhadas com testes/bench_pipeline.py."""
+    ap.add_argument("--latencia-ms", type=float, default=120.0, help="mediana da latência por chamada")
+    ap.add_argument("--sigma", type=float, default=0.5, help="dispersão lognormal (0 = fixa)")
+    ap.add_argument("--taxa-202", type=float, default=0.0, help="fração do Declarar que vira 202 + Monitorar")
+    ap.add_argument("--polls", type=int, default=2, help="polls PROCESSANDO antes de concluir")
+    ap.add_argument("--taxa-429", type=float, default=0.0)
+    ap.add_argument("--taxa-5xx", type=float, default=0.0)
+    ap.add_argument("--pdf-kb", type=int, default=250)
+    ap.add_argument("--semente", type=int, default=None)
+
+
+def config_de_args(args: argparse.Namespace) -> ConfigSimulador:
+    return ConfigSimulador(latencia_ms=args.latencia_ms, sigma=args.sigma, taxa_202=args.taxa_202,
+                           polls=args.polls, taxa_429=args.taxa_429, taxa_5xx=args.taxa_5xx,
+                           pdf_kb=args.pdf_kb, semente=args.semente)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Simulador local do gateway SERPRO")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--porta", type=int, default=8089)
+    ap.add_argument("--cert", help="certificado PEM do servidor (ativa https)")
+    ap.add_argument("--chave", help="chave privada PEM do servidor")
+    ap.add_argument("--ca", help="CA dos clientes: exige certificado de cliente (mTLS)")
+    ap.add_argument("--gerar-certificados", metavar="DIR", help="gera CA/servidor/cliente.pfx e sai")
+    adicionar_argumentos(ap)
+    args = ap.parse_args()
+
+    if args.gerar_certificados:
+        print(f"Certificados em {gerar_certificados(args.gerar_certificados)}")
+        return
+
+    ctx = contexto_tls(args.cert, args.chave, args.ca) if args.cert else None
+    app = criar_app(config_de_args(args), exigir_cert_cliente=bool(args.ca))
+    make_server(args.host, args.porta, app, threaded=True, ssl_context=ctx).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Custo de importação por módulo (python -X importtime).
+
+    python -m testes.tempo_importacao [modulo ...] [--top 8] [--sem-env]
+
+Cada módulo é importado num interpretador novo, então o número inclui
+tudo o que ele puxa (Flask, pymongo, cryptography...). Mostra o tempo
+cumulativo do módulo, os imports mais caros por tempo próprio e, se o
+import falhar, o erro. `--sem-env` remove as variáveis de SERPRO,
+Mongo e Domínio para conferir que só importar não exige configuração.
+"""
+from __future__ import annotations
+import os
+import re
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+RAIZ = Path(__file__).resolve().parents[1]
+
+MODULOS = (
+    "utils.json_builder",
+    "utils.serializacao",
+    "database.dominio_db",
+    "database.db_schema",
+    "database.fila_tarefas",
+    "utils.gerar_das",
+    "utils.monitorar_serpro",
+    "utils.pipeline",
+    "main",
+)
+
+_VARIAVEIS_EXTERNAS = (
+    "MONGODB_URI", "DB_HOST", "DB_PORT", "DB_NAME", "DB_USER", "DB_PASS",
+    "CAMINHO_CERTIFICADO", "NOME_CERTIFICADO", "SENHA_CERTIFICADO", "CONSUMER_KEY", "CONSUMER_SECRET",
+)
+
+# "import time:       412 |       1234 |   utils.metricas"
+_LINHA = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def medir_modulo(modulo: str, sem_env: bool) -> Tuple[Dict[str, Tuple[int, int]], str]:
+    """{import: (próprio_us, cumulativo_us)} e a última linha de erro (vazia se importou)."""
+    env = dict(os.environ)
+    if sem_env:
+        for nome in _VARIAVEIS_EXTERNAS:
+            env.pop(nome, None)
+        # load_dotenv() não sobrescreve variáveis já definidas: vazias = ausentes
+        env.update({nome: "" for nome in _VARIAVEIS_EXTERNAS})
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                          cwd=RAIZ, env=env, capture_output=True, text=True)
+    tempos: Dict[str, Tuple[int, int]] = {}
+    erro = ""
+    for linha in proc.stderr.splitlines():
+        m = _LINHA.match(linha)
+        if m:
+            tempos[m.group(4)] = (int(m.group(1)), int(m.group(2)))
+        elif linha.strip():
+            erro = linha.strip()
+    return tempos, erro if proc.returncode else ""
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Tempo de importação por módulo")
+    ap.add_argument("modulos", nargs="*", default=list(MODULOS))
+    ap.add_argument("--top", type=int, default=5, help="imports mais caros listados por módulo")
+    ap.add_argument("--sem-env", action="store_true", help="importa sem as variáveis de SERPRO/Mongo/Domínio")
+    args = ap.parse_args()
+
+    for modulo in args.modulos:
+        tempos, erro = medir_modulo(modulo, args.sem_env)
+        total = tempos.get(modulo, (0, 0))[1]
+        print(f"{modulo:<26} {total / 1000:>9.1f} ms" + (f"   FALHOU: {erro}" if erro else ""))
+        caros: List[Tuple[str, int]] = sorted(((nome, t[0]) for nome, t in tempos.items() if nome != modulo),
+                                              key=lambda x: x[1], reverse=True)[:args.top]
+        for nome, proprio in caros:
+            print(f"    {nome:<40} {proprio / 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
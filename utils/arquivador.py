@@ -0,0 +1,316 @@
+from __future__ import annotations
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional, Tuple
+from utils.save_json import caminho_payload, serializar_payload
+from utils.arquivo_segmento import SegmentoPA
+from utils.metricas import Histograma, Medidor, medir
+from utils.modo_execucao import diretorio_arquivo
+
+load_dotenv()
+
+
+# ---------------------------------------------------------------------
+# configuração
+# ---------------------------------------------------------------------
+ARQUIVO_FILA_MAX = int(os.getenv("ARQUIVO_FILA_MAX", "1000"))
+ARQUIVO_WORKERS = int(os.getenv("ARQUIVO_WORKERS", "2"))
+ARQUIVO_BACKEND = os.getenv("ARQUIVO_BACKEND", "arquivos")      # arquivos | segmento
+ARQUIVO_FORMATO = os.getenv("ARQUIVO_FORMATO", "json")          # json | gzip (backend arquivos)
+ARQUIVO_RESPOSTAS = os.getenv("ARQUIVO_RESPOSTAS", "0") == "1"  # respostas SERPRO (backend segmento)
+ARQUIVO_FSYNC_LOTE = int(os.getenv("ARQUIVO_FSYNC_LOTE", "20"))  # arquivos por fsync
+ARQUIVO_FSYNC_SEG = float(os.getenv("ARQUIVO_FSYNC_SEG", "2"))   # espera máx. do lote
+ARQUIVO_FILA_TIMEOUT = float(os.getenv("ARQUIVO_FILA_TIMEOUT", "5"))
+
+
+ARQUIVO_GRAVACAO_SEGUNDOS = Histograma(
+    "pgdas_arquivo_gravacao_segundos", "Do enfileiramento até o arquivo estar em disco")
+
+
+def _fsync_arquivo(caminho: Path) -> None:
+    # "ab" e não "rb": no Windows o fsync exige handle com escrita
+    with open(caminho, "ab") as f:
+        os.fsync(f.fileno())
+
+
+def _fsync_pasta(pasta: Path) -> None:
+    """fsync do diretório (garante o rename); não suportado no Windows."""
+    try:
+        fd = os.open(pasta, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# ---------------------------------------------------------------------
+# backends
+# ---------------------------------------------------------------------
+class _BackendArquivos:
+    """
+    Layout de compatibilidade: um arquivo por CNPJ/PA em json/AAAAMM/.
+    `preparar` grava o temporário; `confirmar` faz fsync + rename atômico.
+    Respostas SERPRO não são gravadas neste modo.
+    """
+
+    def __init__(self, formato: str) -> None:
+        self.formato = formato
+
+    def preparar(self, item: Dict[str, Any]) -> Optional[Tuple[float, Path, Path]]:
+        if item["tipo"] != "payload":
+            return None
+        destino = caminho_payload(item["doc"], codi_emp=item["codi_emp"], base_dir=item["base_dir"],
+                                  formato=self.formato)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        tmp = destino.with_name(f".{destino.name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(serializar_payload(item["doc"], formato=self.formato, bruto=item.get("bruto")))
+        return item["inicio"], tmp, destino
+
+    def confirmar(self, pendentes: List[Tuple[float, Path, Path]]) -> List[float]:
+        latencias: List[float] = []
+        pastas = set()
+        for inicio, tmp, destino in pendentes:
+            try:
+                _fsync_arquivo(tmp)
+                os.replace(tmp, destino)
+                pastas.add(destino.parent)
+                latencias.append((time.perf_counter() - inicio) * 1000)
+            except OSError:
+                logging.exception("Falha ao gravar %s", destino)
+        for pasta in pastas:
+            _fsync_pasta(pasta)
+        return latencias
+
+
+class _BackendSegmento:
+    """
+    Segmento append-only por PA (utils.arquivo_segmento): cada retry vira
+    um novo registro, preservando a trilha de auditoria.
+    `preparar` anexa o registro; `confirmar` faz um fsync por segmento.
+    """
+
+    def preparar(self, item: Dict[str, Any]) -> Optional[Tuple[float, SegmentoPA]]:
+        seg = SegmentoPA(item["pa"], item["base_dir"])
+        seg.anexar(item["cnpj"], item["tipo"], item["doc"], bruto=item.get("bruto"))
+        return item["inicio"], seg
+
+    def confirmar(self, pendentes: List[Tuple[float, SegmentoPA]]) -> List[float]:
+        segmentos = {seg.caminho: seg for _, seg in pendentes}
+        for seg in segmentos.values():
+            try:
+                seg.sincronizar()
+            except OSError:
+                logging.exception("Falha no fsync de %s", seg.caminho)
+        agora = time.perf_counter()
+        return [(agora - inicio) * 1000 for inicio, _ in pendentes]
+
+
+def _criar_backend(backend: str, formato: str):
+    if backend == "arquivos":
+        return _BackendArquivos(formato)
+    if backend == "segmento":
+        return _BackendSegmento()
+    raise ValueError(f"Backend de arquivo desconhecido: {backend!r}")
+
+
+class ArquivadorPayloads:
+    """
+    Grava os payloads de auditoria (json/AAAAMM/) fora do fluxo da requisição.
+
+    • `enfileirar()` só coloca o payload numa fila limitada e retorna;
+    • workers em background gravam pelo backend escolhido ("arquivos":
+      um JSON/gzip por CNPJ com rename atômico; "segmento": append-only
+      por PA) e fazem fsync uma vez por lote;
+    • se a fila ficar cheia por mais de `ARQUIVO_FILA_TIMEOUT` segundos,
+      grava de forma síncrona em vez de perder o payload.
+    """
+
+    def __init__(self, *, workers: int = ARQUIVO_WORKERS, fila_max: int = ARQUIVO_FILA_MAX,
+                 backend: str = ARQUIVO_BACKEND, formato: str = ARQUIVO_FORMATO,
+                 fsync_lote: int = ARQUIVO_FSYNC_LOTE, fsync_seg: float = ARQUIVO_FSYNC_SEG) -> None:
+        self.backend = _criar_backend(backend, formato)
+        self.fsync_lote = max(fsync_lote, 1)
+        self.fsync_seg = fsync_seg
+        self._n_workers = max(workers, 1)
+        self._fila: queue.Queue = queue.Queue(maxsize=fila_max)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._metricas: Dict[str, Any] = {
+            "gravados": 0,
+            "falhas": 0,
+            "sincronos": 0,
+            "lotes_fsync": 0,
+            "latencia_ultima_ms": 0.0,
+            "latencia_max_ms": 0.0,
+            "latencia_total_ms": 0.0,
+        }
+
+    # ------------------------------------------------------------------ #
+    def iniciar(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self._n_workers):
+                t = threading.Thread(target=self._loop, name=f"arquivador-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def parar(self, timeout: float = 30) -> None:
+        """Drena a fila e encerra os workers (chamado no atexit)."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._fila.put(None)
+        for t in threads:
+            t.join(timeout)
+
+    def reiniciar(self) -> None:
+        """
+        Depois de um fork: os workers do pai não existem no filho. Fila e
+        threads recomeçam (o que ficou na fila do pai é gravado pelo pai).
+        """
+        self._fila = queue.Queue(maxsize=self._fila.maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def enfileirar(self, tipo: str, cnpj: str, pa: int | str, doc: Any, *,
+                   codi_emp: Optional[int | str] = None, base_dir: Path | str | None = None,
+                   bruto: Optional[bytes] = None) -> None:
+        """
+        Agenda a gravação de `doc` ("payload" ou "resposta"); não espera o disco.
+        `bruto` é o JSON compacto de `doc`, se já existir (evita serializar de novo).
+        """
+        self.iniciar()
+        item = {"inicio": time.perf_counter(), "tipo": tipo, "cnpj": cnpj, "pa": pa, "doc": doc,
+                "codi_emp": codi_emp, "base_dir": base_dir, "bruto": bruto}
+        try:
+            self._fila.put(item, timeout=ARQUIVO_FILA_TIMEOUT)
+        except queue.Full:
+            logging.warning("Fila do arquivador cheia; gravando %s de %s de forma síncrona", tipo, cnpj)
+            self._registrar(self._gravar_lote([self._preparar(item)]), sincrono=True)
+
+    def metricas(self) -> Dict[str, Any]:
+        with self._lock:
+            m = dict(self._metricas)
+        gravados = m["gravados"] or 1
+        m["latencia_media_ms"] = round(m.pop("latencia_total_ms") / gravados, 2)
+        m["fila_profundidade"] = self._fila.qsize()
+        m["fila_max"] = self._fila.maxsize
+        m["workers"] = len(self._threads)
+        return m
+
+    # ------------------------------------------------------------------ #
+    def _preparar(self, item: Dict[str, Any]) -> Optional[Tuple]:
+        try:
+            return self.backend.preparar(item)
+        except Exception:
+            logging.exception("Falha ao arquivar %s de %s", item["tipo"], item["cnpj"])
+            with self._lock:
+                self._metricas["falhas"] += 1
+            return None
+
+    def _gravar_lote(self, pendentes: List[Optional[Tuple]]) -> List[float]:
+        pendentes = [p for p in pendentes if p is not None]
+        if not pendentes:
+            return []
+        latencias = self.backend.confirmar(pendentes)
+        if len(latencias) < len(pendentes):
+            with self._lock:
+                self._metricas["falhas"] += len(pendentes) - len(latencias)
+        return latencias
+
+    def _registrar(self, latencias: List[float], sincrono: bool = False) -> None:
+        if not latencias:
+            return
+        with self._lock:
+            m = self._metricas
+            m["gravados"] += len(latencias)
+            m["lotes_fsync"] += 1
+            m["sincronos"] += len(latencias) if sincrono else 0
+            m["latencia_ultima_ms"] = round(latencias[-1], 2)
+            m["latencia_max_ms"] = round(max(m["latencia_max_ms"], *latencias), 2)
+            m["latencia_total_ms"] += sum(latencias)
+        for ms in latencias:
+            ARQUIVO_GRAVACAO_SEGUNDOS.observar(ms / 1000)
+
+    def _loop(self) -> None:
+        pendentes: List[Optional[Tuple]] = []
+        primeiro = 0.0
+        while True:
+            try:
+                item = self._fila.get(timeout=self.fsync_seg)
+            except queue.Empty:
+                item = False                     # fila vazia → fecha o lote
+
+            if item:
+                if not pendentes:
+                    primeiro = time.monotonic()
+                pendentes.append(self._preparar(item))
+
+            fechar = (
+                item is None
+                or item is False
+                or len(pendentes) >= self.fsync_lote
+                or time.monotonic() - primeiro >= self.fsync_seg
+                or self._fila.empty()
+            )
+            if pendentes and fechar:
+                self._registrar(self._gravar_lote(pendentes))
+                pendentes = []
+
+            if item is not False:
+                self._fila.task_done()
+            if item is None:
+                return
+
+
+# ---------------------------------------------------------------------
+# instância compartilhada
+# ---------------------------------------------------------------------
+_arquivador = ArquivadorPayloads()
+atexit.register(_arquivador.parar)
+
+Medidor("pgdas_arquivo_fila_profundidade", "Itens aguardando gravação no arquivador",
+        funcao=lambda: _arquivador._fila.qsize())
+
+
+def reiniciar_apos_fork() -> None:
+    """Chamado em cada worker do gunicorn (post_fork); ver ArquivadorPayloads.reiniciar."""
+    _arquivador.reiniciar()
+
+
+@medir("arquivar_payload")
+def arquivar_payload(payload: Dict[str, Any], *, codi_emp: Optional[int | str] = None,
+                     base_dir: Path | str | None = None, bruto: Optional[bytes] = None) -> None:
+    """
+    Agenda a gravação de auditoria do payload em background. A pasta é
+    resolvida aqui, no modo de execução de quem chamou (simulação vai
+    para `simulacao/`), e não na thread do arquivador.
+    """
+    _arquivador.enfileirar("payload", payload["cnpjCompleto"], payload["pa"], payload,
+                           codi_emp=codi_emp, base_dir=base_dir or diretorio_arquivo(), bruto=bruto)
+
+
+def arquivar_resposta(cnpj: str, pa: int, resp: Any, *, base_dir: Path | str | None = None) -> None:
+    """
+    Agenda a gravação da resposta SERPRO junto do payload. `cnpj` deve
+    ser o `cnpjCompleto` do payload, a chave de `arquivar_payload`. Só tem
+    efeito com ARQUIVO_BACKEND=segmento e ARQUIVO_RESPOSTAS=1.
+    """
+    if ARQUIVO_RESPOSTAS and ARQUIVO_BACKEND == "segmento":
+        _arquivador.enfileirar("resposta", cnpj, pa, resp, base_dir=base_dir or diretorio_arquivo())
+
+
+def metricas_arquivador() -> Dict[str, Any]:
+    """Profundidade da fila e latência de gravação (ms) do arquivador."""
+    return _arquivador.metricas()
@@ -0,0 +1,268 @@
+"""
+Arquivo append-only de auditoria: um segmento por PA.
+
+    json/AAAAMM/PGDAS-AAAAMM.seg   registros comprimidos, só cresce
+    json/AAAAMM/PGDAS-AAAAMM.idx   índice JSONL (cnpj, tipo, ts) → offset
+
+Cada registro é  [tamanho u32 BE][codec u8][bytes comprimidos]  e o
+conteúdo descomprimido é o JSON {"cnpj", "tipo", "ts", "doc"}, de modo
+que o índice pode ser reconstruído só a partir do segmento.
+
+Uso pela linha de comando:
+    python -m utils.arquivo_segmento listar  --pa 202505 [--cnpj X] [--tipo payload]
+    python -m utils.arquivo_segmento extrair --pa 202505 --cnpj X [--tipo resposta] [--offset N] [-o saida.json]
+    python -m utils.arquivo_segmento reindexar --pa 202505
+"""
+from __future__ import annotations
+import os
+import sys
+import mmap
+import zlib
+import struct
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+from utils.serializacao import dumps, dumps_pretty, loads
+
+try:
+    import zstandard
+except ImportError:                                   # zlib como fallback
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:                                   # Windows
+    fcntl = None
+    import msvcrt
+
+_CABECALHO = struct.Struct(">IB")
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+_NIVEL_ZSTD = int(os.getenv("ARQUIVO_ZSTD_NIVEL", "3"))
+
+_locks: Dict[Path, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _default_base_dir() -> Path:
+    return Path(os.getenv("ARQUIVO_DIR") or Path(__file__).resolve().parent.parent / "json")
+
+
+def _lock_de(caminho: Path) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(caminho, threading.Lock())
+
+
+class _TravaArquivo:
+    """Lock exclusivo entre processos sobre um arquivo já aberto."""
+
+    def __init__(self, f) -> None:
+        self.f = f
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        else:
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        else:
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# ---------------------------------------------------------------------
+# compressão
+# ---------------------------------------------------------------------
+def _comprimir(dados: bytes) -> tuple[int, bytes]:
+    if zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=_NIVEL_ZSTD).compress(dados)
+    return CODEC_ZLIB, zlib.compress(dados, 6)
+
+
+def _descomprimir(codec: int, dados: bytes) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Registro zstd, mas o pacote 'zstandard' não está instalado")
+        return zstandard.ZstdDecompressor().decompress(dados)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(dados)
+    raise ValueError(f"Codec desconhecido no segmento: {codec}")
+
+
+# ---------------------------------------------------------------------
+# segmento
+# ---------------------------------------------------------------------
+class SegmentoPA:
+    """Segmento + índice de um PA. Seguro entre threads e processos para `anexar`."""
+
+    def __init__(self, pa: int | str, base_dir: Path | str | None = None) -> None:
+        pa_str = f"{int(pa):06d}"
+        pasta = Path(base_dir) if base_dir is not None else _default_base_dir()
+        self.pasta = pasta / pa_str
+        self.caminho = self.pasta / f"PGDAS-{pa_str}.seg"
+        self.caminho_indice = self.pasta / f"PGDAS-{pa_str}.idx"
+
+    # ------------------------------------------------------------------ #
+    def anexar(self, cnpj: str, tipo: str, doc: Any, ts: Optional[str] = None,
+               bruto: Optional[bytes] = None) -> Dict[str, Any]:
+        """
+        Acrescenta um registro ao fim do segmento e a entrada no índice.
+        `bruto` é o JSON de `doc` já serializado (reaproveitado sem novo dumps).
+        Não faz fsync: chame `sincronizar()` ao fechar um lote.
+        """
+        ts = ts or datetime.now().isoformat(timespec="milliseconds")
+        if bruto is None:
+            bruto = dumps(doc)
+        cabeca = dumps({"cnpj": cnpj, "tipo": tipo, "ts": ts})
+        codec, comprimido = _comprimir(cabeca[:-1] + b',"doc":' + bruto + b"}")
+        registro = _CABECALHO.pack(len(comprimido), codec) + comprimido
+
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        with _lock_de(self.caminho), open(self.caminho, "ab") as seg, _TravaArquivo(seg):
+            seg.seek(0, os.SEEK_END)
+            offset = seg.tell()
+            seg.write(registro)
+            seg.flush()
+            entrada = {"cnpj": cnpj, "tipo": tipo, "ts": ts, "offset": offset,
+                       "tamanho": len(registro)}
+            with open(self.caminho_indice, "ab") as idx:
+                idx.write(dumps(entrada) + b"\n")
+        return entrada
+
+    def sincronizar(self) -> None:
+        """fsync do segmento e do índice."""
+        for caminho in (self.caminho, self.caminho_indice):
+            if caminho.exists():
+                with open(caminho, "ab") as f:
+                    os.fsync(f.fileno())
+
+    # ------------------------------------------------------------------ #
+    def indice(self) -> List[Dict[str, Any]]:
+        if not self.caminho_indice.exists():
+            return []
+        entradas = []
+        with open(self.caminho_indice, "rb") as idx:
+            for linha in idx:
+                try:
+                    entradas.append(loads(linha))
+                except ValueError:
+                    continue                          # linha truncada por queda
+        return entradas
+
+    def buscar(self, cnpj: Optional[str] = None, tipo: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Entradas do índice filtradas por CNPJ/tipo, em ordem de gravação."""
+        return [
+            e for e in self.indice()
+            if (cnpj is None or e["cnpj"] == cnpj) and (tipo is None or e["tipo"] == tipo)
+        ]
+
+    def ler(self, offset: int) -> Dict[str, Any]:
+        """Lê um registro pelo offset via mmap (sem carregar o segmento)."""
+        with open(self.caminho, "rb") as seg, \
+                mmap.mmap(seg.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return self._ler_mm(mm, offset)[0]
+
+    def ultimo(self, cnpj: str, tipo: str = "payload") -> Optional[Dict[str, Any]]:
+        entradas = self.buscar(cnpj, tipo)
+        return self.ler(entradas[-1]["offset"]) if entradas else None
+
+    def registros(self) -> Iterator[tuple[int, int, Dict[str, Any]]]:
+        """Percorre o segmento inteiro: (offset, tamanho, registro)."""
+        if not self.caminho.exists() or self.caminho.stat().st_size == 0:
+            return
+        with open(self.caminho, "rb") as seg, \
+                mmap.mmap(seg.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = 0
+            while offset + _CABECALHO.size <= len(mm):
+                try:
+                    registro, tamanho = self._ler_mm(mm, offset)
+                except (ValueError, RuntimeError, zlib.error):
+                    break                             # cauda truncada
+                yield offset, tamanho, registro
+                offset += tamanho
+
+    def reindexar(self) -> int:
+        """Reconstrói o .idx a partir do segmento; devolve o nº de registros."""
+        linhas = [
+            {"cnpj": reg["cnpj"], "tipo": reg["tipo"], "ts": reg["ts"], "offset": offset, "tamanho": tamanho}
+            for offset, tamanho, reg in self.registros()
+        ]
+        tmp = self.caminho_indice.with_suffix(".idx.tmp")
+        tmp.write_bytes(b"".join(dumps(e) + b"\n" for e in linhas))
+        os.replace(tmp, self.caminho_indice)
+        return len(linhas)
+
+    @staticmethod
+    def _ler_mm(mm: mmap.mmap, offset: int) -> tuple[Dict[str, Any], int]:
+        tamanho, codec = _CABECALHO.unpack_from(mm, offset)
+        inicio = offset + _CABECALHO.size
+        if inicio + tamanho > len(mm):
+            raise ValueError(f"Registro truncado no offset {offset}")
+        bruto = _descomprimir(codec, mm[inicio:inicio + tamanho])
+        return loads(bruto), _CABECALHO.size + tamanho
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def _cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m utils.arquivo_segmento",
+                                     description="Consulta o arquivo de auditoria por PA.")
+    parser.add_argument("--base-dir", default=None, help="pasta raiz (padrão: json/)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_listar = sub.add_parser("listar", help="lista as entradas do índice")
+    p_listar.add_argument("--pa", required=True)
+    p_listar.add_argument("--cnpj")
+    p_listar.add_argument("--tipo")
+
+    p_extrair = sub.add_parser("extrair", help="extrai um registro")
+    p_extrair.add_argument("--pa", required=True)
+    p_extrair.add_argument("--cnpj")
+    p_extrair.add_argument("--tipo", default="payload")
+    p_extrair.add_argument("--offset", type=int, help="offset exato (senão, o último do CNPJ/tipo)")
+    p_extrair.add_argument("-o", "--saida", help="grava o documento neste arquivo")
+
+    p_reindexar = sub.add_parser("reindexar", help="reconstrói o índice a partir do segmento")
+    p_reindexar.add_argument("--pa", required=True)
+
+    args = parser.parse_args(argv)
+    seg = SegmentoPA(args.pa, args.base_dir)
+
+    if args.comando == "listar":
+        for e in seg.buscar(args.cnpj, args.tipo):
+            print(f"{e['ts']}  {e['cnpj']}  {e['tipo']:<9} offset={e['offset']} tamanho={e['tamanho']}")
+        return 0
+
+    if args.comando == "reindexar":
+        print(f"{seg.reindexar()} registros indexados em {seg.caminho_indice}")
+        return 0
+
+    if args.offset is not None:
+        registro = seg.ler(args.offset)
+    elif args.cnpj:
+        registro = seg.ultimo(args.cnpj, args.tipo)
+    else:
+        parser.error("extrair: informe --cnpj ou --offset")
+        return 2
+    if registro is None:
+        print("Registro não encontrado", file=sys.stderr)
+        return 1
+
+    texto = dumps_pretty(registro["doc"])
+    if args.saida:
+        Path(args.saida).write_bytes(texto)
+    else:
+        print(texto.decode("utf-8"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_cli())
@@ -0,0 +1,55 @@
+"""
+Assinatura canônica do payload PGDAS-D, para saber se a declaração de
+um CNPJ/PA mudou sem comparar os JSONs campo a campo.
+
+O hash ignora o que não é dado fiscal (tipoDeclaracao, indicadores de
+transmissão/comparação) e a ordem das listas — as linhas do Domínio
+não vêm sempre na mesma ordem — e arredonda valores a centavos, pois
+`valorAtividade` é soma de floats. Há um hash por seção:
+    receitas  → declaracao sem folhasSalario (receitas PA, estabelecimentos)
+    folhas    → declaracao.folhasSalario
+    total     → as duas juntas
+"""
+from __future__ import annotations
+import json
+import hashlib
+from typing import Any, Dict
+
+# campos da declaração que não mudam o conteúdo declarado
+_IGNORAR = ("tipoDeclaracao",)
+
+
+def _canonico(valor: Any) -> Any:
+    if isinstance(valor, bool) or valor is None or isinstance(valor, str):
+        return valor
+    if isinstance(valor, (int, float)):
+        return round(float(valor), 2)
+    if isinstance(valor, dict):
+        return {k: _canonico(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        itens = [_canonico(v) for v in valor]
+        return sorted(itens, key=lambda v: json.dumps(v, sort_keys=True))
+    return str(valor)
+
+
+def _hash(valor: Any) -> str:
+    texto = json.dumps(_canonico(valor), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def assinatura_payload(payload: Dict[str, Any]) -> Dict[str, str]:
+    """{'receitas', 'folhas', 'total'} → sha256 hex de cada seção."""
+    declaracao = {k: v for k, v in (payload.get("declaracao") or {}).items() if k not in _IGNORAR}
+    folhas = declaracao.pop("folhasSalario", [])
+    return {
+        "receitas": _hash(declaracao),
+        "folhas": _hash(folhas),
+        "total": _hash({"declaracao": declaracao, "folhas": folhas}),
+    }
+
+
+def secoes_alteradas(antes: Dict[str, str], depois: Dict[str, str]) -> list[str]:
+    """Seções cujo hash mudou (vazio = mesma declaração)."""
+    if antes.get("total") == depois.get("total"):
+        return []
+    return [s for s in ("receitas", "folhas") if antes.get(s) != depois.get(s)]
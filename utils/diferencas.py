@@ -0,0 +1,114 @@
+"""
+Detecção de mudanças entre o Domínio e o que já foi declarado.
+
+    python -m utils.diferencas --pa 202505 [--arquivo cnpjs.txt] [--threads 8]
+                               [--todos] [--transmitir] [--modo simular|transmitir]
+
+Para cada CNPJ monta o payload atual (Domínio → montar_json) e compara
+a assinatura canônica (utils/assinatura_payload.py) com a da última
+declaração em SUCESSO no Mongo — lidas todas numa consulta. Situações:
+    INALTERADO  mesma declaração
+    ALTERADO    receitas e/ou folhas mudaram (`alteracoes`)
+    NOVO        ainda não há declaração em SUCESSO no PA
+    SEM_DADOS   Domínio sem movimento para o PA
+    ERRO        falha ao montar o payload
+Com `transmitir`, envia RETIFICADORA (tipo 2) só para os ALTERADO.
+Sem lista de CNPJs, usa a carteira do PA no Domínio.
+"""
+from __future__ import annotations
+import os
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, Optional
+from database.db_schema import buscar_declaracoes
+from database.dominio_db import buscar_simples, listar_cnpjs_com_movimento
+from utils.json_builder import montar_json
+from utils.assinatura_payload import assinatura_payload, secoes_alteradas
+from utils.pipeline import processar_pgdas
+from utils.serializacao import dumps_str
+from utils.modo_execucao import MODOS, PGDAS_MODO_PADRAO, em_modo
+
+DIFERENCAS_THREADS = int(os.getenv("DIFERENCAS_THREADS", "8"))
+
+
+def _assinatura_atual(cnpj: str, pa: int) -> Optional[Dict[str, str]]:
+    rows = buscar_simples(cnpj, pa=pa)
+    if not rows:
+        return None
+    return assinatura_payload(montar_json(rows, 2))
+
+
+def comparar(cnpjs: Iterable[str], pa: int, *, transmitir: bool = False, todos: bool = False,
+             threads: int = DIFERENCAS_THREADS) -> Iterator[Dict[str, Any]]:
+    """
+    Compara cada CNPJ com a última declaração do PA, na ordem da lista.
+    Os payloads são montados em paralelo (`threads` consultas ao Domínio).
+    Sem `todos`, os INALTERADO não são devolvidos.
+    """
+    cnpjs = list(dict.fromkeys(cnpjs))
+    declarados = buscar_declaracoes(cnpjs, pa)
+
+    def montar(cnpj: str):
+        try:
+            return _assinatura_atual(cnpj, pa), None
+        except Exception as e:
+            logging.exception("Erro ao montar payload de %s", cnpj)
+            return None, str(e)
+
+    with ThreadPoolExecutor(max_workers=max(threads, 1), thread_name_prefix="diferencas") as pool:
+        for cnpj, (atual, erro) in zip(cnpjs, pool.map(montar, cnpjs)):
+            doc = declarados.get(cnpj)
+            item: Dict[str, Any] = {"cnpj": cnpj, "pa": pa}
+            if erro is not None:
+                item.update(situacao="ERRO", erro=erro)
+            elif atual is None:
+                item["situacao"] = "SEM_DADOS"
+            elif doc is None:
+                item["situacao"] = "NOVO"
+            else:
+                # documentos anteriores à assinatura: calcula a partir do payload gravado
+                anterior = doc.get("payload_assinatura") or assinatura_payload(doc.get("payload_json") or {})
+                alteracoes = secoes_alteradas(anterior, atual)
+                item.update(situacao="ALTERADO" if alteracoes else "INALTERADO",
+                            tipoDeclarado=doc.get("tipoDeclaracao", 1), alteracoes=alteracoes)
+
+            if item["situacao"] == "INALTERADO" and not todos:
+                continue
+            if transmitir and item["situacao"] == "ALTERADO":
+                item["retificadora"] = processar_pgdas(cnpj, pa, 2)
+            yield item
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def main() -> None:
+    ap = argparse.ArgumentParser(description="CNPJs cuja declaração mudou no Domínio")
+    ap.add_argument("--pa", type=int, required=True)
+    ap.add_argument("--arquivo", help="um CNPJ por linha (padrão: carteira do Domínio)")
+    ap.add_argument("--threads", type=int, default=DIFERENCAS_THREADS)
+    ap.add_argument("--todos", action="store_true", help="lista também os INALTERADO")
+    ap.add_argument("--transmitir", action="store_true", help="envia RETIFICADORA para os ALTERADO")
+    ap.add_argument("--modo", choices=MODOS, default=PGDAS_MODO_PADRAO,
+                    help="coleções comparadas e modo da retificadora")
+    args = ap.parse_args()
+
+    if args.arquivo:
+        from utils.fechamento_mensal import ler_arquivo
+        cnpjs = ler_arquivo(args.arquivo)
+    else:
+        cnpjs = listar_cnpjs_com_movimento(args.pa)
+
+    contagem: Dict[str, int] = {}
+    with em_modo(args.modo):
+        for item in comparar(cnpjs, args.pa, transmitir=args.transmitir, todos=args.todos, threads=args.threads):
+            contagem[item["situacao"]] = contagem.get(item["situacao"], 0) + 1
+            if "retificadora" in item:
+                item["retificadora"] = {k: item["retificadora"].get(k) for k in ("status", "erro")}
+            print(dumps_str(item))
+    print(f"# {len(cnpjs)} CNPJs; {contagem}")
+
+
+if __name__ == "__main__":
+    main()
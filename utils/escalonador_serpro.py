@@ -0,0 +1,170 @@
+"""
+Escalonador das chamadas ao SERPRO (Declarar, Emitir e cada poll do
+Monitorar).
+
+No fechamento do mês várias equipes chamam a API ao mesmo tempo; sem
+escalonador, um lote de 800 CNPJs ocupa as conexões e um pedido urgente
+de um CNPJ espera atrás dele. Aqui:
+
+  • limite global de chamadas simultâneas (ESCALONADOR_MAX_SIMULTANEAS;
+    0 desliga o escalonador);
+  • faixas por prioridade estrita: `urgente` (requisições de um único
+    CNPJ) passa na frente de `normal`;
+  • dentro de cada faixa, fila justa ponderada (WFQ) entre submissores:
+    o escritório (cabeçalho X-Escritorio) ou, sem ele, o lote. Cada
+    chamada recebe uma marca de término virtual `início + 1/peso` e sai
+    a de menor marca, então dois lotes concorrentes se alternam mesmo que
+    um tenha 800 CNPJs e o outro 5. Pesos em ESCALONADOR_PESOS
+    ("escritorio_a=3,escritorio_b=1"; padrão 1).
+
+A vaga é ocupada só durante a requisição HTTP (não nas esperas entre
+retentativas e polls). Faixa, submissor e peso valem para o contexto
+atual (`submissor(...)`, contextvars), como o modo de execução; pools
+de threads precisam copiar o contexto. A espera por faixa vai para
+`pgdas_escalonador_espera_segundos`.
+"""
+from __future__ import annotations
+import os
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from utils.metricas import Histograma, Medidor
+
+load_dotenv()
+
+FAIXAS = ("urgente", "normal")
+ESCALONADOR_MAX_SIMULTANEAS = int(os.getenv("ESCALONADOR_MAX_SIMULTANEAS", os.getenv("SERPRO_POOL", "32")))
+
+
+def _ler_pesos(texto: str) -> Dict[str, float]:
+    pesos: Dict[str, float] = {}
+    for item in filter(None, (p.strip() for p in texto.split(","))):
+        nome, _, valor = item.partition("=")
+        pesos[nome.strip()] = float(valor)
+    return pesos
+
+
+ESCALONADOR_PESOS = _ler_pesos(os.getenv("ESCALONADOR_PESOS", ""))
+
+ESCALONADOR_ESPERA = Histograma(
+    "pgdas_escalonador_espera_segundos", "Espera por vaga antes de cada chamada ao SERPRO, por faixa", ("faixa",))
+ESCALONADOR_FILA = Medidor(
+    "pgdas_escalonador_fila", "Chamadas ao SERPRO aguardando vaga, por faixa", ("faixa",))
+ESCALONADOR_EM_ANDAMENTO = Medidor(
+    "pgdas_escalonador_em_andamento", "Chamadas ao SERPRO em andamento (limite ESCALONADOR_MAX_SIMULTANEAS)")
+
+
+@dataclass(frozen=True)
+class Submissor:
+    fluxo: str = "padrao"
+    faixa: str = "normal"
+    peso: float = 1.0
+
+
+_submissor: contextvars.ContextVar[Submissor] = contextvars.ContextVar("escalonador_submissor", default=Submissor())
+
+
+@contextmanager
+def submissor(fluxo: str, *, faixa: str = "normal", escritorio: Optional[str] = None) -> Iterator[Submissor]:
+    """
+    Chamadas ao SERPRO do bloco entram na `faixa`, como o submissor
+    `escritorio` (se houver, com o peso dele) ou `fluxo` (lote, tarefa...).
+    """
+    if faixa not in FAIXAS:
+        raise ValueError(f"faixa deve ser uma de {FAIXAS}, não {faixa!r}")
+    nome = escritorio or fluxo
+    atual = Submissor(fluxo=nome, faixa=faixa, peso=ESCALONADOR_PESOS.get(nome, 1.0))
+    token = _submissor.set(atual)
+    try:
+        yield atual
+    finally:
+        _submissor.reset(token)
+
+
+@dataclass(order=True)
+class _Pedido:
+    fim: float
+    seq: int
+    inicio: float = field(compare=False)
+    fluxo: str = field(compare=False)
+    liberado: threading.Event = field(compare=False, default_factory=threading.Event)
+
+
+class Escalonador:
+    """Semáforo com faixas de prioridade e fila justa ponderada por submissor."""
+
+    def __init__(self, max_simultaneas: int) -> None:
+        self.max_simultaneas = max_simultaneas
+        self._lock = threading.Lock()
+        self._livres = max_simultaneas
+        self._filas: Dict[str, List[_Pedido]] = {f: [] for f in FAIXAS}
+        self._virtual: Dict[str, float] = {f: 0.0 for f in FAIXAS}
+        self._ultimo_fim: Dict[Tuple[str, str], float] = {}
+        self._na_fila: Dict[Tuple[str, str], int] = {}
+        self._seq = itertools.count()
+
+    def _despachar(self) -> None:
+        """Libera pedidos enquanto houver vaga: faixa mais prioritária, menor término virtual."""
+        while self._livres > 0:
+            faixa = next((f for f in FAIXAS if self._filas[f]), None)
+            if faixa is None:
+                return
+            pedido = heapq.heappop(self._filas[faixa])
+            self._virtual[faixa] = pedido.inicio
+            chave = (faixa, pedido.fluxo)
+            self._na_fila[chave] -= 1
+            if not self._na_fila[chave]:
+                # submissor sem mais nada na fila volta no relógio da faixa
+                # (e lotes já encerrados não ficam no dicionário)
+                del self._na_fila[chave], self._ultimo_fim[chave]
+            self._livres -= 1
+            ESCALONADOR_FILA.dec(faixa=faixa)
+            ESCALONADOR_EM_ANDAMENTO.inc()
+            pedido.liberado.set()
+
+    @contextmanager
+    def vaga(self) -> Iterator[None]:
+        """Espera a vez do submissor do contexto e ocupa uma vaga durante o bloco."""
+        if self.max_simultaneas <= 0:
+            yield
+            return
+        sub = _submissor.get()
+        t0 = time.perf_counter()
+        with self._lock:
+            chave = (sub.faixa, sub.fluxo)
+            inicio = max(self._virtual[sub.faixa], self._ultimo_fim.get(chave, 0.0))
+            pedido = _Pedido(fim=inicio + 1.0 / sub.peso, seq=next(self._seq), inicio=inicio, fluxo=sub.fluxo)
+            self._ultimo_fim[chave] = pedido.fim
+            self._na_fila[chave] = self._na_fila.get(chave, 0) + 1
+            heapq.heappush(self._filas[sub.faixa], pedido)
+            ESCALONADOR_FILA.inc(faixa=sub.faixa)
+            self._despachar()
+        pedido.liberado.wait()
+        ESCALONADOR_ESPERA.observar(time.perf_counter() - t0, faixa=sub.faixa)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._livres += 1
+                ESCALONADOR_EM_ANDAMENTO.dec()
+                self._despachar()
+
+
+_escalonador: Optional[Escalonador] = None
+_escalonador_lock = threading.Lock()
+
+
+def obter_escalonador() -> Escalonador:
+    """Escalonador único do processo (o limite é por processo, como o pool HTTP)."""
+    global _escalonador
+    if _escalonador is None:
+        with _escalonador_lock:
+            if _escalonador is None:
+                _escalonador = Escalonador(ESCALONADOR_MAX_SIMULTANEAS)
+    return _escalonador
@@ -0,0 +1,290 @@
+"""
+Fechamento mensal em lote, sem depender de chamadas HTTP.
+
+    python -m utils.fechamento_mensal rodar   --pa 202505 [--arquivo cnpjs.txt] [--tipo 1]
+                                              [--threads 4] [--janela 20:00-06:00] [--limite 200]
+                                              [--modo simular|transmitir]
+    python -m utils.fechamento_mensal agendar [--janela 20:00-06:00] [--prazo-dia 20] [--threads 4]
+                                              [--modo simular|transmitir]
+    python -m utils.fechamento_mensal status  --pa 202505 [--tipo 1] [--modo simular|transmitir]
+
+A carteira vem do Domínio (empresas com movimento no PA, um CNPJ por
+raiz) ou de um arquivo (um CNPJ por linha, `#` comenta). O progresso
+fica no checkpoint do lote `fechamento_<pa>_<tipo>`
+(database/checkpoint_lote.py): rodar de novo pula quem já terminou
+(SUCESSO/JA_TRANSMITIDA) e tenta outra vez as falhas.
+
+Com `--janela`, só processa dentro do horário (pode cruzar a meia-noite)
+e para de pegar CNPJs novos quando ela fecha. `agendar` dispara todo
+dia no início da janela para o PA do mês anterior e processa só a cota
+do dia — restantes ÷ dias até o prazo — espalhando a carga até o
+vencimento (dia 20).
+
+`--modo simular` (padrão PGDAS_MODO_PADRAO) só calcula no SERPRO, com
+lote próprio (`fechamento_<pa>_<tipo>_simulacao`) e SIMULACAO_THREADS
+threads: dá para pré-conferir a carteira inteira antes do prazo.
+"""
+from __future__ import annotations
+import os
+import re
+import math
+import time
+import signal
+import logging
+import argparse
+import threading
+from pathlib import Path
+from datetime import date, datetime, time as hora, timedelta
+from typing import Dict, List, Optional, Tuple
+import pytz
+from dotenv import load_dotenv
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.triggers.cron import CronTrigger
+from database import checkpoint_lote
+from database.dominio_db import listar_cnpjs_com_movimento
+from utils import lote_pgdas
+from utils.escalonador_serpro import submissor
+from utils.modo_execucao import MODOS, PGDAS_MODO_PADRAO, SIMULACAO_SUFIXO, SIMULACAO_THREADS, em_modo, validar_modo
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(threadName)s %(message)s")
+
+# ---------------------------- CONFIG -----------------------------------
+TIMEZONE = pytz.timezone("America/Sao_Paulo")
+FECHAMENTO_JANELA = os.getenv("FECHAMENTO_JANELA", "20:00-06:00")
+FECHAMENTO_PRAZO_DIA = int(os.getenv("FECHAMENTO_PRAZO_DIA", "20"))
+FECHAMENTO_THREADS = int(os.getenv("FECHAMENTO_THREADS", "4"))
+# -----------------------------------------------------------------------
+
+_parar = threading.Event()
+
+
+def _agora() -> datetime:
+    return datetime.now(TIMEZONE)
+
+
+# ---------------------------------------------------------------------
+# janela / cota
+# ---------------------------------------------------------------------
+def ler_janela(texto: str) -> Tuple[hora, hora]:
+    """'20:00-06:00' → (20:00, 06:00)."""
+    ini, fim = (datetime.strptime(p.strip(), "%H:%M").time() for p in texto.split("-"))
+    return ini, fim
+
+
+def fim_da_janela(janela: Tuple[hora, hora], agora: datetime) -> Optional[datetime]:
+    """Quando a janela atual fecha; None se `agora` está fora dela."""
+    ini, fim = janela
+    hoje = agora.date()
+    candidatos = [hoje - timedelta(days=1), hoje] if fim <= ini else [hoje]
+    for dia in candidatos:
+        abre = TIMEZONE.localize(datetime.combine(dia, ini))
+        fecha = TIMEZONE.localize(datetime.combine(dia + timedelta(days=fim <= ini), fim))
+        if abre <= agora < fecha:
+            return fecha
+    return None
+
+
+def proxima_abertura(janela: Tuple[hora, hora], agora: datetime) -> datetime:
+    abre = TIMEZONE.localize(datetime.combine(agora.date(), janela[0]))
+    return abre if abre > agora else abre + timedelta(days=1)
+
+
+def cota_do_dia(restantes: int, hoje: date, prazo_dia: int) -> int:
+    """Restantes divididos pelos dias que faltam até o prazo (inclusive)."""
+    dias = (date(hoje.year, hoje.month, min(prazo_dia, 28)) - hoje).days + 1
+    if dias <= 0:                       # prazo passou: tudo o que falta
+        return restantes
+    return math.ceil(restantes / dias)
+
+
+def pa_anterior(hoje: date) -> int:
+    ano, mes = (hoje.year, hoje.month - 1) if hoje.month > 1 else (hoje.year - 1, 12)
+    return ano * 100 + mes
+
+
+# ---------------------------------------------------------------------
+# carteira
+# ---------------------------------------------------------------------
+def ler_arquivo(caminho: Path | str) -> List[str]:
+    cnpjs = []
+    for linha in Path(caminho).read_text(encoding="utf-8").splitlines():
+        cnpj = re.sub(r"\D", "", linha.split("#", 1)[0])
+        if cnpj:
+            cnpjs.append(cnpj)
+    return cnpjs
+
+
+def nome_lote(pa: int, tipo: int, modo: Optional[str] = None) -> str:
+    return f"fechamento_{pa}_{tipo}" + ("" if validar_modo(modo) == "transmitir" else SIMULACAO_SUFIXO)
+
+
+def threads_padrao(modo: Optional[str] = None) -> int:
+    return FECHAMENTO_THREADS if validar_modo(modo) == "transmitir" else SIMULACAO_THREADS
+
+
+def preparar_lote(pa: int, tipo: int, arquivo: Optional[str] = None, modo: Optional[str] = None) -> str:
+    """Abre (ou completa) o checkpoint do lote com a carteira do PA."""
+    modo = validar_modo(modo)
+    origem = "arquivo" if arquivo else "dominio"
+    cnpjs = ler_arquivo(arquivo) if arquivo else listar_cnpjs_com_movimento(pa)
+    lote = nome_lote(pa, tipo, modo)
+    info = checkpoint_lote.abrir_lote(lote, cnpjs, fluxo="pgdas", pa=pa, tipoDeclaracao=tipo, origem=origem,
+                                      modo=modo)
+    logging.info("Lote %s: %s CNPJs (%s novos, origem %s)", lote, info["total"], info["novos"], origem)
+    return lote
+
+
+# ---------------------------------------------------------------------
+# execução
+# ---------------------------------------------------------------------
+def processar(lote: str, cnpjs: List[str], pa: int, tipo: int, *, threads: int,
+              fim: Optional[datetime] = None, modo: Optional[str] = None) -> Dict[str, int]:
+    """
+    Processa `cnpjs` com `threads` em paralelo, no `modo` dado, gravando
+    etapas e resultado de cada um no checkpoint; quem já tinha 202 numa
+    execução anterior só volta ao /Monitorar. Não pega CNPJ novo depois
+    de `fim` nem após SIGTERM.
+    """
+    fila = iter(cnpjs)
+    lock = threading.Lock()
+    contagem: Dict[str, int] = {}
+    with em_modo(modo):
+        pedidos = lote_pgdas.pedidos_em_aberto(lote)
+
+    def loop() -> None:
+        while not _parar.is_set() and (fim is None or _agora() < fim):
+            with lock:
+                cnpj = next(fila, None)
+            if cnpj is None:
+                return
+            # threads novas não herdam o contexto; no escalonador SERPRO o
+            # fechamento é um submissor só (o lote), na faixa normal
+            with em_modo(modo), submissor(lote):
+                resultado = lote_pgdas.processar_cnpj(lote, cnpj, pa, tipo, response_id=pedidos.get(cnpj))
+            status = resultado.get("status", "FALHA")
+            with lock:
+                contagem[status] = contagem.get(status, 0) + 1
+
+    trabalhadores = [threading.Thread(target=loop, name=f"fechamento-{i}") for i in range(max(threads, 1))]
+    for t in trabalhadores:
+        t.start()
+    for t in trabalhadores:
+        t.join()
+    return contagem
+
+
+def rodar(pa: int, tipo: int, *, arquivo: Optional[str] = None, threads: Optional[int] = None,
+          janela: Optional[Tuple[hora, hora]] = None, limite: Optional[int] = None,
+          modo: Optional[str] = None) -> Dict[str, int]:
+    """Uma execução: espera a janela abrir (se houver) e processa o que falta."""
+    modo = validar_modo(modo)
+    threads = threads or threads_padrao(modo)
+    lote = preparar_lote(pa, tipo, arquivo, modo)
+    fim = None
+    if janela:
+        fim = fim_da_janela(janela, _agora())
+        if fim is None:
+            abre = proxima_abertura(janela, _agora())
+            logging.info("Fora da janela; aguardando até %s", abre.isoformat(timespec="minutes"))
+            while not _parar.is_set() and _agora() < abre:
+                _parar.wait(min(60.0, max((abre - _agora()).total_seconds(), 0.0)))
+            fim = fim_da_janela(janela, _agora())
+
+    pendentes = checkpoint_lote.restantes(lote)
+    if limite is not None:
+        pendentes = pendentes[:limite]
+    logging.info("Processando %s CNPJs do lote %s com %s threads (%s)", len(pendentes), lote, threads, modo)
+    t0 = time.perf_counter()
+    contagem = processar(lote, pendentes, pa, tipo, threads=threads, fim=fim, modo=modo)
+    logging.info("Lote %s: %s em %.0fs; restam %s", lote, contagem, time.perf_counter() - t0,
+                 len(checkpoint_lote.restantes(lote)))
+    return contagem
+
+
+def executar_dia(tipo: int, threads: int, janela: Tuple[hora, hora], prazo_dia: int,
+                 modo: Optional[str] = None) -> None:
+    """Job diário do agendador: cota do dia do PA anterior, dentro da janela."""
+    modo = validar_modo(modo)
+    hoje = _agora().date()
+    pa = pa_anterior(hoje)
+    lote = preparar_lote(pa, tipo, modo=modo)
+    pendentes = checkpoint_lote.restantes(lote)
+    if not pendentes:
+        logging.info("Lote %s já concluído", lote)
+        return
+    cota = cota_do_dia(len(pendentes), hoje, prazo_dia)
+    logging.info("Lote %s: %s restantes, cota de hoje %s", lote, len(pendentes), cota)
+    processar(lote, pendentes[:cota], pa, tipo, threads=threads, fim=fim_da_janela(janela, _agora()), modo=modo)
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fechamento mensal PGDAS-D em lote")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p_rodar = sub.add_parser("rodar", help="processa agora o que falta do PA")
+    p_rodar.add_argument("--pa", type=int, required=True)
+    p_rodar.add_argument("--arquivo", help="um CNPJ por linha (padrão: carteira do Domínio)")
+    p_rodar.add_argument("--limite", type=int, help="no máximo N CNPJs nesta execução")
+
+    p_agendar = sub.add_parser("agendar", help="todo dia no início da janela, cota até o prazo")
+    p_agendar.add_argument("--prazo-dia", type=int, default=FECHAMENTO_PRAZO_DIA)
+    p_agendar.add_argument("--agora", action="store_true", help="executa a cota de hoje antes de agendar")
+
+    for p in (p_rodar, p_agendar):
+        p.add_argument("--tipo", type=int, choices=(1, 2), default=1)
+        p.add_argument("--threads", type=int, help="padrão: FECHAMENTO_THREADS, ou SIMULACAO_THREADS ao simular")
+        p.add_argument("--janela", default=None if p is p_rodar else FECHAMENTO_JANELA,
+                       help="HH:MM-HH:MM (America/Sao_Paulo)")
+
+    p_status = sub.add_parser("status", help="situação do lote do PA")
+    p_status.add_argument("--pa", type=int, required=True)
+    p_status.add_argument("--tipo", type=int, choices=(1, 2), default=1)
+
+    for p in (p_rodar, p_agendar, p_status):
+        p.add_argument("--modo", choices=MODOS, default=PGDAS_MODO_PADRAO)
+
+    args = ap.parse_args()
+
+    if args.cmd == "status":
+        print(checkpoint_lote.resumo(nome_lote(args.pa, args.tipo, args.modo)) or "lote não encontrado")
+        return
+
+    args.threads = args.threads or threads_padrao(args.modo)
+
+    janela = ler_janela(args.janela) if args.janela else None
+
+    def encerrar(*_) -> None:
+        # threads em andamento terminam o CNPJ atual e não pegam outro
+        _parar.set()
+        if args.cmd == "agendar":
+            raise SystemExit(0)
+
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sinal, encerrar)
+
+    if args.cmd == "rodar":
+        rodar(args.pa, args.tipo, arquivo=args.arquivo, threads=args.threads, janela=janela, limite=args.limite,
+              modo=args.modo)
+        return
+
+    if args.agora and fim_da_janela(janela, _agora()):
+        executar_dia(args.tipo, args.threads, janela, args.prazo_dia, args.modo)
+
+    scheduler = BlockingScheduler(timezone=TIMEZONE)
+    scheduler.add_job(executar_dia,
+                      args=(args.tipo, args.threads, janela, args.prazo_dia, args.modo),
+                      id="fechamento_mensal",
+                      trigger=CronTrigger(hour=janela[0].hour, minute=janela[0].minute),
+                      max_instances=1,
+                      misfire_grace_time=3600)
+    print(f"Scheduler ativo – fechamento diário ({args.modo}) às {janela[0]:%H:%M}, janela {args.janela} "
+          f"(America/Sao_Paulo), prazo dia {args.prazo_dia}.  Ctrl+C para sair.")
+    scheduler.start()
+
+
+if __name__ == "__main__":
+    main()
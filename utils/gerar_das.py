@@ -1,11 +1,11 @@
-import json
 from datetime import date, timedelta
 from typing import Any, Dict
-from utils.uploader_serpro import SerproClient
-
-_client = SerproClient()
+from utils.uploader_serpro import obter_cliente
+from utils.serializacao import loads, ErroJSON
+from utils.metricas import medir
 
 
+@medir("gerar_das_unico")
 def gerar_das_unico(cnpj: str, pa: int, data_consolidacao: str | None = None) -> Dict[str, Any]:
     """
        Emite um DAS para o CNPJ e PA informados.
@@ -26,7 +26,7 @@ def gerar_das_unico(cnpj: str, pa: int, data_consolidacao: str | None = None) ->
     }
 
     # 2) chama o serviço
-    resp = _client.enviar("das", payload)
+    resp = obter_cliente().enviar("das", payload)
     body = resp.get("body")
     raw_resp = {"status": resp.get("status"), "body": body}
 
@@ -42,11 +42,11 @@ def gerar_das_unico(cnpj: str, pa: int, data_consolidacao: str | None = None) ->
     raw_dados = body.get("dados")
     parsed = None
 
-    # quando vem string, fazemos json.loads
+    # quando vem string, fazemos loads
     if isinstance(raw_dados, str) and raw_dados.strip():
         try:
-            parsed = json.loads(raw_dados)
-        except json.JSONDecodeError:
+            parsed = loads(raw_dados)
+        except ErroJSON:
             # volta sucesso, mas sem PDF se não decodificar
             return {"status": "SUCESSO", "cnpj": cnpj, "das_pdf_b64": None, "detalhamento": None, "serpro_response": raw_resp}
     elif isinstance(raw_dados, (list, dict)):
@@ -3,6 +3,9 @@ from datetime import datetime, date
 from typing import Dict, Any, Iterable
 from dicionario_id.segment_rules import SEGMENT_RULES
 from database.dominio_db import buscar_folha as _buscar_folha_db
+from database.cache_empresas import cnpj_matriz as _cnpj_matriz_cadastro, e_matriz
+from utils.metricas import medir
+from utils.modo_execucao import transmitindo
 
 
 # ---------------------------------------------------------------------------
@@ -41,12 +44,17 @@ def buscar_folha(cnpj: str, pa: int) -> float | None:
     return _buscar_folha_db(cnpj, pa)
 
 
+@medir("folhas_salario")
 def _folhas_salario(cnpj: str, pa: int) -> list[dict[str, float]]:
-    meses = _pa_anteriores(pa, 12)
-    folhas = []
-    for m in meses:
-        valor = buscar_folha(cnpj, m) or 0.0
-        folhas.append({"pa": m, "valor": round(valor, 2)})
+    return folhas_de_valores({m: buscar_folha(cnpj, m) for m in _pa_anteriores(pa, 12)}, pa)
+
+
+def folhas_de_valores(valores: Dict[int, float | None], pa: int) -> list[dict[str, float]]:
+    """
+    folhasSalario dos 12 meses anteriores ao PA a partir de {AAAAMM: valor}
+    (mês ausente = 0), para quem já tem as folhas carregadas em lote.
+    """
+    folhas = [{"pa": m, "valor": round(valores.get(m) or 0.0, 2)} for m in _pa_anteriores(pa, 12)]
     # 2) filtra só se existir alguma folha com valor > 0
     if not any(f["valor"] > 0 for f in folhas):
         return []
@@ -58,7 +66,7 @@ def _folhas_salario(cnpj: str, pa: int) -> list[dict[str, float]]:
 _IDS_FATOR_R_ANEXO_3 = {10, 11, 12}
 
 
-def _precisa_folha(rows):
+def precisa_folha(rows):
     # Se algum anexo 5, já precisa folha
     if any(r["anexo"] == 5 for r in rows):
         return True
@@ -71,6 +79,20 @@ def _precisa_folha(rows):
     return False
 
 
+# ---------------------------------------------------------------------------
+# matriz
+# ---------------------------------------------------------------------------
+def _cnpj_matriz(rows: list[Dict[str, Any]]) -> str:
+    """
+    Matriz pelo cadastro (geempre em cache); se a raiz não estiver lá,
+    procura a ordem 0001 nas próprias linhas e, por fim, usa a primeira.
+    """
+    matriz = _cnpj_matriz_cadastro(rows[0]["cgce_emp"])
+    if matriz:
+        return matriz
+    return next((r["cgce_emp"] for r in rows if e_matriz(r["cgce_emp"])), rows[0]["cgce_emp"])
+
+
 # ---------------------------------------------------------------------------
 # mercado interno × externo
 # ---------------------------------------------------------------------------
@@ -107,7 +129,13 @@ def _clean(obj: Any) -> Any:
 # ---------------------------------------------------------------------------
 # montar JSON PGDAS-D
 # ---------------------------------------------------------------------------
-def montar_json(rows: Iterable[Dict[str, Any]], tipo_declaracao: int = 1) -> Dict[str, Any]:
+@medir("montar_json")
+def montar_json(rows: Iterable[Dict[str, Any]], tipo_declaracao: int = 1, *,
+                folhas: list[dict[str, float]] | None = None) -> Dict[str, Any]:
+    """
+    Payload PGDAS-D a partir das linhas do Domínio. `folhas` (já no
+    formato folhasSalario) evita buscar a folha no Domínio por mês.
+    """
     rows = list(rows)
 
     # SE NÃO EXISTIR MOVIMENTO
@@ -120,7 +148,7 @@ def montar_json(rows: Iterable[Dict[str, Any]], tipo_declaracao: int = 1) -> Dic
         raise ValueError("Sem movimento, mas rows vazio: precisa de pelo menos 1 registro para obter PA e CNPJ")
 
     pa = _pa_from_date(_as_date(rows[0]["data_sim"]))
-    cnpj_matriz = next((r["cgce_emp"] for r in rows if r["cgce_emp"].endswith("0001")), rows[0]["cgce_emp"])
+    cnpj_matriz = _cnpj_matriz(rows)
 
     if not movimento:
         # ===== SEM MOVIMENTO =====
@@ -142,7 +170,7 @@ def montar_json(rows: Iterable[Dict[str, Any]], tipo_declaracao: int = 1) -> Dic
         payload = {
             "cnpjCompleto": cnpj_matriz,
             "pa": pa,
-            "indicadorTransmissao": False,     # APÓS TESTES ALTERAR PARA TRUE, QUANDO FOR TRANSMITIR DE VERDADE.
+            "indicadorTransmissao": transmitindo(),   # modo simular → só cálculo (utils/modo_execucao.py)
             "indicadorComparacao": False,
             "declaracao": declaracao
         }
@@ -161,8 +189,9 @@ def montar_json(rows: Iterable[Dict[str, Any]], tipo_declaracao: int = 1) -> Dic
         "naoOptante": None,
         "estabelecimentos": []
     }
-    if _precisa_folha(rows):
-        folhas = _folhas_salario(cnpj_matriz, pa)
+    if precisa_folha(rows):
+        if folhas is None:
+            folhas = _folhas_salario(cnpj_matriz, pa)
         if folhas:
             print(f"Incluindo folhasSalario para {cnpj_matriz} PA {pa}: {folhas}")
             declaracao["folhasSalario"] = folhas
@@ -170,7 +199,7 @@ def montar_json(rows: Iterable[Dict[str, Any]], tipo_declaracao: int = 1) -> Dic
     payload = {
         "cnpjCompleto": cnpj_matriz,
         "pa": pa,
-        "indicadorTransmissao": False,      # APÓS TESTES ALTERAR PARA TRUE, QUANDO FOR TRANSMITIR DE VERDADE.
+        "indicadorTransmissao": transmitindo(),   # modo simular → só cálculo (utils/modo_execucao.py)
         "indicadorComparacao": False,
         "declaracao": declaracao,
         "valoresParaComparacao": []
@@ -0,0 +1,137 @@
+"""
+Lotes PGDAS-D com checkpoint por CNPJ e retomada.
+
+Cada chamada de /transmitir-pgdas abre um lote em `checkpoint_lotes`
+(database/checkpoint_lote.py) com todos os CNPJs; o pipeline grava a
+etapa de cada um (BUSCADO → MONTADO → ENVIADO → MONITORANDO com o
+`responseId` → CONCLUIDO). Se o processo morrer no meio, `retomar`:
+  1. concilia com o Mongo: declaração em SUCESSO gravada depois da
+     abertura do lote só é marcada no lote (SUCESSO anterior — outra
+     retificadora, uma simulação antiga — não é resposta deste lote);
+     PENDENTE sem `responseId` ou etapa ENVIADO sem pedido em aberto
+     (enviada, resposta perdida) é reenviada se for ORIGINAL, que volta
+     como JA_TRANSMITIDA. Retificadora transmitida não é reenviada
+     (seria uma segunda retificadora): fica FALHA com `revisao_manual`;
+  2. volta ao /Monitorar dos CNPJs cujo `responseId` ainda está em
+     aberto na declaração, sem reenviar;
+  3. processa só o que falta.
+"""
+from __future__ import annotations
+import uuid
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, Optional
+from database import checkpoint_lote
+from database.db_schema import pedidos_pendentes, situacao_declaracoes, update_failure
+from utils.modo_execucao import em_modo, modo_atual, transmitindo
+from utils.pipeline import processar_pgdas
+
+
+def abrir(cnpjs: Iterable[str], pa: int, tipo: int, *, lote: Optional[str] = None, origem: str = "api") -> str:
+    """Abre o lote (no modo atual) com todos os CNPJs PENDENTE; devolve o id."""
+    lote = lote or f"pgdas_{uuid.uuid4().hex}"
+    checkpoint_lote.abrir_lote(lote, cnpjs, fluxo="pgdas", pa=pa, tipoDeclaracao=tipo, origem=origem,
+                               modo=modo_atual())
+    return lote
+
+
+def pedidos_em_aberto(lote: str) -> Dict[str, str]:
+    """
+    {cnpj: responseId} dos CNPJs não concluídos do lote com pedido 202
+    ainda em aberto. Vale o que está na declaração (modo atual), gravado
+    junto com a etapa MONITORANDO: um pedido que já terminou em FALHA
+    (ex.: 404 no /Monitorar) não é retomado de novo.
+    """
+    doc = checkpoint_lote.obter_lote(lote) or {}
+    abertos = [c for c, s in doc.get("cnpjs", {}).items() if s.get("status") not in checkpoint_lote.CONCLUIDOS]
+    if not abertos:
+        return {}
+    return pedidos_pendentes(abertos, doc["pa"], doc["tipoDeclaracao"])
+
+
+def processar_cnpj(lote: str, cnpj: str, pa: int, tipo: int, *, response_id: Optional[str] = None,
+                   detalhar_tempos: bool = False) -> Dict[str, Any]:
+    """processar_pgdas com as etapas gravadas no lote e o resultado marcado no fim."""
+    with checkpoint_lote.acompanhar(lote, cnpj):
+        try:
+            resultado = processar_pgdas(cnpj, pa, tipo, detalhar_tempos=detalhar_tempos, response_id=response_id)
+        except Exception as e:
+            logging.exception("Erro no lote %s, CNPJ %s", lote, cnpj)
+            resultado = {"cnpj": cnpj, "status": "FALHA", "erro": str(e)}
+    checkpoint_lote.marcar(lote, cnpj, resultado.get("status", "FALHA"), resultado.get("erro"))
+    return resultado
+
+
+def executar(lote: str, cnpjs: Iterable[str], pa: int, tipo: int, *, threads: int = 1,
+             pedidos: Optional[Dict[str, str]] = None, detalhar_tempos: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Processa `cnpjs` do lote, na ordem da lista. Com `threads` > 1 roda
+    em paralelo (perfil da simulação), cada CNPJ com cópia do contexto
+    (modo e span do lote). `pedidos` ({cnpj: responseId}, padrão
+    `pedidos_em_aberto`) são só acompanhados, não reenviados.
+    """
+    if pedidos is None:
+        pedidos = pedidos_em_aberto(lote)
+    if threads <= 1:
+        for cnpj in cnpjs:
+            yield processar_cnpj(lote, cnpj, pa, tipo, response_id=pedidos.get(cnpj),
+                                 detalhar_tempos=detalhar_tempos)
+        return
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="lote") as pool:
+        futuros = [pool.submit(contextvars.copy_context().run, processar_cnpj, lote, cnpj, pa, tipo,
+                               response_id=pedidos.get(cnpj), detalhar_tempos=detalhar_tempos)
+                   for cnpj in cnpjs]
+        for f in futuros:
+            yield f.result()
+
+
+def retomar(lote: str, *, threads: int = 1, detalhar_tempos: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Continua um lote interrompido, no modo em que foi aberto. Gera um
+    resultado por CNPJ que ainda não tinha terminado; os conciliados com
+    o Mongo vêm com `"reconciliado": true`. KeyError se o lote não existe.
+    """
+    doc = checkpoint_lote.obter_lote(lote)
+    if doc is None:
+        raise KeyError(lote)
+    pa, tipo = doc["pa"], doc["tipoDeclaracao"]
+
+    with em_modo(doc.get("modo")):
+        restantes = checkpoint_lote.restantes(lote)
+        pedidos = pedidos_em_aberto(lote)
+        # a declaração só é regravada depois da resposta: SUCESSO deste lote
+        # tem criado_em a partir da abertura dele
+        situacao = situacao_declaracoes(restantes, pa, tipo, desde=doc["criado_em"])
+        retificadora_real = tipo == 2 and transmitindo()
+
+        faltam = []
+        for cnpj in restantes:
+            status = situacao.get(cnpj)
+            if status == "SUCESSO":
+                # gravado no Mongo, mas o processo caiu antes de marcar o lote
+                checkpoint_lote.marcar(lote, cnpj, "SUCESSO")
+                yield {"cnpj": cnpj, "status": "SUCESSO", "reconciliado": True}
+                continue
+            etapa = doc["cnpjs"][cnpj].get("etapa")
+            # sobre um SUCESSO ANTERIOR o 202 não fica registrado (registrar_pedido
+            # não toca SUCESSO): MONITORANDO também é enviado sem pedido em aberto
+            enviado = (status == "PENDENTE" or etapa == "ENVIADO"
+                       or (status == "ANTERIOR" and etapa == "MONITORANDO"))
+            if enviado and cnpj not in pedidos:
+                # o SERPRO (pode ter) aceitado, mas a resposta não chegou ao Mongo
+                if retificadora_real:
+                    erro = "enviado, resposta perdida: conferir no PGDAS-D antes de reenviar"
+                    checkpoint_lote.marcar(lote, cnpj, "FALHA", erro, revisao_manual=True)
+                    yield {"cnpj": cnpj, "status": "FALHA", "erro": erro, "revisao_manual": True}
+                    continue
+                # ORIGINAL (ou simulação): reenvia; a já transmitida volta como JA_TRANSMITIDA
+                if status == "PENDENTE":
+                    update_failure(cnpj, pa, tipo, None, f"lote {lote} interrompido antes de gravar a resposta")
+            faltam.append(cnpj)
+
+        logging.info("Retomando lote %s: %s CNPJs, %s só no /Monitorar", lote, len(faltam),
+                     sum(c in pedidos for c in faltam))
+        yield from executar(lote, faltam, pa, tipo, threads=threads, pedidos=pedidos,
+                            detalhar_tempos=detalhar_tempos)
@@ -0,0 +1,219 @@
+"""
+Métricas em memória no formato texto do Prometheus (GET /metrics).
+
+    ETAPA_SEGUNDOS.observar(0.42, etapa="buscar_simples")
+    SERPRO_STATUS.inc(servico="pgdas", status="200")
+
+    @medir("montar_json")            # decorator ou `with medir(...)`
+    def montar_json(...): ...
+
+`medir` também alimenta o detalhamento por CNPJ: dentro de
+`with coletar_tempos() as tempos:` cada etapa medida soma sua duração
+em `tempos[etapa]` (usado pelo `"detalharTempos": true` das rotas).
+Cada etapa medida também abre um span (utils.rastreamento) com o mesmo nome.
+"""
+from __future__ import annotations
+import copy
+import time
+import threading
+import contextvars
+from contextlib import ContextDecorator, contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from utils.rastreamento import span
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registro: List["_Metrica"] = []
+_registro_lock = threading.Lock()
+
+
+def _fmt_rotulos(nomes: Tuple[str, ...], valores: Tuple[str, ...], extra: str = "") -> str:
+    pares = [f'{n}="{str(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()) -> None:
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        with _registro_lock:
+            _registro.append(self)
+
+    def _chave(self, rotulos: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(rotulos.get(n, "")) for n in self.rotulos)
+
+    def exportar(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"] + self._linhas()
+
+    def _linhas(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()) -> None:
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, valor: float = 1, **rotulos: str) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos: str) -> float:
+        return self._valores.get(self._chave(rotulos), 0)
+
+    def _linhas(self) -> List[str]:
+        with self._lock:
+            itens = list(self._valores.items())
+        return [f"{self.nome}{_fmt_rotulos(self.rotulos, k)} {v}" for k, v in itens]
+
+
+class Medidor(_Metrica):
+    """Gauge; `funcao` permite ler o valor na hora da coleta (ex.: tamanho de fila)."""
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (),
+                 funcao: Optional[Callable[[], float]] = None) -> None:
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._funcao = funcao
+
+    def set(self, valor: float, **rotulos: str) -> None:
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+    def inc(self, valor: float = 1, **rotulos: str) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def dec(self, valor: float = 1, **rotulos: str) -> None:
+        self.inc(-valor, **rotulos)
+
+    def _linhas(self) -> List[str]:
+        if self._funcao is not None:
+            return [f"{self.nome} {self._funcao()}"]
+        with self._lock:
+            itens = list(self._valores.items())
+        return [f"{self.nome}{_fmt_rotulos(self.rotulos, k)} {v}" for k, v in itens]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = _BUCKETS) -> None:
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets))
+        # chave → [contagens por bucket..., soma, total]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observar(self, valor: float, **rotulos: str) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._series.setdefault(chave, [0] * (len(self.buckets) + 2))
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def _linhas(self) -> List[str]:
+        with self._lock:
+            itens = [(k, list(v)) for k, v in self._series.items()]
+        linhas = []
+        for chave, serie in itens:
+            for limite, qtd in zip(self.buckets, serie):
+                le = 'le="%s"' % limite
+                linhas.append(f"{self.nome}_bucket{_fmt_rotulos(self.rotulos, chave, le)} {qtd}")
+            le = 'le="+Inf"'
+            linhas.append(f"{self.nome}_bucket{_fmt_rotulos(self.rotulos, chave, le)} {serie[-1]}")
+            linhas.append(f"{self.nome}_sum{_fmt_rotulos(self.rotulos, chave)} {serie[-2]}")
+            linhas.append(f"{self.nome}_count{_fmt_rotulos(self.rotulos, chave)} {serie[-1]}")
+        return linhas
+
+
+def exportar() -> str:
+    """Todas as métricas registradas, no formato texto do Prometheus."""
+    with _registro_lock:
+        metricas = list(_registro)
+    return "\n".join(linha for m in metricas for linha in m.exportar()) + "\n"
+
+
+# ---------------------------------------------------------------------
+# métricas do pipeline
+# ---------------------------------------------------------------------
+ETAPA_SEGUNDOS = Histograma(
+    "pgdas_etapa_segundos", "Duração de cada etapa do pipeline", ("etapa",))
+SERPRO_SEGUNDOS = Histograma(
+    "pgdas_serpro_requisicao_segundos", "Duração de cada tentativa HTTP ao SERPRO", ("servico",))
+SERPRO_STATUS = Contador(
+    "pgdas_serpro_http_status_total", "Respostas HTTP do SERPRO por serviço e status", ("servico", "status"))
+SERPRO_RETENTATIVAS = Contador(
+    "pgdas_serpro_retentativas_total", "Novas tentativas após 5xx/erro de rede", ("servico",))
+MONITORAR_POLLS = Contador(
+    "pgdas_monitorar_polls_total", "Chamadas ao /Monitorar")
+TOKEN_RENOVACOES = Contador(
+    "pgdas_token_renovacoes_total", "Renovações de token no /token")
+RESULTADOS = Contador(
+    "pgdas_resultados_total", "Resultados por fluxo e status", ("fluxo", "status"))
+DAS_CACHE = Contador(
+    "pgdas_das_cache_total", "DAS servidos do Mongo (acerto) ou emitidos (falta|vencido|forcado)", ("resultado",))
+VALIDACAO_FALHAS = Contador(
+    "pgdas_validacao_falhas_total", "Problemas encontrados na validação antes do envio", ("regra",))
+PEDIDOS_RECONCILIADOS = Contador(
+    "pgdas_pedidos_reconciliados_total", "Pedidos 202 parados retomados no /Monitorar, por status final", ("status",))
+
+
+# ---------------------------------------------------------------------
+# cronômetro + detalhamento por CNPJ
+# ---------------------------------------------------------------------
+_tempos: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("pgdas_tempos", default=None)
+
+
+class medir(ContextDecorator):
+    """Mede a duração de uma etapa (decorator ou context manager) e abre o span dela."""
+
+    def __init__(self, etapa: str, histograma: Histograma = ETAPA_SEGUNDOS, **rotulos: str) -> None:
+        self.etapa = etapa
+        self.histograma = histograma
+        self.rotulos = rotulos or {"etapa": etapa}
+        self._inicio = 0.0
+        self._span: Optional[span] = None
+
+    def _recreate_cm(self) -> "medir":
+        # cada chamada do decorator ganha sua própria instância (threads)
+        return copy.copy(self)
+
+    def __enter__(self) -> "medir":
+        self._span = span(self.etapa, **{k: v for k, v in self.rotulos.items() if k != "etapa"})
+        self._span.__enter__()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        duracao = time.perf_counter() - self._inicio
+        self._span.__exit__(*exc)
+        self.histograma.observar(duracao, **self.rotulos)
+        tempos = _tempos.get()
+        if tempos is not None:
+            tempos[self.etapa] = round(tempos.get(self.etapa, 0.0) + duracao, 4)
+
+
+@contextmanager
+def coletar_tempos() -> Iterator[Dict[str, float]]:
+    """Acumula, em um dict, a duração (s) de cada etapa medida no bloco."""
+    tempos: Dict[str, float] = {}
+    token = _tempos.set(tempos)
+    try:
+        yield tempos
+    finally:
+        _tempos.reset(token)
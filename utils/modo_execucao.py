@@ -0,0 +1,73 @@
+"""
+Modo de execução do PGDAS-D: `simular` ou `transmitir`.
+
+    simular     indicadorTransmissao=false: o SERPRO só calcula, nada é
+                declarado. Resultados em coleções `<nome>_simulacao` e
+                arquivos em `<ARQUIVO_DIR>/simulacao`, e perfil de
+                concorrência próprio (SIMULACAO_THREADS) para rodar a
+                carteira inteira antes do vencimento.
+    transmitir  indicadorTransmissao=true: declaração de verdade, nas
+                coleções e pastas de sempre.
+
+O modo vale para o contexto atual (contextvars), então rotas, lote e
+workers de fila escolhem o seu sem mexer em código; fora de `em_modo`
+vale PGDAS_MODO_PADRAO (padrão `simular`, o comportamento de antes).
+Pools de threads precisam copiar o contexto (`contextvars.copy_context`).
+"""
+from __future__ import annotations
+import os
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODOS = ("simular", "transmitir")
+PGDAS_MODO_PADRAO = os.getenv("PGDAS_MODO_PADRAO", "simular")
+SIMULACAO_SUFIXO = os.getenv("SIMULACAO_SUFIXO", "_simulacao")
+SIMULACAO_THREADS = int(os.getenv("SIMULACAO_THREADS", "16"))
+
+if PGDAS_MODO_PADRAO not in MODOS:
+    raise ValueError(f"PGDAS_MODO_PADRAO deve ser um de {MODOS}, não {PGDAS_MODO_PADRAO!r}")
+
+_modo: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("pgdas_modo", default=None)
+
+
+def validar_modo(modo: Optional[str]) -> str:
+    """None → modo padrão; valor fora de MODOS levanta ValueError."""
+    if modo is None:
+        return PGDAS_MODO_PADRAO
+    if modo not in MODOS:
+        raise ValueError(f"modo deve ser um de {MODOS}, não {modo!r}")
+    return modo
+
+
+def modo_atual() -> str:
+    return _modo.get() or PGDAS_MODO_PADRAO
+
+
+def transmitindo() -> bool:
+    return modo_atual() == "transmitir"
+
+
+@contextmanager
+def em_modo(modo: Optional[str]) -> Iterator[str]:
+    """Executa o bloco no modo dado (None = padrão)."""
+    token = _modo.set(validar_modo(modo))
+    try:
+        yield _modo.get()
+    finally:
+        _modo.reset(token)
+
+
+def nome_colecao(nome: str) -> str:
+    """Coleção do modo atual: `nome` ao transmitir, `nome + SIMULACAO_SUFIXO` ao simular."""
+    return nome if transmitindo() else nome + SIMULACAO_SUFIXO
+
+
+def diretorio_arquivo() -> Path:
+    """ARQUIVO_DIR (ou json/ na raiz) ao transmitir; a subpasta simulacao/ ao simular."""
+    base = Path(os.getenv("ARQUIVO_DIR") or Path(__file__).resolve().parent.parent / "json")
+    return base if transmitindo() else base / "simulacao"
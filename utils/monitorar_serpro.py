@@ -2,49 +2,69 @@ from __future__ import annotations
 import os
 import time
 import logging
-import requests
 from dotenv import load_dotenv
 from typing import Dict, Any, Tuple
-from utils.uploader_serpro import SerproClient
+from utils.uploader_serpro import obter_cliente
+from utils.serializacao import loads
+from utils.metricas import medir, MONITORAR_POLLS
+from utils.rastreamento import span, definir_atributo
+from utils.escalonador_serpro import obter_escalonador
 
 load_dotenv()
 
 _URL_BASE = os.getenv("URL_BASE", "").rstrip("/")
 _ENDPOINT = f"{_URL_BASE}/Monitorar"
-_POLL_SEC = 4
+_POLL_SEC = float(os.getenv("MONITORAR_POLL_SEG", "4"))
 
-client = SerproClient()
+
+class MonitorarTempoExcedido(RuntimeError):
+    """Prazo do polling esgotado com o pedido ainda em processamento no SERPRO."""
+
+    def __init__(self, pedido_id: str) -> None:
+        super().__init__("Monitorar: tempo máximo excedido")
+        self.pedido_id = pedido_id
 
 
 def _envelope(pedido_id: str) -> Dict[str, Any]:
     return {"idPedidoDados": pedido_id}
 
 
+@medir("monitorar_pedido")
 def monitorar_pedido(pedido_id: str, *, timeout: Tuple[int, int] = (10, 30), max_min: int = 3) -> Dict[str, Any]:
     """
     Faz polling em /Monitorar até o pedido sair de PROCESSANDO ou EM_FILA
-    ou até max_min minutos.
+    ou até max_min minutos (MonitorarTempoExcedido: o pedido continua
+    válido e pode ser retomado depois com o mesmo id).
     """
     deadline = time.time() + 60 * max_min
+    definir_atributo("idPedidoDados", pedido_id)
+
+    cliente = obter_cliente()
 
     while True:
-        # monta headers (inclui Bearer, jwt e X-Api-Key)
-        headers = client.build_headers("pgdas")
+        with span("serpro.monitorar_poll", idPedidoDados=pedido_id):
+            # monta headers (inclui Bearer, jwt e X-Api-Key)
+            headers = cliente.build_headers("pgdas")
 
-        # dispara /Monitorar
-        r = requests.post(
-            _ENDPOINT,
-            headers=headers,
-            json=_envelope(pedido_id),
-            timeout=timeout
-        )
+            # dispara /Monitorar (mesma sessão/pool e escalonador do SerproClient)
+            MONITORAR_POLLS.inc()
+            with obter_escalonador().vaga():
+                r = cliente.sessao.post(
+                    _ENDPOINT,
+                    headers=headers,
+                    json=_envelope(pedido_id),
+                    timeout=timeout
+                )
 
-        try:
-            body = r.json()
-        except ValueError:
-            body = r.text
+            try:
+                body = loads(r.content)
+            except ValueError:
+                body = r.text
 
-        logging.info("Monitorar %s → HTTP %s", pedido_id, r.status_code)
+            logging.info("Monitorar %s → HTTP %s", pedido_id, r.status_code)
+            definir_atributo("http.status_code", r.status_code)
+            if isinstance(body, dict):
+                definir_atributo("serpro.situacao", str(body.get("situacao")))
 
         # terminou?
         if r.status_code == 200 \
@@ -53,6 +73,6 @@ def monitorar_pedido(pedido_id: str, *, timeout: Tuple[int, int] = (10, 30), max
             return body
 
         if time.time() >= deadline:
-            raise RuntimeError("Monitorar: tempo máximo excedido")
+            raise MonitorarTempoExcedido(pedido_id)
 
         time.sleep(_POLL_SEC)
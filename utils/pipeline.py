@@ -0,0 +1,439 @@
+"""
+Processamento por CNPJ dos fluxos PGDAS-D e DAS.
+
+Cada função trata um único CNPJ e devolve o dicionário de resultado
+(SUCESSO | JA_TRANSMITIDA | FALHA), já persistido no Mongo. As rotas do
+`main` só iteram a lista de CNPJs e decidem como devolver os resultados
+(lista única ou NDJSON em streaming).
+"""
+from __future__ import annotations
+import os
+import logging
+import copy
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from pymongo.errors import DuplicateKeyError
+from database.db_schema import (
+    insert_transmission, update_success, update_failure, registrar_pedido, marcar_monitorar_excedido,
+    payload_do_pedido, pedidos_pendentes,
+    insert_das_transmission, update_das_success, update_das_failure, gravar_das,
+    buscar_das_emitidos, buscar_das_pdf,
+)
+from database.dominio_db import buscar_simples
+from database.preparados import obter_preparado
+from database import checkpoint_lote
+from utils.json_builder import montar_json
+from utils.validacao import montar_validado, VALIDACAO_PRE_ENVIO
+from utils.modo_execucao import transmitindo
+from utils.arquivador import arquivar_payload, arquivar_resposta
+from utils.uploader_serpro import obter_cliente
+from utils.monitorar_serpro import monitorar_pedido, MonitorarTempoExcedido
+from utils.resposta_serpro import GuiaPdf, RespostaPgdas
+from utils.gerar_das import gerar_das_unico
+from utils.resp_controle import montar_payload_parceiro
+from utils.serializacao import dumps
+from utils.metricas import medir, coletar_tempos, RESULTADOS, DAS_CACHE
+from utils.rastreamento import span, definir_atributo
+
+# DAS emitidos em paralelo no fluxo encadeado (processar_pgdas_e_das)
+DAS_THREADS = int(os.getenv("DAS_THREADS", "4"))
+
+# quem roda o pipeline com posse externa do CNPJ (lease da fila) confirma
+# a posse logo antes do /Declarar; ver `sob_posse`
+_posse: contextvars.ContextVar[Optional[Callable[[], bool]]] = contextvars.ContextVar("pipeline_posse", default=None)
+
+
+class PossePerdida(RuntimeError):
+    """A posse do CNPJ passou para outro processo antes do envio; nada foi enviado nem gravado."""
+
+
+@contextmanager
+def sob_posse(confirmar: Callable[[], bool]) -> Iterator[None]:
+    """
+    No bloco, `processar_pgdas` chama `confirmar()` antes de enviar ao
+    SERPRO e, se der False, levanta PossePerdida em vez de enviar.
+    """
+    token = _posse.set(confirmar)
+    try:
+        yield
+    finally:
+        _posse.reset(token)
+
+
+def normalizar_data_consolidacao(data_consolidacao: str | None) -> str:
+    """'YYYY-MM-DD' → 'YYYYMMDD'; sem data, usa amanhã."""
+    if data_consolidacao:
+        return data_consolidacao.replace("-", "")
+    return (date.today() + timedelta(days=1)).strftime("%Y%m%d")
+
+
+def _medido(fluxo: str, fn, cnpj: str, *args, detalhar_tempos: bool = False) -> Dict[str, Any]:
+    """
+    Executa `fn` dentro do span do CNPJ, conta o status e, se pedido,
+    anexa `tempos` por etapa.
+    """
+    with span(f"{fluxo}.cnpj", cnpj=cnpj), coletar_tempos() as tempos, medir(f"processar_{fluxo}"):
+        resultado = fn(cnpj, *args)
+        definir_atributo("status", resultado.get("status", ""))
+    RESULTADOS.inc(fluxo=fluxo, status=resultado.get("status", ""))
+    if detalhar_tempos:
+        resultado["tempos"] = tempos
+    return resultado
+
+
+def materializar_pdfs(resultado: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Cópia do resultado com os GuiaPdf (referências ao spool) trocados pelo
+    base64, para quem grava o resultado fora da resposta HTTP (ex.: fila).
+    """
+    return {k: v.em_base64() if isinstance(v, GuiaPdf) else v for k, v in resultado.items()}
+
+
+def referenciar_pdf(resultado: Dict[str, Any], campo: str, url: str) -> Dict[str, Any]:
+    """
+    Troca o PDF base64 de um resultado SUCESSO (já persistido no Mongo)
+    pela URL de download. A resposta SERPRO bruta também sai, pois
+    carrega o mesmo PDF.
+    """
+    if resultado.get("status") != "SUCESSO" or not resultado.get(campo):
+        return resultado
+    resultado = {k: v for k, v in resultado.items() if k not in (campo, "serpro_response")}
+    resultado["pdfUrl"] = url
+    return resultado
+
+
+# ---------------------------------------------------------------------
+# PGDAS
+# ---------------------------------------------------------------------
+def processar_pgdas(cnpj: str, pa: int, tipo: int, *, detalhar_tempos: bool = False,
+                    response_id: str | None = None) -> Dict[str, Any]:
+    """
+    Busca no Domínio, monta, arquiva e transmite a declaração de um CNPJ.
+    Qualquer erro controlado vira FALHA, preservando o corpo do SERPRO.
+    `detalhar_tempos=True` inclui no resultado a duração (s) de cada etapa.
+    Com `response_id` (pedido já aceito com 202 numa execução anterior),
+    não remonta nem reenvia: volta ao /Monitorar com o payload gravado no
+    202 e conclui com a resposta dele. Sem ele, o pedido em aberto do
+    CNPJ no Mongo (se houver) é retomado do mesmo jeito.
+    As etapas vão para o checkpoint do lote, se houver (checkpoint_lote.acompanhar).
+    """
+    return _medido("pgdas", _processar_pgdas, cnpj, pa, tipo, response_id, detalhar_tempos=detalhar_tempos)
+
+
+def _montar_payload(cnpj: str, pa: int, tipo: int) -> Tuple[Dict[str, Any] | None, Any, Dict[str, Any] | None]:
+    """
+    Payload pré-montado pelo sincronizador ou, sem ele, montado agora a
+    partir do Domínio e validado: (payload, codi_emp, None). Sem dados ou
+    reprovado na validação, a declaração vira FALHA: (None, None, resultado).
+    """
+    preparado = obter_preparado(cnpj, pa)
+    checkpoint_lote.etapa("BUSCADO")
+    if preparado:
+        payload = copy.deepcopy(preparado["payload"])
+        payload["declaracao"]["tipoDeclaracao"] = tipo
+        payload["indicadorTransmissao"] = transmitindo()
+        return payload, preparado.get("codi_emp"), None
+
+    rows = buscar_simples(cnpj, pa=pa)
+    if not rows:
+        update_failure(cnpj, pa, tipo, None, "rows vazio")
+        return None, None, {
+            "cnpj": cnpj,
+            "status": "FALHA",
+            "erro": f"Nenhum dado do PGDAS-D encontrado no Domínio para PA  {pa}",
+        }
+    if VALIDACAO_PRE_ENVIO:
+        payload, erros = montar_validado(rows, tipo, pa=int(pa))
+        if erros:
+            # não gasta chamada ao SERPRO com declaração que seria recusada
+            update_failure(cnpj, pa, tipo, None, "validação: " + "; ".join(e["mensagem"] for e in erros))
+            return None, None, {
+                "cnpj": cnpj,
+                "status": "FALHA",
+                "erro": "Payload reprovado na validação local",
+                "validacao": erros,
+            }
+    else:
+        payload = montar_json(rows, tipo)
+    codi_emp = next(
+        (r["codi_emp"] for r in rows if r["cgce_emp"] == payload["cnpjCompleto"]),
+        None,
+    )
+    return payload, codi_emp, None
+
+
+def _processar_pgdas(cnpj: str, pa: int, tipo: int, response_id: str | None = None) -> Dict[str, Any]:
+    resp: Dict[str, Any] | None = None
+    pedido_aceito: str | None = None
+    try:
+        if response_id is None:
+            # 202 de uma execução anterior ainda em aberto (fila, DAS encadeado,
+            # retificadora de diferencas...): retoma em vez de reenviar
+            response_id = pedidos_pendentes([cnpj], pa, tipo).get(cnpj)
+        pedido_aceito = response_id      # responseId do 202, se o SERPRO já aceitou
+        if response_id:
+            # 1) pedido já aceito pelo SERPRO: só acompanha, sem reenviar nem
+            # remontar. O payload é o que foi enviado (gravado no 202); Domínio
+            # fora do ar ou dados mudados não podem derrubar o pedido em aberto.
+            # (registrar renova `aguardando_desde`: o reconciliador não o pega junto)
+            payload = payload_do_pedido(cnpj, pa, tipo, response_id)
+            registrar_pedido(cnpj, pa, tipo, payload, response_id)
+            checkpoint_lote.etapa("MONITORANDO", responseId=response_id)
+            resposta = RespostaPgdas.de_http(monitorar_pedido(response_id))
+        else:
+            # 1) payload pré-montado ou montado agora a partir do Domínio
+            payload, codi_emp, falha = _montar_payload(cnpj, pa, tipo)
+            if falha:
+                return falha
+            checkpoint_lote.etapa("MONTADO")
+            confirmar = _posse.get()
+            if confirmar is not None and not confirmar():
+                # o CNPJ já é de outro worker: ele envia, este não
+                raise PossePerdida(cnpj)
+
+            dados_json = dumps(payload)          # serializado uma vez: envelope + arquivo
+            arquivar_payload(payload, codi_emp=codi_emp, bruto=dados_json)
+
+            # 2) Envia ao SERPRO (dados da resposta parseados uma única vez)
+            checkpoint_lote.etapa("ENVIADO")
+
+            def aguardando(rid: str) -> None:
+                # 202: o pedido fica gravado antes do /Monitorar para poder ser retomado
+                nonlocal pedido_aceito
+                pedido_aceito = rid
+                registrar_pedido(cnpj, pa, tipo, payload, rid)
+                checkpoint_lote.etapa("MONITORANDO", responseId=rid)
+
+            resposta = obter_cliente().declarar(payload, dados_json=dados_json, ao_aguardar=aguardando)
+        resp = resposta.bruto
+        # mesma chave do payload no arquivo (a matriz, para uma filial pedida)
+        arquivar_resposta((payload or {}).get("cnpjCompleto") or cnpj, pa, resp)
+
+        # ─── se não for 2xx, trate como erro ──────────────────────────────
+        if not resposta.sucesso:
+            update_failure(cnpj, pa, tipo, resp, "HTTP %s" % resposta.status)
+            return {
+                "cnpj": cnpj,
+                "status": "FALHA",
+                "erro": "SERPRO devolveu HTTP %s" % resposta.status,
+                "serpro_body": resposta.body,
+            }
+
+        # 2.5) Verifica se a ORIGINAL já estava concluída
+        body = resposta.body
+        if (tipo == 1 and
+                resposta.status == 200 and
+                isinstance(body, dict) and
+                body.get("codigoStatus") == "CONCLUIDO" and
+                isinstance(body.get("dados"), dict) and
+                resposta.dados.get("reciboDeclaracao")):
+            return {
+                "cnpj": cnpj,
+                "status": "JA_TRANSMITIDA",
+                "mensagem": "Declaração ORIGINAL já estava transmitida no PGDAS-D",
+                "recibo": resposta.dados["reciboDeclaracao"],
+                "pdf_b64": resposta.pdf
+            }
+
+        # 3) Grava no Mongo
+        try:
+            insert_transmission(cnpj, pa, tipo, payload or {})
+        except DuplicateKeyError:
+            resultado = {
+                "cnpj": cnpj,
+                "status": "JA_TRANSMITIDA",
+                "mensagem": (
+                    "Declaração ORIGINAL já transmitida..."
+                    if tipo == 1
+                    else "Declaração RETIFICADORA já existe..."
+                ),
+            }
+            if isinstance(body, dict) and isinstance(body.get("dados"), dict):
+                resultado["recibo"] = resposta.dados.get("reciboDeclaracao")
+                resultado["pdf_b64"] = resposta.pdf
+            return resultado
+
+        # 4) marca SUCESSO no banco
+        update_success(cnpj, pa, tipo, resposta)
+
+        # 5) monta retorno para o parceiro a partir da mesma resposta
+        return {
+            "status": "SUCESSO",
+            **montar_payload_parceiro(cnpj, pa, resposta, tipo_declaracao=tipo)
+        }
+
+    except PossePerdida:
+        # nada a gravar: o documento agora é do outro worker
+        raise
+
+    # ------------- /Monitorar sem resposta no prazo ---------------- #
+    except MonitorarTempoExcedido as e:
+        return _pedido_em_aberto(cnpj, pa, tipo, e.pedido_id, str(e))
+
+    # ------------- time-out / 5xx persistente --------------------- #
+    except RuntimeError as e:
+        msg, extra = e.args if len(e.args) == 2 else (str(e), None)
+        if pedido_aceito:
+            return _pedido_em_aberto(cnpj, pa, tipo, pedido_aceito, msg)
+        update_failure(cnpj, pa, tipo, extra, msg)
+        return {
+            "cnpj": cnpj,
+            "status": "FALHA",
+            "erro": msg,
+            "serpro_body": extra,
+        }
+
+    # ------------- falhas inesperadas ----------------------------- #
+    except Exception as e:
+        logging.exception("Erro no PGDAS %s", cnpj)
+        if pedido_aceito:
+            return _pedido_em_aberto(cnpj, pa, tipo, pedido_aceito, str(e))
+        update_failure(cnpj, pa, tipo, resp, str(e))
+        return {
+            "cnpj": cnpj,
+            "status": "FALHA",
+            "erro": str(e),
+        }
+
+
+def _pedido_em_aberto(cnpj: str, pa: int, tipo: int, response_id: str, erro: str) -> Dict[str, Any]:
+    """
+    FALHA depois do 202 (prazo do /Monitorar, rede, Mongo...): o pedido
+    segue no SERPRO, então fica marcado para a próxima tentativa ou o
+    reconciliador retomarem, sem reenviar.
+    """
+    marcar_monitorar_excedido(cnpj, pa, tipo, response_id, erro)
+    return {
+        "cnpj": cnpj,
+        "status": "FALHA",
+        "erro": erro,
+        "responseId": response_id,
+    }
+
+
+# ---------------------------------------------------------------------
+# DAS
+# ---------------------------------------------------------------------
+def processar_das(cnpj: str, pa: int, data_consolidacao: str | None = None, *,
+                  detalhar_tempos: bool = False) -> Dict[str, Any]:
+    """Emite o DAS de um CNPJ e persiste SUCESSO/FALHA em transmissao_das."""
+    return _medido("das", _processar_das, cnpj, pa, data_consolidacao, detalhar_tempos=detalhar_tempos)
+
+
+def _processar_das(cnpj: str, pa: int, data_consolidacao: str | None) -> Dict[str, Any]:
+    dc = normalizar_data_consolidacao(data_consolidacao)
+    try:
+        # 1) insere registro PENDENTE
+        insert_das_transmission(cnpj, pa, dc, {"cnpj": cnpj, "pa": pa, "dataConsolidacao": dc})
+
+        # 2) chama SERPRO
+        resultado = gerar_das_unico(cnpj, pa, data_consolidacao)
+
+        # 3) persiste sucesso ou falha
+        resp = resultado.get("serpro_response")
+        if resultado["status"] == "SUCESSO":
+            update_das_success(
+                cnpj, pa, dc,
+                resp,
+                resultado.get("detalhamento"),
+                resultado.get("das_pdf_b64")
+            )
+        else:
+            update_das_failure(cnpj, pa, dc, resp, resultado.get("erro"))
+        return resultado
+
+    except Exception as e:
+        # falha inesperada
+        msg = str(e)
+        update_das_failure(cnpj, pa, dc, None, msg)
+        return {"cnpj": cnpj, "status": "FALHA", "erro": msg}
+
+
+def processar_das_lote(cnpjs: Iterable[str], pa: int, data_consolidacao: str | None = None, *,
+                       forcar: bool = False, incluir_pdf: bool = True,
+                       detalhar_tempos: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    DAS do lote com cache de leitura: quem já tem DAS em SUCESSO para o
+    mesmo (cnpj, pa, dataConsolidacao) — levantados numa consulta só —
+    volta do Mongo com `"cache": true`, sem chamar o SERPRO. Emite só
+    as faltas; data de consolidação já vencida ou `forcar` emitem sempre.
+    `incluir_pdf=False` devolve `pdfUrl` no lugar do PDF.
+    """
+    cnpjs = list(cnpjs)
+    dc = normalizar_data_consolidacao(data_consolidacao)
+    vencida = dc < date.today().strftime("%Y%m%d")
+    emitidos = {} if forcar or vencida else buscar_das_emitidos(cnpjs, pa, dc)
+    motivo = "forcado" if forcar else "vencido" if vencida else "falta"
+    url = "/pdf/das/{cnpj}/%s/%s" % (pa, dc)
+
+    for cnpj in cnpjs:
+        doc = emitidos.get(cnpj)
+        if doc is not None:
+            DAS_CACHE.inc(resultado="acerto")
+            RESULTADOS.inc(fluxo="das", status="SUCESSO")
+            resultado = {"status": "SUCESSO", "cnpj": cnpj, "detalhamento": doc.get("detalhamento_json"),
+                         "cache": True}
+            if incluir_pdf:
+                resultado["das_pdf_b64"] = buscar_das_pdf(cnpj, pa, dc)
+            else:
+                resultado["pdfUrl"] = url.format(cnpj=cnpj)
+            yield resultado
+            continue
+
+        DAS_CACHE.inc(resultado=motivo)
+        resultado = processar_das(cnpj, pa, data_consolidacao, detalhar_tempos=detalhar_tempos)
+        yield resultado if incluir_pdf else referenciar_pdf(resultado, "das_pdf_b64", url.format(cnpj=cnpj))
+
+
+# ---------------------------------------------------------------------
+# PGDAS → DAS encadeados
+# ---------------------------------------------------------------------
+def _emitir_das_encadeado(cnpj: str, pa: int, data_consolidacao: str | None) -> Dict[str, Any]:
+    dc = normalizar_data_consolidacao(data_consolidacao)
+    try:
+        resultado = gerar_das_unico(cnpj, pa, data_consolidacao)
+    except Exception as e:
+        logging.exception("Erro no DAS %s", cnpj)
+        resultado = {"cnpj": cnpj, "status": "FALHA", "erro": str(e)}
+    gravar_das(cnpj, pa, dc, {"cnpj": cnpj, "pa": pa, "dataConsolidacao": dc}, resultado)
+    return resultado
+
+
+def processar_pgdas_e_das(cnpjs: Iterable[str], pa: int, tipo: int, data_consolidacao: str | None = None, *,
+                          detalhar_tempos: bool = False,
+                          threads_das: int = DAS_THREADS) -> Iterator[Dict[str, Any]]:
+    """
+    Declara os CNPJs em sequência e, assim que um chega a SUCESSO, emite
+    o DAS dele num pool de `threads_das` enquanto as próximas declarações
+    seguem: o lote leva ~ o tempo da etapa mais lenta, não a soma.
+    Os dois estágios usam o mesmo SerproClient (sessão e token).
+
+    Gera {"cnpj", "pgdas": {...}, "das": {...} | None} na ordem em que
+    cada CNPJ fica pronto; `das` é None quando a declaração não deu SUCESSO
+    ou é simulação (não há o que emitir sem declarar).
+    """
+    with ThreadPoolExecutor(max_workers=max(threads_das, 1), thread_name_prefix="das") as pool:
+        emitindo: Dict[Future, Dict[str, Any]] = {}
+
+        def prontos(futuros) -> Iterator[Dict[str, Any]]:
+            for f in futuros:
+                pgdas = emitindo.pop(f)
+                yield {"cnpj": pgdas["cnpj"], "pgdas": pgdas, "das": f.result()}
+
+        for cnpj in cnpjs:
+            pgdas = processar_pgdas(cnpj, pa, tipo, detalhar_tempos=detalhar_tempos)
+            pgdas.setdefault("cnpj", cnpj)
+            if pgdas.get("status") == "SUCESSO" and transmitindo():
+                # copia o contexto: o span do DAS fica sob o span do lote
+                ctx = contextvars.copy_context()
+                f = pool.submit(ctx.run, _medido, "das", _emitir_das_encadeado, cnpj, pa, data_consolidacao,
+                                detalhar_tempos=detalhar_tempos)
+                emitindo[f] = pgdas
+            else:
+                yield {"cnpj": cnpj, "pgdas": pgdas, "das": None}
+            yield from prontos([f for f in emitindo if f.done()])
+
+        yield from prontos(as_completed(list(emitindo)))
@@ -0,0 +1,248 @@
+"""
+Rastreamento distribuído no estilo OpenTelemetry, sem dependência externa.
+
+    with span("pgdas.cnpj", cnpj=cnpj):
+        ...
+        definir_atributo("serpro.responseId", rid)
+
+Os spans herdam o pai pelo contextvar, então uma requisição vira uma
+árvore: rota → CNPJ → consulta Domínio / token / tentativa SERPRO /
+poll do Monitorar / gravação Mongo. Exportação em background:
+
+    TRACE_EXPORTADOR=arquivo  → JSONL em TRACE_ARQUIVO (teste offline)
+    TRACE_EXPORTADOR=otlp     → OTLP/HTTP JSON em TRACE_COLLECTOR_URL
+    (vazio)                   → spans só em memória, nada é exportado
+"""
+from __future__ import annotations
+import os
+import copy
+import time
+import queue
+import atexit
+import logging
+import secrets
+import threading
+import contextvars
+from pathlib import Path
+from contextlib import ContextDecorator
+from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional
+
+load_dotenv()
+
+TRACE_EXPORTADOR = os.getenv("TRACE_EXPORTADOR", "")
+TRACE_ARQUIVO = Path(os.getenv(
+    "TRACE_ARQUIVO", str(Path(__file__).resolve().parent.parent / "traces" / "spans.jsonl")))
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL", "http://localhost:4318/v1/traces")
+TRACE_SERVICO = os.getenv("TRACE_SERVICO", "pgdas-integracontador")
+_LOTE_MAX = 200
+
+
+class Span:
+    __slots__ = ("nome", "trace_id", "span_id", "pai_id", "inicio_ns", "fim_ns", "atributos", "erro")
+
+    def __init__(self, nome: str, trace_id: str, pai_id: Optional[str], atributos: Dict[str, Any]) -> None:
+        self.nome = nome
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.pai_id = pai_id
+        self.inicio_ns = time.time_ns()
+        self.fim_ns: Optional[int] = None
+        self.atributos = atributos
+        self.erro: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.pai_id,
+            "name": self.nome,
+            "startTimeUnixNano": self.inicio_ns,
+            "endTimeUnixNano": self.fim_ns,
+            "durationMs": round(((self.fim_ns or self.inicio_ns) - self.inicio_ns) / 1e6, 3),
+            "attributes": self.atributos,
+            "status": {"code": "ERROR", "message": self.erro} if self.erro else {"code": "OK"},
+        }
+
+
+_atual: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("pgdas_span", default=None)
+
+
+def _ler_traceparent(traceparent: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+    """W3C traceparent '00-<trace>-<span>-<flags>' → (trace_id, span_id)."""
+    partes = (traceparent or "").split("-")
+    if len(partes) == 4 and len(partes[1]) == 32 and len(partes[2]) == 16:
+        return partes[1], partes[2]
+    return None, None
+
+
+class span(ContextDecorator):
+    """
+    Abre um span filho do span atual (ou raiz). `traceparent` permite
+    continuar um trace vindo do cliente HTTP; `trace_id` fixa o id de um
+    trace novo (ex.: já devolvido no cabeçalho antes do streaming).
+    """
+
+    def __init__(self, nome: str, *, traceparent: Optional[str] = None,
+                 trace_id: Optional[str] = None, **atributos: Any) -> None:
+        self.nome = nome
+        self.traceparent = traceparent
+        self.trace_id = trace_id
+        self.atributos = atributos
+        self.span: Optional[Span] = None
+        self._token = None
+
+    def _recreate_cm(self) -> "span":
+        return copy.copy(self)
+
+    def __enter__(self) -> Span:
+        pai = _atual.get()
+        if pai is not None:
+            trace_id, pai_id = pai.trace_id, pai.span_id
+        else:
+            trace_id, pai_id = _ler_traceparent(self.traceparent)
+            trace_id = trace_id or self.trace_id or secrets.token_hex(16)
+        self.span = Span(self.nome, trace_id, pai_id, dict(self.atributos))
+        self._token = _atual.set(self.span)
+        return self.span
+
+    def __exit__(self, tipo_exc, exc, tb) -> None:
+        self.span.fim_ns = time.time_ns()
+        if exc is not None:
+            self.span.erro = f"{tipo_exc.__name__}: {exc}"
+        try:
+            _atual.reset(self._token)
+        except ValueError:                       # generator retomado em outro contexto
+            _atual.set(None)
+        _exportador.enviar(self.span)
+
+
+def trace_id_de(traceparent: Optional[str]) -> str:
+    """Trace id do cabeçalho `traceparent` ou um novo, se ausente/inválido."""
+    return _ler_traceparent(traceparent)[0] or secrets.token_hex(16)
+
+
+def span_atual() -> Optional[Span]:
+    return _atual.get()
+
+
+def definir_atributo(chave: str, valor: Any) -> None:
+    """Anota o span atual (ex.: serpro.responseId); sem span, não faz nada."""
+    s = _atual.get()
+    if s is not None:
+        s.atributos[chave] = valor
+
+
+# ---------------------------------------------------------------------
+# exportação
+# ---------------------------------------------------------------------
+def _otlp_valor(valor: Any) -> Dict[str, Any]:
+    if isinstance(valor, bool):
+        return {"boolValue": valor}
+    if isinstance(valor, int):
+        return {"intValue": str(valor)}
+    if isinstance(valor, float):
+        return {"doubleValue": valor}
+    return {"stringValue": str(valor)}
+
+
+def _otlp_span(s: Span) -> Dict[str, Any]:
+    d = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.nome,
+        "kind": 1,
+        "startTimeUnixNano": str(s.inicio_ns),
+        "endTimeUnixNano": str(s.fim_ns),
+        "attributes": [{"key": k, "value": _otlp_valor(v)} for k, v in s.atributos.items()],
+        "status": {"code": 2, "message": s.erro} if s.erro else {"code": 1},
+    }
+    if s.pai_id:
+        d["parentSpanId"] = s.pai_id
+    return d
+
+
+class _Exportador:
+    """Fila + thread: a exportação nunca bloqueia o fluxo da requisição."""
+
+    def __init__(self, destino: str) -> None:
+        self.destino = destino
+        self._fila: queue.Queue = queue.Queue(maxsize=10_000)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def enviar(self, s: Span) -> None:
+        if not self.destino:
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="rastreamento", daemon=True)
+                    self._thread.start()
+        try:
+            self._fila.put_nowait(s)
+        except queue.Full:
+            pass                                  # descarta span em vez de atrasar a requisição
+
+    def parar(self) -> None:
+        if self._thread is not None:
+            self._fila.put(None)
+            self._thread.join(10)
+
+    def reiniciar(self) -> None:
+        """
+        Depois de um fork: a thread do pai não existe no filho, então fila
+        e thread recomeçam do zero (senão os spans ficariam presos na fila).
+        """
+        self._fila = queue.Queue(maxsize=10_000)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _loop(self) -> None:
+        while True:
+            item = self._fila.get()
+            lote: List[Span] = [] if item is None else [item]
+            while item is not None and len(lote) < _LOTE_MAX:
+                try:
+                    item = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    lote.append(item)
+            if lote:
+                try:
+                    self._exportar(lote)
+                except Exception as e:
+                    logging.warning("Falha ao exportar %s spans: %s", len(lote), e)
+            if item is None:
+                return
+
+    def _exportar(self, lote: List[Span]) -> None:
+        # import tardio: serializacao/requests só são carregados se houver exportação
+        from utils.serializacao import dumps
+
+        if self.destino == "arquivo":
+            TRACE_ARQUIVO.parent.mkdir(parents=True, exist_ok=True)
+            with open(TRACE_ARQUIVO, "ab") as f:
+                f.write(b"".join(dumps(s.como_dict()) + b"\n" for s in lote))
+        elif self.destino == "otlp":
+            import requests
+            corpo = {"resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICO}}]},
+                "scopeSpans": [{"scope": {"name": "pgdas"}, "spans": [_otlp_span(s) for s in lote]}],
+            }]}
+            requests.post(TRACE_COLLECTOR_URL, data=dumps(corpo),
+                          headers={"Content-Type": "application/json"}, timeout=5)
+
+
+_exportador = _Exportador(TRACE_EXPORTADOR)
+atexit.register(_exportador.parar)
+
+
+def reiniciar_exportador() -> None:
+    """Chamado em cada worker do gunicorn (post_fork); ver _Exportador.reiniciar."""
+    _exportador.reiniciar()
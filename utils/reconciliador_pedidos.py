@@ -0,0 +1,98 @@
+"""
+Reconciliador de pedidos 202 parados.
+
+    python -m utils.reconciliador_pedidos [--intervalo 120] [--threads 4] [--uma-vez]
+
+O responseId de um 202 do /Declarar é gravado na declaração assim que
+chega (db_schema.registrar_pedido). A cada ciclo, em cada modo
+(transmitir e simular), este processo busca numa consulta os pedidos
+que ninguém está acompanhando:
+  • PENDENTE com `aguardando_desde` mais antigo que RECONCILIADOR_IDADE_SEG
+    (o processo que acompanhava caiu);
+  • FALHA com `monitorar_excedido` (o /Monitorar estourou o prazo);
+reivindica cada um (db_schema.assumir_pedido, para não disputar com
+outra instância) e volta ao /Monitorar com o mesmo id, sem reenviar a
+declaração nem gastar cota. O resultado é gravado como de costume
+(SUCESSO, FALHA ou de novo FALHA por prazo, para o próximo ciclo).
+"""
+from __future__ import annotations
+import os
+import signal
+import logging
+import argparse
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+from database.db_schema import assumir_pedido, pedidos_parados
+from utils.modo_execucao import MODOS, em_modo
+from utils.escalonador_serpro import submissor
+from utils.pipeline import processar_pgdas
+from utils.metricas import PEDIDOS_RECONCILIADOS
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+RECONCILIADOR_INTERVALO_SEG = int(os.getenv("RECONCILIADOR_INTERVALO_SEG", "120"))
+# maior que o prazo do monitorar_pedido (3 min): PENDENTE mais novo ainda tem dono
+RECONCILIADOR_IDADE_SEG = int(os.getenv("RECONCILIADOR_IDADE_SEG", "300"))
+RECONCILIADOR_LIMITE = int(os.getenv("RECONCILIADOR_LIMITE", "500"))
+RECONCILIADOR_THREADS = int(os.getenv("RECONCILIADOR_THREADS", "4"))
+
+_parar = threading.Event()
+
+
+def _retomar(doc: Dict[str, Any]) -> str:
+    """Volta ao /Monitorar de um pedido já reivindicado; devolve o status final."""
+    resultado = processar_pgdas(doc["cnpj"], doc["pa"], doc["tipoDeclaracao"], response_id=doc["responseId"])
+    status = resultado.get("status", "FALHA")
+    PEDIDOS_RECONCILIADOS.inc(status=status)
+    logging.info("Pedido %s (%s PA %s) → %s", doc["responseId"], doc["cnpj"], doc["pa"], status)
+    return status
+
+
+def reconciliar(*, idade_seg: int = RECONCILIADOR_IDADE_SEG, limite: int = RECONCILIADOR_LIMITE,
+                threads: int = RECONCILIADOR_THREADS) -> Dict[str, int]:
+    """Um ciclo nos dois modos; devolve a contagem por status final."""
+    contagem: Dict[str, int] = {}
+    for modo in MODOS:
+        # no escalonador SERPRO, um submissor só: não disputa vaga com os lotes
+        with em_modo(modo), submissor("reconciliador"):
+            assumidos = [d for d in pedidos_parados(idade_seg, limite) if assumir_pedido(d)]
+            if not assumidos:
+                continue
+            logging.info("Reconciliando %s pedidos parados (%s)", len(assumidos), modo)
+            with ThreadPoolExecutor(max_workers=max(threads, 1), thread_name_prefix="reconciliador") as pool:
+                futuros = [pool.submit(contextvars.copy_context().run, _retomar, d) for d in assumidos]
+                for f in futuros:
+                    status = f.result()
+                    contagem[status] = contagem.get(status, 0) + 1
+    return contagem
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Retoma no /Monitorar os pedidos 202 que ficaram sem resposta")
+    ap.add_argument("--intervalo", type=int, default=RECONCILIADOR_INTERVALO_SEG, help="segundos entre ciclos")
+    ap.add_argument("--idade", type=int, default=RECONCILIADOR_IDADE_SEG,
+                    help="idade mínima (s) de um PENDENTE para ser considerado parado")
+    ap.add_argument("--limite", type=int, default=RECONCILIADOR_LIMITE, help="pedidos por ciclo e modo")
+    ap.add_argument("--threads", type=int, default=RECONCILIADOR_THREADS)
+    ap.add_argument("--uma-vez", action="store_true", help="roda um ciclo e sai")
+    args = ap.parse_args()
+
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sinal, lambda *_: _parar.set())
+
+    while not _parar.is_set():
+        try:
+            contagem = reconciliar(idade_seg=args.idade, limite=args.limite, threads=args.threads)
+            if contagem:
+                logging.info("Ciclo do reconciliador: %s", contagem)
+        except Exception:
+            logging.exception("Falha no ciclo do reconciliador")
+        if args.uma_vez:
+            return
+        _parar.wait(args.intervalo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+from __future__ import annotations
+import base64
+import binascii
+import logging
+import weakref
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from utils import spool_pdf
+from utils.serializacao import dumps_str, loads, ErroJSON
+
+
+class GuiaPdf:
+    """
+    PDF devolvido pelo SERPRO em base64, decodificado uma única vez na
+    chegada. Acima de PDF_SPOOL_MIN_BYTES os bytes ficam num arquivo do
+    spool (utils/spool_pdf.py) e o objeto é só a referência; o arquivo
+    some quando o objeto é coletado. Na serialização (`para_json`) volta
+    a ser o base64 de sempre.
+    """
+    __slots__ = ("tamanho", "_bytes", "_arquivo", "__weakref__")
+
+    def __init__(self, conteudo: bytes) -> None:
+        self.tamanho = len(conteudo)
+        self._bytes: Optional[bytes] = None
+        self._arquivo: Optional[Path] = None
+        if self.tamanho >= spool_pdf.PDF_SPOOL_MIN_BYTES:
+            self._arquivo = spool_pdf.guardar(conteudo)
+            weakref.finalize(self, spool_pdf.descartar, self._arquivo)
+        else:
+            self._bytes = conteudo
+
+    @classmethod
+    def de_b64(cls, b64: str) -> Optional["GuiaPdf"]:
+        try:
+            return cls(base64.b64decode(b64))
+        except (binascii.Error, ValueError):
+            logging.warning("PDF da resposta não é base64 válido; ignorando")
+            return None
+
+    def conteudo(self) -> bytes:
+        return self._bytes if self._bytes is not None else spool_pdf.ler(self._arquivo)
+
+    def em_base64(self) -> str:
+        return base64.b64encode(self.conteudo()).decode("ascii")
+
+    def para_json(self) -> str:
+        return self.em_base64()
+
+    def __len__(self) -> int:
+        return self.tamanho
+
+    def __repr__(self) -> str:
+        return f"GuiaPdf({self.tamanho} bytes{', spool' if self._arquivo else ''})"
+
+
+@dataclass(slots=True)
+class RespostaPgdas:
+    """
+    Resposta do Declarar/Monitorar já interpretada. O campo `dados`
+    (string JSON com o PDF dentro) é decodificado uma única vez aqui e
+    o resultado é repassado para persistência e payload do parceiro.
+    O PDF sai de `dados` e de `bruto` (que é gravado e arquivado) e
+    fica só em `pdf`.
+    """
+    status: Optional[int]
+    body: Any
+    bruto: Dict[str, Any]
+    dados: Dict[str, Any] = field(default_factory=dict)
+    recibo: Optional[str] = None
+    id_declaracao: Optional[str] = None
+    valores_devidos: List[Dict[str, Any]] = field(default_factory=list)
+    tipo_declaracao: Optional[int] = None
+    pdf: Optional[GuiaPdf] = None
+
+    @property
+    def sucesso(self) -> bool:
+        return self.status is not None and 200 <= self.status < 300
+
+    @property
+    def pdf_b64(self) -> Optional[str]:
+        """Base64 do PDF, montado a cada acesso (não guarde)."""
+        return self.pdf.em_base64() if self.pdf else None
+
+    @classmethod
+    def de_http(cls, resp: Dict[str, Any]) -> "RespostaPgdas":
+        """
+        Aceita tanto {'status', 'body'} de `SerproClient.enviar` quanto o
+        corpo devolvido por `monitorar_pedido`.
+        """
+        body = resp.get("body") if "body" in resp else resp
+        status = resp.get("status")
+        raw = body.get("dados") if isinstance(body, dict) else resp.get("dados")
+
+        dados: Dict[str, Any] = {}
+        if isinstance(raw, dict):
+            dados = raw
+        elif isinstance(raw, str) and raw.strip():
+            try:
+                parsed = loads(raw)
+                dados = parsed if isinstance(parsed, dict) else {}
+            except ErroJSON:
+                logging.warning("Campo 'dados' não é JSON válido; ignorando parse")
+
+        declaracao = dados.get("declaracao")
+        pdf = None
+        if isinstance(declaracao, str) and declaracao:
+            pdf = GuiaPdf.de_b64(declaracao)
+            # `bruto` é gravado (response_json) e arquivado: sem o PDF, que fica só no GuiaPdf
+            dados = {k: v for k, v in dados.items() if k != "declaracao"}
+            if isinstance(body, dict):
+                body["dados"] = dumps_str(dados) if isinstance(raw, str) else dados
+        valores = dados.get("valoresDevidos")
+        return cls(
+            status=status,
+            body=body,
+            bruto=resp,
+            dados=dados,
+            recibo=dados.get("recibo"),
+            id_declaracao=dados.get("idDeclaracao"),
+            valores_devidos=valores if isinstance(valores, list) else [],
+            tipo_declaracao=declaracao.get("tipoDeclaracao") if isinstance(declaracao, dict) else None,
+            pdf=pdf,
+        )
@@ -1,37 +1,29 @@
 from __future__ import annotations
-import json
+import os
+import gzip
 from pathlib import Path
 from typing import Dict, Any, Optional
-from database.dominio_db import DatabaseConnection, DB_PARAMS
+from database.cache_empresas import codi_emp_por_cnpj
+from utils.serializacao import dumps, dumps_pretty
 
-
-def _default_base_dir() -> Path:
-    """Pasta “json/” na raiz do projeto (…/PgDas/json)."""
-    return Path(__file__).resolve().parent.parent / "json"
+# extensão de arquivo por formato de gravação
+FORMATOS = {"json": ".json", "gzip": ".json.gz"}
 
 
-def _buscar_codi_emp_por_cnpj(cnpj: str) -> Optional[int]:
-    """
-        Busca o *codi_emp* da empresa pelo CNPJ.
-        Retorna None se não encontrar.
-    """
-    sql = "SELECT TOP 1 codi_emp FROM bethadba.geempre WHERE cgce_emp = ?"
-    db = DatabaseConnection(**DB_PARAMS)
-    db.connect()
-    rows = db.execute_query(sql, (cnpj,))
-    db.close()
-    return rows[0][0] if rows else None
+def _default_base_dir() -> Path:
+    """ARQUIVO_DIR ou a pasta “json/” na raiz do projeto (…/PgDas/json)."""
+    return Path(os.getenv("ARQUIVO_DIR") or Path(__file__).resolve().parent.parent / "json")
 
 
-def salvar_payload(payload: Dict[str, Any], *, codi_emp: Optional[int | str] = None, base_dir: Path | str | None = None,
-                   pretty: bool = False) -> Path:
+def caminho_payload(payload: Dict[str, Any], *, codi_emp: Optional[int | str] = None,
+                    base_dir: Path | str | None = None, formato: str = "json") -> Path:
     """
-        Grava *payload* em disco:
-        • Subpasta : json/AAAAMM/
-        • Nome arquivo : <codi_emp> - PGDAS - AAAAMM.json
-        • `pretty=True` gera JSON identado; caso contrário, compacto.
-        Retorna o `Path` do arquivo salvo.
+        Caminho de gravação do *payload*: json/AAAAMM/<codi_emp> - PGDAS - AAAAMM.json[.gz]
+        Se `codi_emp` não vier, é resolvido pelo cache da geempre
+        (sem consulta extra ao Domínio). Não cria a pasta.
     """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de arquivo desconhecido: {formato!r}")
     if base_dir is None:
         base_dir = _default_base_dir()
     base_dir = Path(base_dir)
@@ -40,17 +32,37 @@ def salvar_payload(payload: Dict[str, Any], *, codi_emp: Optional[int | str] = N
     pa_str = f"{pa:06d}"
 
     if codi_emp is None:
-        codi_emp = _buscar_codi_emp_por_cnpj(payload["cnpjCompleto"])
+        codi_emp = codi_emp_por_cnpj(payload["cnpjCompleto"])
     codi_emp_str = str(codi_emp) if codi_emp is not None else "multi"
 
-    pasta_mes = base_dir / pa_str
-    pasta_mes.mkdir(parents=True, exist_ok=True)
+    return base_dir / pa_str / f"{codi_emp_str} - PGDAS - {pa_str}{FORMATOS[formato]}"
 
-    nome_arquivo = f"{codi_emp_str} - PGDAS - {pa_str}.json"
-    caminho = pasta_mes / nome_arquivo
 
-    opts = {"ensure_ascii": False, "indent": 2} if pretty else {
-        "ensure_ascii": False, "separators": (",", ":")
-    }
-    caminho.write_text(json.dumps(payload, **opts), encoding="utf-8")
+def serializar_payload(payload: Dict[str, Any], *, pretty: bool = False, formato: str = "json",
+                       bruto: Optional[bytes] = None) -> bytes:
+    """
+        JSON em UTF-8 (identado se `pretty=True`, compacto caso contrário);
+        `formato="gzip"` comprime o resultado.
+        `bruto` reaproveita o JSON compacto já gerado para o envelope SERPRO.
+    """
+    if pretty:
+        dados = dumps_pretty(payload)
+    else:
+        dados = bruto if bruto is not None else dumps(payload)
+    return gzip.compress(dados) if formato == "gzip" else dados
+
+
+def salvar_payload(payload: Dict[str, Any], *, codi_emp: Optional[int | str] = None, base_dir: Path | str | None = None,
+                   pretty: bool = False) -> Path:
+    """
+        Grava *payload* em disco (síncrono):
+        • Subpasta : json/AAAAMM/
+        • Nome arquivo : <codi_emp> - PGDAS - AAAAMM.json
+        • `pretty=True` gera JSON identado; caso contrário, compacto.
+        Para gravar fora do fluxo da requisição use `utils.arquivador`.
+        Retorna o `Path` do arquivo salvo.
+    """
+    caminho = caminho_payload(payload, codi_emp=codi_emp, base_dir=base_dir)
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    caminho.write_bytes(serializar_payload(payload, pretty=pretty))
     return caminho
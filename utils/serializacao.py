@@ -0,0 +1,136 @@
+"""
+Serialização JSON única para o projeto.
+
+Usa `orjson` quando instalado e cai para o `json` da stdlib caso
+contrário (ou se SERIALIZADOR=json). Toda a saída é UTF-8 sem escapes
+ASCII, equivalente a `json.dumps(..., ensure_ascii=False)` compacto.
+
+    dumps(obj)      -> bytes
+    dumps_str(obj)  -> str
+    dumps_pretty(o) -> bytes (identado, para auditoria)
+    loads(dados)    -> objeto  (aceita str, bytes ou bytearray)
+"""
+from __future__ import annotations
+import os
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError herda de json.JSONDecodeError
+ErroJSON = json.JSONDecodeError
+
+
+def _default(obj: Any) -> Any:
+    """
+    Tipos que vêm do Domínio (sqlanydb) e não são JSON nativos, e objetos
+    com `para_json()` (ex.: GuiaPdf no spool, materializado só aqui).
+    """
+    para_json = getattr(obj, "para_json", None)
+    if para_json is not None:
+        return para_json()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    raise TypeError(f"Objeto do tipo {type(obj).__name__} não é serializável em JSON")
+
+
+# ---------------------------------------------------------------------
+# backends
+# ---------------------------------------------------------------------
+def _std_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def _std_pretty(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, indent=2, default=_default).encode("utf-8")
+
+
+def _std_loads(dados: str | bytes | bytearray) -> Any:
+    return json.loads(dados)
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _orjson_pretty(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2)
+
+
+def _orjson_loads(dados: str | bytes | bytearray) -> Any:
+    return orjson.loads(dados)
+
+
+_BACKENDS: dict[str, tuple[Callable, Callable, Callable]] = {
+    "json": (_std_dumps, _std_pretty, _std_loads),
+}
+if orjson is not None:
+    _BACKENDS["orjson"] = (_orjson_dumps, _orjson_pretty, _orjson_loads)
+
+_dumps, _pretty, _loads = _BACKENDS["json"]
+BACKEND = "json"
+
+
+def usar_backend(nome: str) -> str:
+    """
+    Troca o backend ("orjson" | "json"). Se orjson não estiver instalado,
+    permanece na stdlib. Devolve o nome do backend em uso.
+    """
+    global _dumps, _pretty, _loads, BACKEND
+    if nome not in _BACKENDS:
+        nome = "json"
+    _dumps, _pretty, _loads = _BACKENDS[nome]
+    BACKEND = nome
+    return BACKEND
+
+
+usar_backend(os.getenv("SERIALIZADOR", "orjson"))
+
+
+# ---------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------
+def dumps(obj: Any) -> bytes:
+    return _dumps(obj)
+
+
+def dumps_str(obj: Any) -> str:
+    return _dumps(obj).decode("utf-8")
+
+
+def dumps_pretty(obj: Any) -> bytes:
+    return _pretty(obj)
+
+
+def loads(dados: str | bytes | bytearray) -> Any:
+    return _loads(dados)
+
+
+# ---------------------------------------------------------------------
+# Flask
+# ---------------------------------------------------------------------
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    DefaultJSONProvider = None
+
+if DefaultJSONProvider is not None:
+    class ProvedorJSONFlask(DefaultJSONProvider):
+        """`jsonify` / `request.get_json` pelo mesmo serializador (orjson)."""
+
+        def dumps(self, obj: Any, **kwargs: Any) -> str:
+            return dumps_str(obj)
+
+        def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+            return loads(s)
+
+        def response(self, *args: Any, **kwargs: Any):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(dumps(obj), mimetype=self.mimetype)
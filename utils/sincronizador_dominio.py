@@ -0,0 +1,140 @@
+"""
+Sincronização incremental Domínio → payloads pré-montados.
+
+    python -m utils.sincronizador_dominio [--pa 202505] [--intervalo 600] [--uma-vez]
+
+A cada ciclo, para o PA aberto (padrão: mês anterior):
+  1. lê numa consulta todas as linhas do Simples do PA e, noutra, as
+     folhas dos 12 meses anteriores (dominio_db.buscar_simples_pa /
+     buscar_folhas_pa), em vez de uma consulta por CNPJ na transmissão;
+  2. agrupa por raiz de CNPJ e calcula o hash das linhas + folhas;
+  3. remonta e valida (utils/validacao.py) só as raízes cujo hash mudou
+     (ou novas) e grava em `pgdas_preparados` (database/preparados.py)
+     como PRONTO ou INVALIDO; raízes sem movimento saem da coleção.
+
+As tabelas não têm coluna de alteração e `data_sim`/`periodo` são datas
+de competência — um lançamento corrigido no mesmo mês não muda a data —,
+por isso a detecção é por hash das linhas e não por marca d'água.
+Na transmissão, o pipeline usa o payload pronto se a última conferência
+for recente (PREPARADOS_MAX_IDADE_SEG) e monta na hora caso contrário.
+"""
+from __future__ import annotations
+import os
+import json
+import time
+import signal
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+from database import preparados
+from database.dominio_db import buscar_simples_pa, buscar_folhas_pa
+from utils.json_builder import folhas_de_valores
+from utils.validacao import montar_validado
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+SINCRONIZACAO_INTERVALO_SEG = int(os.getenv("SINCRONIZACAO_INTERVALO_SEG", "600"))
+
+_parar = threading.Event()
+
+
+def pa_aberto(hoje: Optional[date] = None) -> int:
+    """PA em apuração: o mês anterior."""
+    hoje = hoje or date.today()
+    ano, mes = (hoje.year, hoje.month - 1) if hoje.month > 1 else (hoje.year - 1, 12)
+    return ano * 100 + mes
+
+
+def _linha_mongo(r: Dict[str, Any]) -> Dict[str, Any]:
+    """Linha do Domínio em tipos que o Mongo grava e o hash enxerga igual."""
+    saida = {}
+    for k, v in r.items():
+        if isinstance(v, Decimal):
+            v = float(v)
+        elif isinstance(v, (date, datetime)):
+            v = v.isoformat()[:10]
+        saida[k] = v
+    return saida
+
+
+def _hash_linhas(linhas: List[Dict[str, Any]], folhas: Dict[int, float]) -> str:
+    ordenadas = sorted(json.dumps(linha, sort_keys=True) for linha in linhas)
+    folhas_txt = json.dumps({str(k): round(v, 2) for k, v in sorted(folhas.items())})
+    return hashlib.sha256("\n".join(ordenadas + [folhas_txt]).encode("utf-8")).hexdigest()
+
+
+def _montar(raiz: str, pa: int, linhas: List[Dict[str, Any]], folhas: Dict[int, float]) -> Dict[str, Any]:
+    doc: Dict[str, Any] = {"raiz": raiz, "pa": pa, "linhas": linhas,
+                           "folhas": {str(k): v for k, v in folhas.items()}}
+    payload, erros = montar_validado(linhas, 1, pa=pa, folhas=folhas_de_valores(folhas, pa))
+    if payload is not None and not str(payload.get("cnpjCompleto", "")).startswith(raiz):
+        erros.append({"regra": "ESQUEMA", "mensagem": f"payload de {payload.get('cnpjCompleto')} fora da raiz {raiz}"})
+    if erros:
+        # INVALIDO não é usado na transmissão; o pipeline monta na hora e recusa igual
+        doc.update(status="INVALIDO", erro="; ".join(e["mensagem"] for e in erros), validacao=erros, payload=None)
+        return doc
+    codi_emp = next((r["codi_emp"] for r in linhas if r["cgce_emp"] == payload["cnpjCompleto"]), None)
+    doc.update(status="PRONTO", erro=None, validacao=[], payload=payload, cnpj=payload["cnpjCompleto"],
+               codi_emp=codi_emp)
+    return doc
+
+
+def sincronizar(pa: int) -> Dict[str, int]:
+    """Um ciclo completo para o PA; devolve as contagens do ciclo."""
+    t0 = time.perf_counter()
+    por_raiz: Dict[str, List[Dict[str, Any]]] = {}
+    for r in buscar_simples_pa(pa):
+        linha = _linha_mongo(r)
+        por_raiz.setdefault(str(linha["cgce_emp"])[:8], []).append(linha)
+    folhas = buscar_folhas_pa(pa)
+    anteriores = preparados.hashes_do_pa(pa)
+
+    alterados, conferidos = [], []
+    for raiz, linhas in por_raiz.items():
+        folhas_raiz = folhas.get(raiz, {})
+        h = _hash_linhas(linhas, folhas_raiz)
+        if anteriores.get(raiz) == h:
+            conferidos.append(raiz)
+            continue
+        doc = _montar(raiz, pa, linhas, folhas_raiz)
+        doc["hash_linhas"] = h
+        alterados.append(doc)
+
+    gravados = preparados.gravar_preparados(alterados)
+    # só depois da gravação, e só quem não mudou: se o bulk_write falhar, as
+    # raízes alteradas não ganham mais PREPARADOS_MAX_IDADE_SEG com o payload velho
+    preparados.marcar_conferidos(pa, conferidos)
+    removidos = preparados.remover_ausentes(pa, por_raiz)
+    contagem = {"raizes": len(por_raiz), "remontados": gravados, "removidos": removidos,
+                "invalidos": sum(d["status"] == "INVALIDO" for d in alterados)}
+    logging.info("Sincronização PA %s: %s em %.1fs", pa, contagem, time.perf_counter() - t0)
+    return contagem
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Sincroniza o Domínio e pré-monta os payloads do PA")
+    ap.add_argument("--pa", type=int, help="padrão: PA aberto (mês anterior), reavaliado a cada ciclo")
+    ap.add_argument("--intervalo", type=int, default=SINCRONIZACAO_INTERVALO_SEG, help="segundos entre ciclos")
+    ap.add_argument("--uma-vez", action="store_true", help="roda um ciclo e sai")
+    args = ap.parse_args()
+
+    preparados.init_preparados()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sinal, lambda *_: _parar.set())
+
+    while not _parar.is_set():
+        try:
+            sincronizar(args.pa or pa_aberto())
+        except Exception:
+            logging.exception("Falha no ciclo de sincronização")
+        if args.uma_vez:
+            return
+        _parar.wait(args.intervalo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Spool em disco dos PDFs devolvidos pelo SERPRO.
+
+Um lote de centenas de CNPJs carregava o PDF de cada declaração na
+memória até a resposta HTTP terminar (e em várias cópias). Agora o
+base64 é decodificado uma vez na chegada (resposta_serpro.GuiaPdf) e,
+acima de PDF_SPOOL_MIN_BYTES, os bytes vão para um arquivo em
+PDF_SPOOL_DIR; o resultado do pipeline leva só a referência, e o PDF
+volta à memória apenas ao gravar no Mongo ou ao serializar o item.
+
+Cada arquivo é apagado quando o GuiaPdf que o referencia é coletado.
+Arquivos de processos que caíram ficam para `limpar_orfaos` (chamado na
+subida da API), que apaga os mais velhos que PDF_SPOOL_MAX_IDADE_SEG.
+"""
+from __future__ import annotations
+import os
+import time
+import uuid
+import logging
+import tempfile
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PDF_SPOOL_DIR = Path(os.getenv("PDF_SPOOL_DIR") or Path(tempfile.gettempdir()) / "pgdas_pdf")
+# PDFs menores que isso ficam em memória; 0 = sempre em disco
+PDF_SPOOL_MIN_BYTES = int(os.getenv("PDF_SPOOL_MIN_BYTES", "65536"))
+PDF_SPOOL_MAX_IDADE_SEG = int(os.getenv("PDF_SPOOL_MAX_IDADE_SEG", "21600"))
+
+
+def guardar(conteudo: bytes) -> Path:
+    """Grava os bytes num arquivo novo do spool e devolve o caminho."""
+    PDF_SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    caminho = PDF_SPOOL_DIR / f"{os.getpid()}_{uuid.uuid4().hex}.pdf"
+    with open(caminho, "xb") as f:
+        f.write(conteudo)
+    return caminho
+
+
+def ler(caminho: Path) -> bytes:
+    return caminho.read_bytes()
+
+
+def descartar(caminho: Path) -> None:
+    """Remove o arquivo; usado como finalizador, então nunca levanta."""
+    try:
+        caminho.unlink(missing_ok=True)
+    except OSError:
+        logging.warning("Não foi possível remover %s do spool de PDFs", caminho)
+
+
+def limpar_orfaos(max_idade_seg: int = PDF_SPOOL_MAX_IDADE_SEG) -> int:
+    """Apaga arquivos do spool mais velhos que `max_idade_seg`; devolve quantos."""
+    if not PDF_SPOOL_DIR.is_dir():
+        return 0
+    corte = time.time() - max_idade_seg
+    removidos = 0
+    for arquivo in PDF_SPOOL_DIR.glob("*.pdf"):
+        try:
+            if arquivo.stat().st_mtime < corte:
+                arquivo.unlink()
+                removidos += 1
+        except OSError:
+            continue
+    return removidos
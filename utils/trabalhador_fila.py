@@ -0,0 +1,160 @@
+"""
+Worker da fila de tarefas (database/fila_tarefas.py).
+
+    python -m utils.trabalhador_fila [--threads 4] [--lease 300] [--ocioso 2] [--ate-esvaziar]
+    python -m utils.trabalhador_fila --status
+
+Rode quantos processos/máquinas quiser apontando para o mesmo Mongo:
+cada thread reivindica uma tarefa por vez, renova o lease enquanto o
+pipeline roda e grava o resultado de volta na tarefa. Lease perdido
+(outro worker reassumiu) impede o envio ao SERPRO; numa nova tentativa,
+declaração já gravada não é reenviada e pedido 202 em aberto é retomado.
+SIGTERM/SIGINT param de reivindicar e deixam as tarefas em andamento
+terminarem.
+"""
+from __future__ import annotations
+import os
+import signal
+import socket
+import logging
+import argparse
+import threading
+from typing import Any, Dict
+from database import fila_tarefas as fila
+from database.db_schema import declarada_desde
+from utils.pipeline import (
+    processar_pgdas, processar_das_lote, referenciar_pdf, materializar_pdfs, sob_posse, PossePerdida,
+)
+from utils.modo_execucao import em_modo
+from utils.escalonador_serpro import submissor
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(threadName)s %(message)s")
+
+
+def executar_tarefa(tarefa: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Roda o pipeline da tarefa; o PDF fica no Mongo e o resultado leva só a
+    URL. No escalonador SERPRO a tarefa conta para o escritório ou o lote.
+    """
+    cnpj, pa = tarefa["cnpj"], tarefa["pa"]
+    with submissor(tarefa["lote"], escritorio=tarefa.get("escritorio")):
+        if tarefa["fluxo"] == "pgdas":
+            tipo = tarefa["tipoDeclaracao"]
+            # tarefas anteriores ao campo `modo` rodam no modo padrão do worker
+            with em_modo(tarefa.get("modo")) as modo:
+                if tarefa.get("tentativas", 1) > 1 and declarada_desde(cnpj, pa, tipo, tarefa["criado_em"]):
+                    # a tentativa anterior já declarou (o worker caiu antes de concluir
+                    # a tarefa): não reenvia. Pedido 202 em aberto o pipeline retoma.
+                    return {"cnpj": cnpj, "status": "SUCESSO", "reconciliado": True,
+                            "pdfUrl": f"/pdf/pgdas/{cnpj}/{pa}/{tipo}?modo={modo}"}
+                resultado = processar_pgdas(cnpj, pa, tipo)
+            # JA_TRANSMITIDA não tem PDF no Mongo: o dele vai na própria tarefa
+            return materializar_pdfs(referenciar_pdf(resultado, "pdfBase64",
+                                                     f"/pdf/pgdas/{cnpj}/{pa}/{tipo}?modo={modo}"))
+
+        # mesmo cache de DAS já emitidos da rota /gerar-das
+        return next(processar_das_lote([cnpj], pa, tarefa.get("dataConsolidacao"),
+                                       forcar=tarefa.get("forcar", False), incluir_pdf=False))
+
+
+class _Lease:
+    """
+    Renova o lease da tarefa a cada 1/3 do prazo enquanto o bloco roda.
+    Perdido o lease, `confirmar` passa a dar False e o pipeline não envia
+    (pipeline.sob_posse): outro worker já pode ter reassumido a tarefa.
+    """
+
+    def __init__(self, tarefa_id: Any, worker: str, lease_seg: int) -> None:
+        self.args = (tarefa_id, worker, lease_seg)
+        self.perdido = threading.Event()
+        self._fim = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self) -> None:
+        while not self._fim.wait(self.args[2] / 3):
+            if not self.confirmar():
+                logging.warning("Lease da tarefa %s perdido", self.args[0])
+                return
+
+    def confirmar(self) -> bool:
+        """Renova agora; False (para sempre) se a tarefa já não é deste worker."""
+        if not self.perdido.is_set() and not fila.renovar_lease(*self.args):
+            self.perdido.set()
+        return not self.perdido.is_set()
+
+    def __enter__(self) -> "_Lease":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._fim.set()
+        self._thread.join()
+
+
+class Trabalhador:
+    def __init__(self, threads: int = 4, lease_seg: int = fila.FILA_LEASE_SEG, ocioso_seg: float = 2.0,
+                 ate_esvaziar: bool = False) -> None:
+        self.threads = threads
+        self.lease_seg = lease_seg
+        self.ocioso_seg = ocioso_seg
+        self.ate_esvaziar = ate_esvaziar
+        self.parar = threading.Event()
+        self.prefixo = f"{socket.gethostname()}:{os.getpid()}"
+
+    def _loop(self, indice: int) -> None:
+        worker = f"{self.prefixo}:{indice}"
+        while not self.parar.is_set():
+            if indice == 0:
+                fila.encerrar_esgotadas()
+            tarefa = fila.reivindicar(worker, self.lease_seg)
+            if tarefa is None:
+                if self.ate_esvaziar:
+                    return
+                self.parar.wait(self.ocioso_seg)
+                continue
+
+            try:
+                with _Lease(tarefa["_id"], worker, self.lease_seg) as lease, sob_posse(lease.confirmar):
+                    resultado = executar_tarefa(tarefa)
+                if not fila.concluir(tarefa["_id"], worker, resultado):
+                    logging.warning("Tarefa %s foi reassumida por outro worker", tarefa["_id"])
+            except PossePerdida:
+                logging.warning("Tarefa %s reassumida por outro worker antes do envio; nada enviado",
+                                tarefa["_id"])
+            except Exception as e:
+                logging.exception("Erro na tarefa %s (%s)", tarefa["_id"], tarefa["cnpj"])
+                fila.falhar(tarefa["_id"], worker, str(e), tarefa["tentativas"])
+
+    def rodar(self) -> None:
+        threads = [threading.Thread(target=self._loop, args=(i,), name=f"fila-{i}")
+                   for i in range(self.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Worker da fila de tarefas PGDAS/DAS")
+    ap.add_argument("--threads", type=int, default=int(os.getenv("FILA_THREADS", "4")))
+    ap.add_argument("--lease", type=int, default=fila.FILA_LEASE_SEG, help="segundos de posse de cada tarefa")
+    ap.add_argument("--ocioso", type=float, default=2.0, help="espera (s) quando a fila está vazia")
+    ap.add_argument("--ate-esvaziar", action="store_true", help="sai quando não houver mais tarefas")
+    ap.add_argument("--status", action="store_true", help="mostra tarefas por status e sai")
+    args = ap.parse_args()
+
+    fila.init_fila()
+    if args.status:
+        for status, n in sorted(fila.profundidade().items()):
+            print(f"{status:<11} {n}")
+        return
+
+    trabalhador = Trabalhador(args.threads, args.lease, args.ocioso, args.ate_esvaziar)
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sinal, lambda *_: trabalhador.parar.set())
+    logging.info("Worker %s com %s threads", trabalhador.prefixo, args.threads)
+    trabalhador.rodar()
+
+
+if __name__ == "__main__":
+    main()
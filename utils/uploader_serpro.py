@@ -1,10 +1,16 @@
 import os
-import json
 import time
 import logging
+import threading
 import requests
-from typing import Any, Dict, Tuple
-from auth.token_auth import TokenAutenticacao
+from requests.adapters import HTTPAdapter
+from typing import Any, Callable, Dict, Optional, Tuple
+from auth.token_auth import obter_autenticador
+from utils.serializacao import dumps, dumps_str, loads
+from utils.resposta_serpro import RespostaPgdas
+from utils.metricas import medir, SERPRO_SEGUNDOS, SERPRO_STATUS, SERPRO_RETENTATIVAS
+from utils.rastreamento import definir_atributo
+from utils.escalonador_serpro import obter_escalonador
 
 
 class SerproClient:
@@ -32,7 +38,12 @@ class SerproClient:
         self.tipo_doc = int(os.getenv("TIPO_DOC", "2"))
         # tempo padrão de leitura
         self._default_to = int(os.getenv("SERPRO_READ_TIMEOUT", "60"))
-        self._auth = TokenAutenticacao()
+        self._auth = obter_autenticador()
+        # conexões keep-alive reaproveitadas por Declarar, Emitir e Monitorar
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_maxsize=int(os.getenv("SERPRO_POOL", "32")))
+        self.sessao.mount("https://", adaptador)
+        self.sessao.mount("http://", adaptador)
 
     def _build_headers(self, service: str) -> Dict[str, str]:
         access, jwt = self._auth.obter_token()
@@ -52,24 +63,30 @@ class SerproClient:
         """
         return self._build_headers(service)
 
-    def _build_envelope(self, service: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    def _build_envelope(self, service: str, data: Dict[str, Any],
+                        dados_json: str | bytes | None = None) -> Dict[str, Any]:
         """
         Monta o corpo da requisição conforme serviço:
           - pgdas: data deve ser o payload fiscal retornado por json_builder.montar_json()
           - das:   data deve ter as chaves 'cnpj', 'pa' e opcional 'dataConsolidacao'
+        `dados_json` (pgdas) é o payload já serializado, reaproveitado em
+        vez de serializar `data` de novo.
         """
         parte = {"numero": self.cnpj_cont, "tipo": self.tipo_doc}
         svc = self._SERVICES[service]
 
         if service == "pgdas":
             # já é um dict pronto para ser serializado
-            dados_json = json.dumps(data, ensure_ascii=False)
+            if dados_json is None:
+                dados_json = dumps_str(data)
+            elif isinstance(dados_json, bytes):
+                dados_json = dados_json.decode("utf-8")
             numero_contribuinte = data["cnpjCompleto"]
         else:  # das
             dados_internos = {"periodoApuracao": str(data["pa"]).zfill(6)}
             if data.get("dataConsolidacao"):
                 dados_internos["dataConsolidacao"] = data["dataConsolidacao"]
-            dados_json = json.dumps(dados_internos, ensure_ascii=False)
+            dados_json = dumps_str(dados_internos)
             numero_contribuinte = data["cnpj"]
 
         return {
@@ -89,10 +106,13 @@ class SerproClient:
         service: str,
         data: Dict[str, Any],
         timeout: Tuple[int, int] = None,
-        retries: int = 2
+        retries: int = 2,
+        dados_json: str | bytes | None = None
     ) -> Dict[str, Any]:
         """
         Faz POST para /<path> passando envelope + headers adequados.
+        `dados_json`: payload pgdas já serializado (ver `_build_envelope`).
+        Cada tentativa espera a vez no escalonador (utils/escalonador_serpro.py).
         Retorna {'status': HTTP, 'body': json|texto}.
         """
         if service not in self._SERVICES:
@@ -100,39 +120,90 @@ class SerproClient:
 
         url = f"{self.url_base}/{self._SERVICES[service]['path']}"
         headers = self._build_headers(service)
-        envelope = self._build_envelope(service, data)
-        payload = json.dumps(envelope, ensure_ascii=False).encode()
+        envelope = self._build_envelope(service, data, dados_json)
+        payload = dumps(envelope)
 
         if timeout is None:
             timeout = (10, self._default_to)
 
-        last_resp = {"status": None, "body": None}
-        for attempt in range(retries + 1):
-            try:
-                r = requests.post(url, headers=headers, data=payload, timeout=timeout)
+        with medir(f"serpro_{service}"):
+            last_resp = {"status": None, "body": None}
+            for attempt in range(retries + 1):
+                if attempt:
+                    SERPRO_RETENTATIVAS.inc(servico=service)
                 try:
-                    body = r.json()
-                except ValueError:
-                    body = r.text
-                status = r.status_code
-                resp = {"status": status, "body": body}
-
-                # 2xx → sucesso imediato; 4xx → falha sem retry
-                if 200 <= status < 300 or 400 <= status < 500:
-                    return resp
-
-                last_resp = resp
-                logging.warning(
-                    "SERPRO %s [%s] tent %s/%s → %s",
-                    service, status, attempt + 1, retries + 1, body
-                )
-            except requests.RequestException as e:
-                last_resp = {"status": None, "body": str(e)}
-                logging.error(
-                    "Erro rede %s tent %s/%s",
-                    e, attempt + 1, retries + 1
-                )
-
-            time.sleep(2 * (attempt + 1))
-
-        raise RuntimeError("Falha persistente ao chamar SERPRO", last_resp)
+                    with obter_escalonador().vaga(), \
+                            medir(f"serpro_{service}_tentativa", SERPRO_SEGUNDOS, servico=service):
+                        definir_atributo("tentativa", attempt + 1)
+                        r = self.sessao.post(url, headers=headers, data=payload, timeout=timeout)
+                        try:
+                            body = loads(r.content)
+                        except ValueError:
+                            body = r.text
+                        status = r.status_code
+                        definir_atributo("http.status_code", status)
+                        if isinstance(body, dict) and body.get("responseId"):
+                            definir_atributo("serpro.responseId", body["responseId"])
+                    SERPRO_STATUS.inc(servico=service, status=str(status))
+                    resp = {"status": status, "body": body}
+
+                    # 2xx → sucesso imediato; 4xx → falha sem retry
+                    if 200 <= status < 300 or 400 <= status < 500:
+                        return resp
+
+                    last_resp = resp
+                    logging.warning(
+                        "SERPRO %s [%s] tent %s/%s → %s",
+                        service, status, attempt + 1, retries + 1, body
+                    )
+                except requests.RequestException as e:
+                    SERPRO_STATUS.inc(servico=service, status="erro_rede")
+                    last_resp = {"status": None, "body": str(e)}
+                    logging.error(
+                        "Erro rede %s tent %s/%s",
+                        e, attempt + 1, retries + 1
+                    )
+
+                time.sleep(2 * (attempt + 1))
+
+            raise RuntimeError("Falha persistente ao chamar SERPRO", last_resp)
+
+    def declarar(self, payload: Dict[str, Any], dados_json: str | bytes | None = None,
+                 ao_aguardar: Optional[Callable[[str], None]] = None) -> RespostaPgdas:
+        """
+        Envia o PGDAS-D e, se o SERPRO responder 202, acompanha o pedido
+        em /Monitorar. Devolve a resposta já interpretada (dados parseados
+        uma única vez). `ao_aguardar(responseId)` é chamado antes do
+        primeiro /Monitorar, para quem precisa retomar o pedido depois.
+        """
+        # import tardio: monitorar_serpro importa este módulo
+        from utils.monitorar_serpro import monitorar_pedido
+
+        resp = self.enviar("pgdas", payload, dados_json=dados_json)
+        if resp.get("status") == 202:
+            response_id = resp["body"]["responseId"]
+            if ao_aguardar is not None:
+                ao_aguardar(response_id)
+            resp = monitorar_pedido(response_id)
+        return RespostaPgdas.de_http(resp)
+
+
+# ---------------------------------------------------------------------
+# instância compartilhada
+# ---------------------------------------------------------------------
+_cliente: Optional[SerproClient] = None
+_cliente_lock = threading.Lock()
+
+
+def obter_cliente() -> SerproClient:
+    """
+    SerproClient único do processo, criado no primeiro uso: importar
+    pipeline/gerar_das/monitorar não lê certificado nem exige as
+    variáveis do SERPRO.
+    """
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                _cliente = SerproClient()
+    return _cliente
@@ -0,0 +1,244 @@
+"""
+Validação do PGDAS-D antes de qualquer chamada ao SERPRO.
+
+    python -m utils.validacao --pa 202505 [--arquivo cnpjs.txt] [--threads 8] [--todos]
+
+Dado ruim do Domínio só aparecia no meio do lote, como exceção
+(`KeyError` em SEGMENT_RULES) ou 4xx do SERPRO depois da ida e volta.
+Aqui as linhas e o payload montado passam por regras locais:
+    SEGMENTO_DESCONHECIDO  (anexo, secao, tabela) fora de SEGMENT_RULES
+    BASE_NEGATIVA          basen < 0
+    FORA_DO_PA             data_sim de outro mês
+    MONTAGEM               montar_json falhou
+    ESQUEMA                campo obrigatório ausente ou de tipo errado
+    SEM_MATRIZ             cnpjCompleto não é a ordem 0001
+    TOTAL_ATIVIDADE        valorAtividade ≠ soma das receitasAtividade
+    TOTAL_PA               receita MI + MX ≠ soma das atividades
+    FOLHAS_AUSENTES        anexo 5 / fator R sem folhasSalario
+    FOLHAS_INCOMPLETAS     folhasSalario sem os 12 meses anteriores ao PA
+
+`validar_pa` confere o PA inteiro (duas consultas ao Domínio, montagem
+em paralelo) e devolve um relatório por CNPJ: VALIDO, INVALIDO (com
+`erros`) ou SEM_DADOS. O pipeline usa `montar_validado` para não
+transmitir payload inválido, e o sincronizador grava INVALIDO em vez
+de PRONTO.
+"""
+from __future__ import annotations
+import os
+import re
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from dicionario_id.segment_rules import SEGMENT_RULES
+from database.cache_empresas import cnpj_matriz, e_matriz
+from database.dominio_db import buscar_simples_pa, buscar_folhas_pa
+from utils.json_builder import montar_json, folhas_de_valores, precisa_folha
+from utils.metricas import VALIDACAO_FALHAS, medir
+from utils.serializacao import dumps_str
+
+VALIDACAO_THREADS = int(os.getenv("VALIDACAO_THREADS", "8"))
+# 0 desliga a validação antes do envio em processar_pgdas
+VALIDACAO_PRE_ENVIO = os.getenv("VALIDACAO_PRE_ENVIO", "1") == "1"
+
+_IDS_ATIVIDADE = {cfg["id"] for cfg in SEGMENT_RULES.values()}
+_CNPJ = re.compile(r"^\d{14}$")
+
+
+def _erro(regra: str, mensagem: str) -> Dict[str, str]:
+    return {"regra": regra, "mensagem": mensagem}
+
+
+def _numero(valor: Any) -> bool:
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+def _meses_anteriores(pa: int, n: int = 12) -> List[int]:
+    ano, mes = divmod(pa, 100)
+    meses = []
+    for _ in range(n):
+        ano, mes = (ano, mes - 1) if mes > 1 else (ano - 1, 12)
+        meses.append(ano * 100 + mes)
+    return sorted(meses)
+
+
+# ---------------------------------------------------------------------
+# regras
+# ---------------------------------------------------------------------
+def validar_linhas(rows: List[Dict[str, Any]], pa: Optional[int] = None) -> List[Dict[str, str]]:
+    """Regras sobre as linhas do Domínio (antes de montar o payload)."""
+    erros = []
+    for r in rows:
+        segmento = (r["anexo"], r["secao"], r["tabela"])
+        onde = f"{r['cgce_emp']} {segmento}"
+        if segmento != (0, 0, 0) and segmento not in SEGMENT_RULES:
+            erros.append(_erro("SEGMENTO_DESCONHECIDO", f"{onde}: segmento sem regra em SEGMENT_RULES"))
+        if float(r["basen"] or 0) < 0:
+            erros.append(_erro("BASE_NEGATIVA", f"{onde}: basen {float(r['basen']):.2f}"))
+        if pa is not None:
+            data = str(r["data_sim"])[:10]         # date, datetime ou ISO
+            if int(data[:7].replace("-", "")) != pa:
+                erros.append(_erro("FORA_DO_PA", f"{onde}: data_sim {data} fora do PA {pa}"))
+    return erros
+
+
+def validar_payload(payload: Dict[str, Any], rows: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, str]]:
+    """
+    Esquema, matriz e totais do payload montado; com as `rows`, também
+    a presença das folhas quando o anexo/atividade exige.
+    """
+    erros = []
+    cnpj, pa = payload.get("cnpjCompleto"), payload.get("pa")
+    declaracao = payload.get("declaracao")
+    if not isinstance(cnpj, str) or not _CNPJ.match(cnpj):
+        erros.append(_erro("ESQUEMA", f"cnpjCompleto inválido: {cnpj!r}"))
+    if not isinstance(pa, int) or not (1 <= pa % 100 <= 12) or not 200001 <= pa <= 299912:
+        erros.append(_erro("ESQUEMA", f"pa inválido: {pa!r}"))
+    for campo in ("indicadorTransmissao", "indicadorComparacao"):
+        if not isinstance(payload.get(campo), bool):
+            erros.append(_erro("ESQUEMA", f"{campo} deve ser booleano"))
+    if not isinstance(declaracao, dict):
+        erros.append(_erro("ESQUEMA", "declaracao ausente"))
+        return erros
+    if erros:
+        return erros
+
+    if not e_matriz(cnpj):
+        erros.append(_erro("SEM_MATRIZ", f"{cnpj} não é matriz (ordem 0001) e a raiz não tem matriz no cadastro"))
+    if declaracao.get("tipoDeclaracao") not in (1, 2):
+        erros.append(_erro("ESQUEMA", f"tipoDeclaracao inválido: {declaracao.get('tipoDeclaracao')!r}"))
+
+    estabelecimentos = declaracao.get("estabelecimentos")
+    if not isinstance(estabelecimentos, list) or not estabelecimentos:
+        erros.append(_erro("ESQUEMA", "declaracao sem estabelecimentos"))
+        estabelecimentos = []
+
+    soma = 0.0
+    for est in estabelecimentos:
+        cnpj_est = est.get("cnpjCompleto")
+        if not isinstance(cnpj_est, str) or not _CNPJ.match(cnpj_est) or cnpj_est[:8] != cnpj[:8]:
+            erros.append(_erro("ESQUEMA", f"estabelecimento {cnpj_est!r} fora da raiz {cnpj[:8]}"))
+        for atv in est.get("atividades", []):
+            ida, valor = atv.get("idAtividade"), atv.get("valorAtividade")
+            receitas = atv.get("receitasAtividade") or []
+            onde = f"{cnpj_est} atividade {ida}"
+            if ida not in _IDS_ATIVIDADE:
+                erros.append(_erro("ESQUEMA", f"{onde}: idAtividade desconhecido"))
+            if not _numero(valor) or valor <= 0 or not receitas:
+                erros.append(_erro("ESQUEMA", f"{onde}: valorAtividade/receitasAtividade inválidos"))
+                continue
+            if any(not _numero(rec.get("valor")) or rec["valor"] <= 0 for rec in receitas):
+                erros.append(_erro("ESQUEMA", f"{onde}: receita sem valor positivo"))
+                continue
+            soma_receitas = sum(rec["valor"] for rec in receitas)
+            if abs(round(soma_receitas, 2) - round(valor, 2)) > 0.01:
+                erros.append(_erro("TOTAL_ATIVIDADE",
+                                   f"{onde}: valorAtividade {valor:.2f} ≠ receitas {soma_receitas:.2f}"))
+            soma += valor
+
+    mi = declaracao.get("receitaPaCompetenciaInterno", 0.0)
+    mx = declaracao.get("receitaPaCompetenciaExterno", 0.0)
+    if not _numero(mi) or not _numero(mx) or mi < 0 or mx < 0:
+        erros.append(_erro("ESQUEMA", f"receitaPaCompetencia inválida: MI {mi!r}, MX {mx!r}"))
+    elif abs(round(mi + mx, 2) - round(soma, 2)) > 0.01:
+        erros.append(_erro("TOTAL_PA", f"MI {mi:.2f} + MX {mx:.2f} ≠ soma das atividades {soma:.2f}"))
+
+    folhas = declaracao.get("folhasSalario")
+    if folhas:
+        meses = [f.get("pa") for f in folhas]
+        if meses != _meses_anteriores(pa) or any(not _numero(f.get("valor")) or f["valor"] < 0 for f in folhas):
+            erros.append(_erro("FOLHAS_INCOMPLETAS", f"folhasSalario não cobre os 12 meses anteriores a {pa}"))
+    elif rows is not None and precisa_folha(rows):
+        erros.append(_erro("FOLHAS_AUSENTES", "anexo 5 ou atividade com fator R sem folha de salários"))
+    return erros
+
+
+@medir("validar")
+def montar_validado(rows: List[Dict[str, Any]], tipo: int = 1, *, pa: Optional[int] = None,
+                    folhas: Optional[list] = None) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, str]]]:
+    """
+    Valida as linhas, monta o payload (como `montar_json`) e valida o
+    resultado. Devolve (payload, erros); payload é None se nem deu para
+    montar.
+    """
+    erros = validar_linhas(rows, pa)
+    if any(e["regra"] == "SEGMENTO_DESCONHECIDO" for e in erros):
+        payload = None                  # montar_json levantaria KeyError
+    else:
+        try:
+            payload = montar_json(rows, tipo, folhas=folhas)
+        except Exception as e:
+            logging.exception("Erro ao montar payload para validação")
+            payload = None
+            erros.append(_erro("MONTAGEM", f"{type(e).__name__}: {e}"))
+    if payload is not None:
+        erros += validar_payload(payload, rows)
+    for e in erros:
+        VALIDACAO_FALHAS.inc(regra=e["regra"])
+    return payload, erros
+
+
+# ---------------------------------------------------------------------
+# PA inteiro
+# ---------------------------------------------------------------------
+def validar_pa(pa: int, cnpjs: Optional[Iterable[str]] = None, *, todos: bool = True,
+               threads: int = VALIDACAO_THREADS) -> Iterator[Dict[str, Any]]:
+    """
+    Relatório por CNPJ do PA, sem chamar o SERPRO. Sem `cnpjs`, confere
+    todas as raízes com movimento; com a lista, uma entrada por CNPJ
+    (SEM_DADOS se a raiz não tem movimento). Sem `todos`, só os
+    INVALIDO e SEM_DADOS.
+    """
+    por_raiz: Dict[str, List[Dict[str, Any]]] = {}
+    for r in buscar_simples_pa(pa):
+        por_raiz.setdefault(str(r["cgce_emp"])[:8], []).append(r)
+    folhas = buscar_folhas_pa(pa)
+
+    if cnpjs is None:
+        alvos = [(None, raiz) for raiz in sorted(por_raiz)]
+    else:
+        alvos = [(c, re.sub(r"\D", "", c)[:8]) for c in dict.fromkeys(cnpjs)]
+
+    def validar(alvo: Tuple[Optional[str], str]) -> Dict[str, Any]:
+        cnpj, raiz = alvo
+        rows = por_raiz.get(raiz)
+        if not rows:
+            return {"cnpj": cnpj, "raiz": raiz, "pa": pa, "situacao": "SEM_DADOS"}
+        payload, erros = montar_validado(rows, 1, pa=pa, folhas=folhas_de_valores(folhas.get(raiz, {}), pa))
+        if cnpj is None:
+            cnpj = (payload or {}).get("cnpjCompleto") or cnpj_matriz(raiz) or rows[0]["cgce_emp"]
+        return {"cnpj": cnpj, "raiz": raiz, "pa": pa,
+                "situacao": "INVALIDO" if erros else "VALIDO", "erros": erros}
+
+    with ThreadPoolExecutor(max_workers=max(threads, 1), thread_name_prefix="validacao") as pool:
+        for item in pool.map(validar, alvos):
+            if todos or item["situacao"] != "VALIDO":
+                yield item
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Valida os payloads PGDAS-D do PA sem transmitir")
+    ap.add_argument("--pa", type=int, required=True)
+    ap.add_argument("--arquivo", help="um CNPJ por linha (padrão: todas as raízes com movimento)")
+    ap.add_argument("--threads", type=int, default=VALIDACAO_THREADS)
+    ap.add_argument("--todos", action="store_true", help="lista também os VALIDO")
+    args = ap.parse_args()
+
+    cnpjs = None
+    if args.arquivo:
+        from utils.fechamento_mensal import ler_arquivo
+        cnpjs = ler_arquivo(args.arquivo)
+
+    contagem: Dict[str, int] = {}
+    for item in validar_pa(args.pa, cnpjs, todos=True, threads=args.threads):
+        contagem[item["situacao"]] = contagem.get(item["situacao"], 0) + 1
+        if args.todos or item["situacao"] != "VALIDO":
+            print(dumps_str(item))
+    print(f"# PA {args.pa}: {contagem}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+Entrada WSGI de produção:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Com `preload_app` este módulo é importado uma vez no processo mestre,
+então o que é caro e só de leitura fica pronto antes do fork e é
+compartilhado (copy-on-write) por todos os workers:
+  • certificado PFX lido/convertido e o autenticador SERPRO (main.tok);
+  • SEGMENT_RULES e o restante das tabelas de módulo;
+  • opcionalmente, o cadastro geempre (WEB_PRECARREGAR_CADASTRO=1).
+Conexões (MongoClient, sessões HTTP) são criadas por worker, no
+primeiro uso depois do fork.
+"""
+import os
+from database.cache_empresas import recarregar_cache
+from main import app          # main já chama load_dotenv()
+
+if os.getenv("WEB_PRECARREGAR_CADASTRO", "0") == "1":
+    recarregar_cache(forcar=False)
+
+__all__ = ["app"]